@@ -6,18 +6,169 @@ This application provides a REST API for managing hierarchical todo lists.
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import select, insert, update, delete, inspect, literal, func, case, or_, bindparam
+from sqlalchemy.orm import aliased, contains_eager
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.orm.attributes import set_committed_value
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import jwt
 import os
+import threading
+import time
+import uuid
+
+from metrics import Metrics
+from querybudget import QueryBudget, query_budget
+from profiler import RequestProfiler
+from slowquery import SlowQueryLog
+from tracing import Tracer
+from treecache import TreeCache
+from treeindex import TreeIndexes
+from ownership import OwnedListCache
+from ratelimit import RateLimiter, LoadShedder, retry_after_header
+from jobs import JobRunner, Sweeper
+from dbrouting import ReadRouter, RoutingSession, configure_routing
+from sharding import ShardRouter, configure_sharding
+from groupcommit import GroupCommitter, grouped
+from revocation import TokenRevocations
+from treeserial import RawJSON, TreeJSONProvider, nest
 
 app = Flask(__name__)
+# Trees of any depth: jsonify falls back to an iterative encoder (treeserial.py)
+app.json = TreeJSONProvider(app)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///todo_app.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///todo_app.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Read/write routing: GET requests read through a separate read-only pool
+# (WAL mode), writes go through a small writer pool. READ_DATABASE_URL
+# defaults to the main database opened with mode=ro.
+app.config['DB_ROUTING_ENABLED'] = os.environ.get('DB_ROUTING_ENABLED') == '1'
+app.config['DB_WRITE_POOL_SIZE'] = int(os.environ.get('DB_WRITE_POOL_SIZE', 2))
+app.config['DB_READ_POOL_SIZE'] = int(os.environ.get('DB_READ_POOL_SIZE', 10))
+app.config['DB_READ_YOUR_WRITES_SECONDS'] = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 2))
+# Compiled SQL is cached per engine and reused by every request issuing a
+# statement of the same shape (0 disables the cache)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'query_cache_size': int(os.environ.get('DB_QUERY_CACHE_SIZE', 500))
+}
+configure_routing(app, os.environ.get('READ_DATABASE_URL'))
+# Sharding: users' lists and tasks spread over SHARD_COUNT SQLite files
+# (shard 0 is the main database); see sharding.py
+app.config['SHARD_COUNT'] = int(os.environ.get('SHARD_COUNT', 1))
+app.config['SHARD_DIRECTORY_CACHE_SIZE'] = int(os.environ.get('SHARD_DIRECTORY_CACHE_SIZE', 100000))
+configure_sharding(app)
+
+# Admission control: per-user token buckets as (rate per second, burst), and
+# early load shedding once too many requests are in flight (0 disables).
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED') == '1'
+app.config['RATELIMIT_READ'] = (
+    float(os.environ.get('RATELIMIT_READ_RATE', 20)),
+    int(os.environ.get('RATELIMIT_READ_BURST', 40))
+)
+app.config['RATELIMIT_WRITE'] = (
+    float(os.environ.get('RATELIMIT_WRITE_RATE', 5)),
+    int(os.environ.get('RATELIMIT_WRITE_BURST', 20))
+)
+app.config['RATELIMIT_ENDPOINTS'] = {
+    # Full tree fetches are the most expensive read
+    'get_lists': (2.0, 10),
+}
+app.config['SHED_MAX_IN_FLIGHT'] = int(os.environ.get('SHED_MAX_IN_FLIGHT', 0))
+app.config['SHED_LATENCY_MS'] = int(os.environ.get('SHED_LATENCY_MS', 0))
+# Prometheus metrics at /metrics, off by default; with METRICS_TOKEN set,
+# scrapes must send `Authorization: Bearer <METRICS_TOKEN>`
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED') == '1'
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Per-route SQL query budgets; strict mode turns overruns into 500s (for tests)
+app.config['QUERY_BUDGET_ENABLED'] = os.environ.get('QUERY_BUDGET_ENABLED') == '1'
+app.config['QUERY_BUDGET_STRICT'] = os.environ.get('QUERY_BUDGET_STRICT') == '1'
+# Per-request cProfile profiles: requests sent with `X-Profile: PROFILE_TOKEN`,
+# plus a PROFILE_SAMPLE_RATE fraction of all requests, are saved to
+# PROFILE_DIR (default instance/profiles, newest PROFILE_KEEP kept)
+app.config['PROFILE_TOKEN'] = os.environ.get('PROFILE_TOKEN')
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
+app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', 100))
+# Slow-query log: statements taking SLOW_QUERY_MS or more (0 disables) are
+# written as JSON lines, with EXPLAIN QUERY PLAN for each new statement shape,
+# to SLOW_QUERY_LOG (default instance/slow_queries.log), rotated by size
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 0))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG')
+app.config['SLOW_QUERY_LOG_BYTES'] = int(os.environ.get('SLOW_QUERY_LOG_BYTES', 10 * 1024 * 1024))
+app.config['SLOW_QUERY_LOG_BACKUPS'] = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', 5))
+# Request tracing: a TRACE_SAMPLE_RATE fraction of requests (0 disables) is
+# traced as timed spans and appended as JSON lines to TRACE_EXPORT_PATH
+# (default instance/traces.jsonl); trace ids are taken from TRACE_HEADER
+app.config['TRACE_SAMPLE_RATE'] = float(os.environ.get('TRACE_SAMPLE_RATE', 0))
+app.config['TRACE_HEADER'] = os.environ.get('TRACE_HEADER', 'X-Trace-Id')
+app.config['TRACE_EXPORT_PATH'] = os.environ.get('TRACE_EXPORT_PATH')
+# Serialized list-tree cache; in-process, so only safe with a single worker
+app.config['TREE_CACHE_ENABLED'] = os.environ.get('TREE_CACHE_ENABLED') == '1'
+app.config['TREE_CACHE_MAX_BYTES'] = int(os.environ.get('TREE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+app.config['TREE_CACHE_MAX_STAMPS'] = int(os.environ.get('TREE_CACHE_MAX_STAMPS', 65536))
+# Array-backed structure of hot lists for moves, reorders and subtree reads;
+# in-process and write-through, so only safe with a single worker
+app.config['TREE_INDEX_ENABLED'] = os.environ.get('TREE_INDEX_ENABLED') == '1'
+app.config['TREE_INDEX_MAX_BYTES'] = int(os.environ.get('TREE_INDEX_MAX_BYTES', 32 * 1024 * 1024))
+app.config['TREE_INDEX_MAX_STAMPS'] = int(os.environ.get('TREE_INDEX_MAX_STAMPS', 65536))
+# Owned list ids per user, reused by ownership checks for OWNERSHIP_CACHE_TTL
+# seconds (0 disables); other processes see deleted lists after the TTL
+app.config['OWNERSHIP_CACHE_TTL'] = float(os.environ.get('OWNERSHIP_CACHE_TTL', 30))
+app.config['OWNERSHIP_CACHE_SIZE'] = int(os.environ.get('OWNERSHIP_CACHE_SIZE', 10000))
+# Optimistic concurrency: reject mutations without If-Match / version (428)
+app.config['REQUIRE_IF_MATCH'] = os.environ.get('REQUIRE_IF_MATCH') == '1'
+# Background jobs: worker threads, concurrent jobs per user, rows per batch
+app.config['JOBS_MAX_WORKERS'] = int(os.environ.get('JOBS_MAX_WORKERS', 4))
+app.config['JOBS_PER_USER'] = int(os.environ.get('JOBS_PER_USER', 2))
+app.config['JOBS_BATCH_SIZE'] = int(os.environ.get('JOBS_BATCH_SIZE', 500))
+# Cold archive: completed subtrees older than ARCHIVE_AFTER_DAYS move to
+# archived_tasks. The background sweep handles ARCHIVE_BATCH_SIZE subtrees
+# per transaction and starts a pass every ARCHIVE_SWEEP_INTERVAL seconds.
+app.config['ARCHIVE_ENABLED'] = os.environ.get('ARCHIVE_ENABLED') == '1'
+app.config['ARCHIVE_AFTER_DAYS'] = float(os.environ.get('ARCHIVE_AFTER_DAYS', 30))
+app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', 100))
+app.config['ARCHIVE_SWEEP_INTERVAL'] = float(os.environ.get('ARCHIVE_SWEEP_INTERVAL', 300))
+# Group commit: mutations run on a writer thread that commits everything
+# arriving within GROUP_COMMIT_WINDOW_MS (up to GROUP_COMMIT_MAX_OPS) at once
+app.config['GROUP_COMMIT_ENABLED'] = os.environ.get('GROUP_COMMIT_ENABLED') == '1'
+app.config['GROUP_COMMIT_WINDOW_MS'] = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 2))
+app.config['GROUP_COMMIT_MAX_OPS'] = int(os.environ.get('GROUP_COMMIT_MAX_OPS', 64))
+# Tokens: revocations are mirrored in memory (a Bloom filter bucketed by
+# token expiry) and synced from the database every REVOCATION_SYNC_INTERVAL s
+app.config['TOKEN_LIFETIME'] = timedelta(days=float(os.environ.get('TOKEN_LIFETIME_DAYS', 7)))
+app.config['REVOCATION_FALSE_POSITIVE_RATE'] = float(
+    os.environ.get('REVOCATION_FALSE_POSITIVE_RATE', 0.001)
+)
+app.config['REVOCATION_BUCKET_SECONDS'] = int(os.environ.get('REVOCATION_BUCKET_SECONDS', 3600))
+app.config['REVOCATION_SYNC_INTERVAL'] = float(os.environ.get('REVOCATION_SYNC_INTERVAL', 5))
 
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+db_router = ReadRouter(app, db)
 CORS(app)
+# Metrics first so its timing hooks wrap the admission control hooks too
+metrics = Metrics(app)
+tracer = Tracer(app)
+app.json.dumps = tracer.traced('jsonify')(app.json.dumps)
+limiter = RateLimiter(app)
+shedder = LoadShedder(app)
+query_budgets = QueryBudget(app)
+profiler = RequestProfiler(app)
+slow_queries = SlowQueryLog(app)
+metrics.register_collector(slow_queries.metrics_lines)
+tree_cache = TreeCache(app)
+metrics.register_collector(tree_cache.metrics_lines)
+tree_indexes = TreeIndexes()
+metrics.register_collector(tree_indexes.metrics_lines)
+owned_lists = OwnedListCache(app)
+metrics.register_collector(owned_lists.metrics_lines)
+job_runner = JobRunner()
+metrics.register_collector(job_runner.metrics_lines)
+shard_router = ShardRouter()
+group_commits = GroupCommitter()
+metrics.register_collector(group_commits.metrics_lines)
+revocations = TokenRevocations()
+metrics.register_collector(revocations.metrics_lines)
 
 # ==================== Models ====================
 
@@ -58,17 +209,25 @@ class TodoList(db.Model):
     name = db.Column(db.String(200), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Relationships
     tasks = db.relationship('Task', backref='list', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self, include_tasks=False):
-        """Convert list to dictionary"""
+    # ORM updates compare-and-set on version and raise StaleDataError on conflict
+    __mapper_args__ = {'version_id_col': version}
+    # Ids are never reused; shards rely on this to keep their id ranges apart
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    @tracer.traced('to_dict')
+    def to_dict(self, include_tasks=False, elide_collapsed=False):
+        """Convert list to dictionary (see Task.to_dict for elide_collapsed)"""
         result = {
             'id': self.id,
             'name': self.name,
             'user_id': self.user_id,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at.isoformat(),
+            'version': self.version
         }
         if include_tasks:
             # Only include top-level tasks, ordered by position
@@ -77,10 +236,8 @@ class TodoList(db.Model):
                 if task.parent_id is None
             ]
             top_level_tasks.sort(key=lambda t: t.position)
-            result['tasks'] = [
-                task.to_dict(include_children=True)
-                for task in top_level_tasks
-            ]
+            result['tasks'] = nest(top_level_tasks, Task.children_of, Task.to_dict,
+                                   elide_collapsed=elide_collapsed)
         return result
 
 
@@ -98,6 +255,8 @@ class Task(db.Model):
                           nullable=True)
     position = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Self-referential relationship for hierarchy
     children = db.relationship(
@@ -108,9 +267,25 @@ class Task(db.Model):
         order_by='Task.position'
     )
     
-    def to_dict(self, include_children=False):
-        """Convert task to dictionary"""
-        result = {
+    # Set-based UPDATEs must bump version themselves (version=Task.version + 1)
+    __mapper_args__ = {'version_id_col': version}
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    @tracer.traced('to_dict')
+    def to_dict(self, include_children=False, elide_collapsed=False, depth=None):
+        """Convert task to dictionary.
+
+        With include_children the subtree is nested under `children`, at most
+        `depth` levels deep if given. With elide_collapsed, collapsed tasks
+        are sent without their children. When either option is used every
+        task also carries `child_count` and `has_children`, so the client
+        can tell a leaf from a branch whose children were left out. Trees
+        are built with an explicit stack (see treeserial.nest), so any depth
+        works.
+        """
+        if include_children:
+            return nest([self], Task.children_of, Task.to_dict, elide_collapsed, depth)[0]
+        return {
             'id': self.id,
             'title': self.title,
             'completed': self.completed,
@@ -118,66 +293,740 @@ class Task(db.Model):
             'list_id': self.list_id,
             'parent_id': self.parent_id,
             'position': self.position,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at.isoformat(),
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'version': self.version
         }
-        if include_children:
-            result['children'] = [
-                child.to_dict(include_children=True)
-                for child in self.children
-            ]
+
+    @staticmethod
+    def children_of(task):
+        return task.children
+
+
+class ArchivedTask(db.Model):
+    """ArchivedTask model - completed subtrees moved out of the tasks table.
+
+    Rows get their own ids; parent_id and root_id refer to archive ids, and
+    task_id / task_parent_id keep the original ids.
+    """
+    __tablename__ = 'archived_tasks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    root_id = db.Column(db.Integer, nullable=False, index=True)
+    parent_id = db.Column(db.Integer, nullable=True)
+    task_id = db.Column(db.Integer, nullable=False)
+    task_parent_id = db.Column(db.Integer, nullable=True)
+    list_id = db.Column(db.Integer, db.ForeignKey('todo_lists.id'), nullable=False, index=True)
+    title = db.Column(db.String(500), nullable=False)
+    completed = db.Column(db.Boolean, default=True)
+    collapsed = db.Column(db.Boolean, default=False)
+    position = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    @tracer.traced('to_dict')
+    def to_dict(self, children_by_parent=None):
+        """Convert archived task to dictionary, nesting children if given"""
+        if children_by_parent is not None:
+            return nest([self], lambda row: children_by_parent.get(row.id, []),
+                        ArchivedTask.to_dict)[0]
+        return {
+            'id': self.id,
+            'task_id': self.task_id,
+            'title': self.title,
+            'completed': self.completed,
+            'collapsed': self.collapsed,
+            'list_id': self.list_id,
+            'parent_id': self.parent_id,
+            'position': self.position,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'archived_at': self.archived_at.isoformat()
+        }
+
+
+class Job(db.Model):
+    """Job model - a background operation executed by the job runner"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    progress_done = db.Column(db.Integer, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    attempts = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self, include_result=False):
+        """Convert job to dictionary, with live progress while it runs"""
+        done, total = job_runner.live_progress(self.id) or \
+            (self.progress_done, self.progress_total)
+        result = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': {'done': done, 'total': total},
+            'cancel_requested': self.cancel_requested,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_result:
+            # Embedded as stored: decoding a deep exported tree could fail
+            result['result'] = RawJSON(self.result) if self.result else None
         return result
 
 
+class UserShard(db.Model):
+    """Shard directory - which database shard holds a user's lists and tasks.
+
+    Users without a row live on shard 0 (the main database).
+    """
+    __tablename__ = 'shard_directory'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    shard = db.Column(db.Integer, nullable=False, index=True)
+
+
+class TokenRevocation(db.Model):
+    """TokenRevocation model - a logged-out token (jti) or, with issued_before
+    set, every token the user was issued before that time"""
+    __tablename__ = 'token_revocations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    jti = db.Column(db.String(32), nullable=True, index=True)
+    issued_before = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Other processes sync rows by increasing id; a purged id must not return
+    __table_args__ = {'sqlite_autoincrement': True}
+
+
+shard_router.init_app(app, db, UserShard, [
+    TodoList.__table__, Task.__table__, ArchivedTask.__table__
+])
+group_commits.init_app(app, db, engine=shard_router.current_engine)
+job_runner.init_app(app, db, Job, scope=shard_router.for_user, defer=group_commits.deferred)
+# Cached trees may only be dropped once a grouped request has committed
+tree_cache.invalidate = group_commits.deferred(tree_cache.invalidate)
+# Tree indexes load through load_index_rows (a tree helper, defined below)
+tree_indexes.init_app(app, lambda list_id: load_index_rows(list_id),
+                      defer=group_commits.deferred, on_failure=group_commits.on_failure,
+                      uncounted=query_budgets.uncounted)
+tree_indexes.invalidate = group_commits.deferred(tree_indexes.invalidate)
+owned_lists.forget = group_commits.deferred(owned_lists.forget)
+revocations.init_app(app, db, TokenRevocation)
+# A revocation only takes effect in memory once its row has committed
+revocations.remember_token = group_commits.deferred(revocations.remember_token)
+revocations.remember_cutoff = group_commits.deferred(revocations.remember_cutoff)
+revocation_sync = Sweeper(app, revocations.sync, app.config['REVOCATION_SYNC_INTERVAL'])
+
+
+# ==================== Tree Helpers ====================
+
+def subtree_ids(roots):
+    """Select the ids of the root tasks and all their descendants (recursive CTE).
+
+    `roots` is a SELECT of task ids (or a list of ids) seeding the walk. The CTE
+    lets bulk operations address a whole subtree in a single UPDATE/DELETE.
+    """
+    tasks = Task.__table__
+    if isinstance(roots, (list, tuple, set)):
+        roots = select(tasks.c.id).where(tasks.c.id.in_(roots))
+    # Nest the CTE inside the IN (...) so the outer statement still starts with
+    # UPDATE/DELETE and the driver reports a real rowcount.
+    subtree = roots.cte('subtree', recursive=True, nesting=True)
+    subtree = subtree.union_all(
+        select(tasks.c.id).where(tasks.c.parent_id == subtree.c.id)
+    )
+    return select(subtree.c.id)
+
+
+def attach_children(tasks):
+    """Populate `children` on already-loaded tasks from the tasks themselves.
+
+    `tasks` must be ordered by position. Afterwards
+    `to_dict(include_children=True)` runs without any lazy loads.
+    Returns the tasks grouped by parent_id.
+    """
+    by_parent = {}
+    for task in tasks:
+        by_parent.setdefault(task.parent_id, []).append(task)
+    for task in tasks:
+        set_committed_value(task, 'children', by_parent.get(task.id, []))
+    return by_parent
+
+
+def load_subtree(task):
+    """Load a task's whole subtree in one query, ready for serialization.
+    Returns the loaded tasks grouped by parent_id."""
+    task_id = inspect(task).identity[0]
+    return attach_children(db.session.scalars(
+        select(Task).where(Task.id.in_(subtree_ids([task_id])))
+        .order_by(Task.position, Task.id)
+    ).all())
+
+
+def load_subtree_levels(task, depth):
+    """Load a task's subtree `depth` levels deep in one query.
+
+    The walk goes one level further so tasks on the last level know their
+    child counts; those extra tasks are attached but not serialized.
+    Returns the loaded tasks grouped by parent_id.
+    """
+    tasks = Task.__table__
+    task_id = inspect(task).identity[0]
+    levels = select(tasks.c.id, literal(0).label('level')) \
+        .where(tasks.c.id == task_id).cte('levels', recursive=True)
+    levels = levels.union_all(
+        select(tasks.c.id, levels.c.level + 1)
+        .where(tasks.c.parent_id == levels.c.id, levels.c.level <= depth)
+    )
+    return attach_children(db.session.scalars(
+        select(Task).join(levels, Task.id == levels.c.id)
+        .order_by(Task.position, Task.id)
+    ).all())
+
+
+def copy_subtree(source, list_id, root=None, reset_completed=False):
+    """Copy tasks into `list_id` with a single INSERT ... SELECT.
+
+    `source` is a SELECT of the ids to copy and must contain the parent of
+    every copied task except the root. Copies are numbered densely from the
+    current maximum id (ROW_NUMBER() in id order), and parent links are
+    remapped by joining that numbering to itself. `root` is an optional
+    (task_id, parent_id, position) placing the copied root, which is numbered
+    first.
+
+    Call only after the transaction has written something: SQLite then holds
+    the write lock, so no other writer can take ids above the maximum.
+    Returns the id of the first copy (the root's), or None if there was
+    nothing to copy.
+    """
+    tasks = Task.__table__
+    max_id, count = db.session.execute(select(
+        select(func.max(tasks.c.id)).scalar_subquery(),
+        select(func.count()).where(tasks.c.id.in_(source)).scalar_subquery()
+    )).one()
+    if not count:
+        return None
+    
+    order = [tasks.c.id]
+    if root is not None:
+        order.insert(0, case((tasks.c.id == root[0], 0), else_=1))
+    numbered = select(
+        tasks.c.id, (func.row_number().over(order_by=order) + max_id).label('new_id')
+    ).where(tasks.c.id.in_(source)).cte('numbered')
+    new_parent = numbered.alias('new_parent')
+    
+    parent_id = new_parent.c.new_id
+    position = tasks.c.position
+    if root is not None:
+        root_id, root_parent_id, root_position = root
+        parent_id = case((tasks.c.id == root_id, literal(root_parent_id, db.Integer)),
+                         else_=parent_id)
+        position = case((tasks.c.id == root_id, root_position), else_=position)
+    completed = literal(False) if reset_completed else tasks.c.completed
+    completed_at = literal(None, db.DateTime) if reset_completed else tasks.c.completed_at
+    db.session.execute(insert(tasks).from_select(
+        ['id', 'title', 'completed', 'collapsed', 'list_id', 'parent_id', 'position',
+         'created_at', 'completed_at'],
+        select(
+            numbered.c.new_id, tasks.c.title, completed, tasks.c.collapsed,
+            literal(list_id), parent_id, position, literal(datetime.utcnow()), completed_at
+        ).select_from(
+            tasks.join(numbered, numbered.c.id == tasks.c.id)
+            .outerjoin(new_parent, new_parent.c.id == tasks.c.parent_id)
+        )
+    ))
+    return max_id + 1
+
+
+def set_sibling_order(list_id, parent_id, order, index=None):
+    """Renumber the children of `parent_id` (None: the list's top level) so
+    each gets its index in `order`, with one UPDATE ... CASE statement.
+
+    `order` must name exactly the current children, taken from the list's
+    tree `index` when given. Returns an error response, or None on success.
+    """
+    if not isinstance(order, list) or \
+            not all(isinstance(i, int) and not isinstance(i, bool) for i in order):
+        return jsonify({'error': 'order must be a list of task ids'}), 400
+    if len(set(order)) != len(order):
+        return jsonify({'error': 'order contains duplicate ids'}), 400
+    
+    if index is not None:
+        current = set(index.children(parent_id))
+    else:
+        current = set(db.session.scalars(
+            select(Task.id).where(Task.list_id == list_id, Task.parent_id == parent_id)
+        ))
+    if current != set(order):
+        return jsonify({
+            'error': 'order must list exactly the current children',
+            'missing': sorted(current - set(order)),
+            'unexpected': sorted(set(order) - current)
+        }), 409
+    
+    if order:
+        db.session.execute(
+            update(Task).where(Task.id.in_(order)).values(
+                position=case(
+                    {task_id: index for index, task_id in enumerate(order)}, value=Task.id
+                ),
+                version=Task.version + 1
+            ),
+            execution_options={'synchronize_session': False}
+        )
+    return None
+
+
+def subtree_walk(root_ids):
+    """Recursive CTE of (root_id, id, completed) over the given subtrees"""
+    tasks = Task.__table__
+    walk = select(tasks.c.id.label('root_id'), tasks.c.id, tasks.c.completed) \
+        .where(tasks.c.id.in_(root_ids)).cte('walk', recursive=True, nesting=True)
+    return walk.union_all(
+        select(walk.c.root_id, tasks.c.id, tasks.c.completed)
+        .where(tasks.c.parent_id == walk.c.id)
+    )
+
+
+def archive_candidates(cutoff, list_id=None, after_id=0, limit=None):
+    """Select (id, list_id) of the topmost tasks completed by `cutoff`.
+
+    A task whose parent also qualifies is left to the parent's subtree.
+    Rows are ordered by id, starting after `after_id`.
+    """
+    parent = aliased(Task)
+    query = select(Task.id, Task.list_id) \
+        .outerjoin(parent, Task.parent_id == parent.id) \
+        .where(
+            Task.completed.is_(True),
+            Task.completed_at <= cutoff,
+            Task.id > after_id,
+            or_(
+                parent.id.is_(None),
+                parent.completed.isnot(True),
+                parent.completed_at.is_(None),
+                parent.completed_at > cutoff
+            )
+        ).order_by(Task.id)
+    if list_id is not None:
+        query = query.where(Task.list_id == list_id)
+    if limit:
+        query = query.limit(limit)
+    return db.session.execute(query).all()
+
+
+def archive_subtrees(root_ids):
+    """Move the fully completed subtrees under `root_ids` to archived_tasks.
+
+    Subtrees that still contain an open task are left alone, and a root
+    inside another archived subtree goes with that subtree. The copy is one
+    INSERT ... SELECT: archived rows are numbered densely past the archive's
+    maximum id and parent links are remapped through that numbering, as in
+    copy_subtree. Returns the number of tasks archived.
+    """
+    walk = subtree_walk(root_ids)
+    open_tasks = func.sum(case((walk.c.completed.is_(True), 0), else_=1))
+    # A root can sit below another one when a task in between is too
+    # recently completed to qualify itself
+    blocked = select(walk.c.root_id).group_by(walk.c.root_id).having(open_tasks > 0)
+    nested = select(walk.c.id).where(walk.c.id != walk.c.root_id,
+                                     walk.c.root_id.not_in(blocked))
+    roots = db.session.scalars(
+        select(walk.c.root_id)
+        .where(walk.c.root_id.not_in(nested))
+        .group_by(walk.c.root_id)
+        .having(open_tasks == 0)
+    ).all()
+    if not roots:
+        return 0
+    
+    tasks = Task.__table__
+    archive = ArchivedTask.__table__
+    walk = subtree_walk(roots)
+    numbered = select(
+        walk.c.root_id, walk.c.id,
+        (func.row_number().over(order_by=walk.c.id)
+         + select(func.coalesce(func.max(archive.c.id), 0)).scalar_subquery()).label('new_id')
+    ).cte('numbered')
+    new_root = numbered.alias('new_root')
+    new_parent = numbered.alias('new_parent')
+    db.session.execute(insert(archive).from_select(
+        ['id', 'root_id', 'parent_id', 'task_id', 'task_parent_id', 'list_id', 'title',
+         'completed', 'collapsed', 'position', 'created_at', 'completed_at', 'archived_at'],
+        select(
+            numbered.c.new_id,
+            new_root.c.new_id,
+            case((tasks.c.id == numbered.c.root_id, None), else_=new_parent.c.new_id),
+            tasks.c.id, tasks.c.parent_id, tasks.c.list_id, tasks.c.title,
+            tasks.c.completed, tasks.c.collapsed, tasks.c.position,
+            tasks.c.created_at, tasks.c.completed_at, literal(datetime.utcnow())
+        ).select_from(
+            tasks.join(numbered, numbered.c.id == tasks.c.id)
+            .join(new_root, new_root.c.id == numbered.c.root_id)
+            .outerjoin(new_parent, new_parent.c.id == tasks.c.parent_id)
+        )
+    ))
+    return db.session.execute(
+        delete(Task).where(Task.id.in_(subtree_ids(roots))),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+
+
+def load_index_rows(list_id):
+    """Structure rows of a list for its tree index, in sibling order"""
+    return db.session.execute(
+        select(Task.id, Task.parent_id, Task.position, Task.completed, Task.collapsed)
+        .where(Task.list_id == list_id).order_by(Task.position, Task.id)
+    ).all()
+
+
+# Subtree reads through the tree index fetch tasks by id; larger subtrees are
+# walked with the recursive CTE instead (SQLite caps bound parameters)
+INDEX_FETCH_LIMIT = 10000
+
+
+def load_indexed_subtree(task, depth=None, elide_collapsed=False):
+    """Load only the tasks a subtree read will serialize, chosen from the
+    list's tree index. Returns the tasks grouped by parent_id, or None if the
+    index is disabled, does not know the task or the subtree is too large."""
+    with tree_indexes.reading(task.list_id) as index:
+        if index is None or task.id not in index:
+            return None
+        ids = index.visible([task.id], depth, elide_collapsed)
+    if len(ids) > INDEX_FETCH_LIMIT:
+        return None
+    return attach_children(db.session.scalars(
+        select(Task).where(Task.id.in_(ids)).order_by(Task.position, Task.id)
+    ).all())
+
+
+def load_list_tasks(lists):
+    """Load every task of the given lists in one query and attach them"""
+    list_ids = [inspect(l).identity[0] for l in lists]
+    tasks = []
+    if list_ids:
+        tasks = db.session.scalars(
+            select(Task).where(Task.list_id.in_(list_ids)).order_by(Task.position, Task.id)
+        ).all()
+    attach_children(tasks)
+    by_list = {}
+    for task in tasks:
+        by_list.setdefault(task.list_id, []).append(task)
+    for todo_list in lists:
+        set_committed_value(todo_list, 'tasks', by_list.get(todo_list.id, []))
+    return lists
+
+
+# Wire formats for task trees: nested `children` arrays (the default), or a
+# pre-order sequence of rows as objects (flat) or as one array per field
+# (columnar). Rows carry their depth, so clients rebuild nesting in one pass.
+TREE_FORMATS = ('nested', 'flat', 'columnar')
+ROW_FIELDS = ('id', 'title', 'completed', 'collapsed', 'parent_id', 'position',
+              'created_at', 'completed_at', 'version', 'depth')
+ROW_COLUMNS = (Task.id, Task.list_id, Task.title, Task.completed, Task.collapsed,
+               Task.parent_id, Task.position, Task.created_at, Task.completed_at,
+               Task.version)
+
+
+def load_task_rows(list_ids):
+    """Plain rows (no ORM objects) of every task in the lists, in sibling
+    order, plus the rows grouped by parent_id and the top-level rows by list"""
+    rows = db.session.execute(
+        select(*ROW_COLUMNS).where(Task.list_id.in_(list_ids))
+        .order_by(Task.position, Task.id)
+    ).all() if list_ids else []
+    by_parent = {}
+    roots = {}
+    for row in rows:
+        if row.parent_id is None:
+            roots.setdefault(row.list_id, []).append(row)
+        else:
+            by_parent.setdefault(row.parent_id, []).append(row)
+    return by_parent, roots
+
+
+def walk_preorder(roots, by_parent, elide_collapsed=False, depth=None):
+    """Yield (task, level) for `roots` and their descendants in pre-order.
+
+    Uses an explicit stack, so any depth works. Children of collapsed tasks
+    (with elide_collapsed) and of tasks `depth` levels down are skipped.
+    """
+    stack = [(task, 0) for task in reversed(roots)]
+    while stack:
+        task, level = stack.pop()
+        yield task, level
+        if level == depth or (elide_collapsed and task.collapsed):
+            continue
+        children = by_parent.get(task.id)
+        if children:
+            stack.extend((child, level + 1) for child in reversed(children))
+
+
+@tracer.traced('flat_tree')
+def flat_tree(roots, by_parent, layout, elide_collapsed=False, depth=None):
+    """Serialize trees as pre-order rows: a list of objects (`flat`) or a
+    dict of field -> values (`columnar`).
+
+    `roots` and `by_parent` hold Task objects or rows with the same
+    attributes. As in Task.to_dict, rows get child_count/has_children when
+    children may be left out.
+    """
+    summarize = elide_collapsed or depth is not None
+    fields = ROW_FIELDS + (('child_count', 'has_children') if summarize else ())
+    values = []
+    for task, level in walk_preorder(roots, by_parent, elide_collapsed, depth):
+        row = (
+            task.id, task.title, task.completed, task.collapsed, task.parent_id,
+            task.position, task.created_at.isoformat(),
+            task.completed_at.isoformat() if task.completed_at else None,
+            task.version, level
+        )
+        if summarize:
+            child_count = len(by_parent.get(task.id, ()))
+            row += (child_count, child_count > 0)
+        values.append(row)
+    if layout == 'columnar':
+        columns = list(zip(*values)) or [()] * len(fields)
+        return {field: list(column) for field, column in zip(fields, columns)}
+    return [dict(zip(fields, row)) for row in values]
+
+
+def tree_format():
+    """The `format` query parameter, or None if it is not a known format"""
+    fmt = request.args.get('format', 'nested')
+    return fmt if fmt in TREE_FORMATS else None
+
+
+@app.before_request
+def require_json_object():
+    """Reject JSON bodies that are not objects with a 400.
+
+    Views read their fields with data.get(...), so an array, string, number
+    or null body must not reach them. A missing or malformed body is left to
+    the view's own get_json().
+    """
+    if not request.is_json:
+        return None
+    # Parsed once: the view's get_json() reuses the cached result
+    data = request.get_json(silent=True)
+    if data is None and request.get_data(cache=True).strip() != b'null':
+        return None
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    return None
+
+
 # ==================== Authentication Utilities ====================
 
 def generate_token(user_id):
     """Generate JWT token for user"""
     payload = {
         'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(days=7)
+        'jti': uuid.uuid4().hex,
+        'iat': time.time(),
+        'exp': datetime.utcnow() + app.config['TOKEN_LIFETIME']
     }
     return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
 
 
 def verify_token(token):
-    """Verify JWT token and return user_id"""
+    """Verify JWT token and return its payload, or None if it is invalid,
+    expired or revoked"""
     try:
         payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload['user_id']
+        if revocations.is_revoked(payload):
+            return None
+        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
 
+def authenticate_request():
+    """Check the bearer token and admission control for the current request.
+    Returns an error response, or None once the user is set on the request."""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        metrics.count_auth(False)
+        return jsonify({'error': 'No authorization token provided'}), 401
+    
+    try:
+        token = auth_header.split(' ')[1]  # Format: "Bearer <token>"
+        payload = verify_token(token)
+        if not payload:
+            metrics.count_auth(False)
+            return jsonify({'error': 'Invalid or expired token'}), 401
+        
+        # Add user to request context
+        user_id = payload['user_id']
+        request.current_user_id = user_id
+        request.token_payload = payload
+        shard_router.activate(user_id)
+        metrics.count_auth(True)
+        
+        # Admission control: charge the request to the user's budgets
+        retry_after = limiter.check(user_id, request.endpoint, request.method)
+        if retry_after:
+            return (
+                jsonify({'error': 'Rate limit exceeded'}),
+                429,
+                {'Retry-After': retry_after_header(retry_after)}
+            )
+        return None
+    except (IndexError, AttributeError):
+        metrics.count_auth(False)
+        return jsonify({'error': 'Invalid authorization header format'}), 401
+
+
 def require_auth(f):
     """Decorator to require authentication for routes"""
     from functools import wraps
     
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
-            return jsonify({'error': 'No authorization token provided'}), 401
-        
-        try:
-            token = auth_header.split(' ')[1]  # Format: "Bearer <token>"
-            user_id = verify_token(token)
-            if not user_id:
-                return jsonify({'error': 'Invalid or expired token'}), 401
-            
-            # Add user to request context
-            request.current_user_id = user_id
-            return f(*args, **kwargs)
-        except (IndexError, AttributeError):
-            return jsonify({'error': 'Invalid authorization header format'}), 401
+        with tracer.span('auth'):
+            error = authenticate_request()
+        if error:
+            return error
+        return f(*args, **kwargs)
     
     return decorated_function
 
 
+# ==================== Authorization ====================
+
+def load_tasks(task_ids):
+    """Tasks by id, each loaded together with its list (and so its owner)
+    in one joined query"""
+    tasks = db.session.scalars(
+        select(Task).join(Task.list).options(contains_eager(Task.list))
+        .where(Task.id.in_(task_ids))
+    ).all()
+    return {task.id: task for task in tasks}
+
+
+def authorize_task(task_id):
+    """Load a task and its list in one query and check that the current user
+    owns it. Returns (task, None), or (None, a 404 or 403 response)."""
+    task = load_tasks([task_id]).get(task_id)
+    if not task:
+        return None, (jsonify({'error': 'Task not found'}), 404)
+    if task.list.user_id != request.current_user_id:
+        return None, (jsonify({'error': 'Unauthorized'}), 403)
+    return task, None
+
+
+def list_owner(list_id):
+    """'owned', 'foreign' or 'missing' for the current user and a list.
+
+    Answered from the owned-list cache when possible. Otherwise one query
+    reads the user's list ids (refreshing the cache) together with the
+    requested list's owner.
+    """
+    user_id = request.current_user_id
+    if owned_lists.owns(user_id, list_id):
+        return 'owned'
+    started = owned_lists.begin()
+    rows = db.session.execute(
+        select(TodoList.id, TodoList.user_id)
+        .where(or_(TodoList.user_id == user_id, TodoList.id == list_id))
+    ).all()
+    owned_lists.put(user_id, [row.id for row in rows if row.user_id == user_id], started)
+    owner = next((row.user_id for row in rows if row.id == list_id), None)
+    if owner is None:
+        return 'missing'
+    return 'owned' if owner == user_id else 'foreign'
+
+
+def authorize_list(list_id):
+    """None if the current user owns the list, else a 404 or 403 response"""
+    owner = list_owner(list_id)
+    if owner == 'missing':
+        return jsonify({'error': 'List not found'}), 404
+    if owner == 'foreign':
+        return jsonify({'error': 'Unauthorized'}), 403
+    return None
+
+
+# ==================== Concurrency Control ====================
+
+def check_version(obj, data=None):
+    """Compare the client's expected version of `obj` with the current one.
+
+    The expectation comes from an If-Match header (the ETag of an earlier
+    response) or a "version" field in the JSON body. Returns a 412 response
+    on mismatch, a 428 if none was sent and REQUIRE_IF_MATCH is set, or None.
+    """
+    if request.if_match:
+        matches = request.if_match.contains(str(obj.version))
+    elif isinstance(data, dict) and 'version' in data:
+        matches = data['version'] == obj.version
+    elif app.config['REQUIRE_IF_MATCH']:
+        return jsonify({'error': 'If-Match header or version is required'}), 428
+    else:
+        return None
+    if not matches:
+        return jsonify({
+            'error': 'Version mismatch; reload and retry',
+            'current_version': obj.version
+        }), 412
+    return None
+
+
+def claim_version(obj):
+    """Compare-and-set `obj`'s version ahead of a set-based UPDATE/DELETE.
+
+    Bulk statements bypass the ORM's version check, and check_version only
+    compared the version it read. Bumping the row `WHERE version = <that
+    version>` takes the write lock before the bulk statement runs; if another
+    write got in between, nothing matches and StaleDataError makes it a 412.
+    """
+    table = type(obj).__table__
+    obj_id = inspect(obj).identity[0]
+    result = db.session.execute(
+        update(table).where(table.c.id == obj_id, table.c.version == obj.version)
+        .values(version=table.c.version + 1)
+    )
+    if result.rowcount != 1:
+        raise StaleDataError(f'{table.name} {obj_id} was modified concurrently')
+
+
+def versioned(payload, status=200):
+    """JSON response for a single task or list, with its version as the ETag"""
+    response = jsonify(payload)
+    response.set_etag(str(payload['version']))
+    return response, status
+
+
+@app.errorhandler(StaleDataError)
+def handle_stale_data(error):
+    """A compare-and-set UPDATE matched no row: someone else changed it first"""
+    db.session.rollback()
+    return jsonify({'error': 'Modified concurrently; reload and retry'}), 412
+
+
 # ==================== Authentication Routes ====================
 
 @app.route('/api/register', methods=['POST'])
+@query_budget(4)
 def register():
     """Register a new user"""
     data = request.get_json()
@@ -186,7 +1035,9 @@ def register():
         return jsonify({'error': 'Username and password are required'}), 400
     
     # Check if user already exists
-    if User.query.filter_by(username=data['username']).first():
+    if db.session.scalars(
+        select(User).where(User.username == data['username']).limit(1)
+    ).first():
         return jsonify({'error': 'Username already exists'}), 400
     
     # Create new user
@@ -194,6 +1045,8 @@ def register():
     user.set_password(data['password'])
     
     db.session.add(user)
+    db.session.flush()
+    shard_router.assign(user.id)
     db.session.commit()
     
     # Generate token
@@ -207,6 +1060,7 @@ def register():
 
 
 @app.route('/api/login', methods=['POST'])
+@query_budget(1)
 def login():
     """Login user"""
     data = request.get_json()
@@ -215,11 +1069,16 @@ def login():
         return jsonify({'error': 'Username and password are required'}), 400
     
     # Find user
-    user = User.query.filter_by(username=data['username']).first()
+    user = db.session.scalars(
+        select(User).where(User.username == data['username']).limit(1)
+    ).first()
     
     if not user or not user.check_password(data['password']):
+        metrics.count_auth(False)
         return jsonify({'error': 'Invalid username or password'}), 401
     
+    metrics.count_auth(True)
+    
     # Generate token
     token = generate_token(user.id)
     
@@ -230,18 +1089,300 @@ def login():
     }), 200
 
 
+@app.route('/api/logout', methods=['POST'])
+@query_budget(1)
+@require_auth
+def logout():
+    """Revoke the token used for this request"""
+    payload = request.token_payload
+    if 'jti' in payload:
+        revocations.revoke_token(payload)
+        db.session.commit()
+        revocations.remember_token(payload)
+    else:
+        # Tokens issued before revocation support have no id of their own
+        cutoff = revocations.revoke_user(payload['user_id'])
+        db.session.commit()
+        revocations.remember_cutoff(payload['user_id'], cutoff)
+    return jsonify({'message': 'Logged out'}), 200
+
+
+@app.route('/api/logout/all', methods=['POST'])
+@query_budget(1)
+@require_auth
+def logout_all():
+    """Revoke every token issued to the user so far, on every device"""
+    cutoff = revocations.revoke_user(request.current_user_id)
+    db.session.commit()
+    revocations.remember_cutoff(request.current_user_id, cutoff)
+    return jsonify({'message': 'Logged out of all sessions'}), 200
+
+
+# ==================== Background Jobs ====================
+
+def accepted(job):
+    """202 response for a submitted job, or 429 if the user has too many"""
+    if job is None:
+        return jsonify({'error': 'Too many unfinished jobs'}), 429
+    return jsonify(job.to_dict()), 202, {'Location': f'/api/jobs/{job.id}'}
+
+
+def count_import_tasks(nodes):
+    """Validate an imported task tree and return its size, or None if invalid"""
+    if not isinstance(nodes, list):
+        return None
+    count = 0
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict) or not isinstance(node.get('title'), str) \
+                or not node['title']:
+            return None
+        children = node.get('children', [])
+        if not isinstance(children, list):
+            return None
+        stack.extend(children)
+        count += 1
+    return count
+
+
+@job_runner.handler('delete_subtree')
+def delete_subtree_job(ctx, task_id):
+    """Delete a task's subtree in batches, deepest tasks first.
+
+    Each batch is committed on its own so writers are not blocked for the
+    whole delete. Because leaves go first, a cancelled job leaves a valid
+    (smaller) tree behind.
+    """
+    tasks = Task.__table__
+    levels = select(tasks.c.id, tasks.c.list_id, literal(0).label('depth')) \
+        .where(tasks.c.id == task_id).cte('levels', recursive=True)
+    levels = levels.union_all(
+        select(tasks.c.id, tasks.c.list_id, levels.c.depth + 1)
+        .where(tasks.c.parent_id == levels.c.id)
+    )
+    rows = db.session.execute(
+        select(levels.c.id, levels.c.list_id).order_by(levels.c.depth.desc())
+    ).all()
+    if not rows:
+        return {'deleted': 0}
+    
+    list_id = rows[0].list_id
+    ids = [row.id for row in rows]
+    batch = app.config['JOBS_BATCH_SIZE']
+    for start in range(0, len(ids), batch):
+        ctx.check_cancelled()
+        chunk = ids[start:start + batch]
+        db.session.execute(
+            delete(Task).where(Task.id.in_(chunk)),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        tree_cache.invalidate(list_id)
+        tree_indexes.invalidate(list_id)
+        ctx.progress(start + len(chunk), len(ids))
+    return {'deleted': len(ids), 'list_id': list_id}
+
+
+@job_runner.handler('renumber_positions')
+def renumber_positions_job(ctx, list_id):
+    """Rewrite sibling positions in a list as 0..n-1, keeping their order"""
+    rows = db.session.execute(
+        select(Task.id, Task.parent_id, Task.position)
+        .where(Task.list_id == list_id)
+        .order_by(Task.position, Task.created_at, Task.id)
+    ).all()
+    next_position = {}
+    changes = []
+    for task_id, parent_id, position in rows:
+        new_position = next_position.get(parent_id, 0)
+        next_position[parent_id] = new_position + 1
+        if position != new_position:
+            changes.append({'task_id': task_id, 'new_position': new_position})
+    
+    # One transaction, so a cancelled job changes nothing
+    tasks = Task.__table__
+    renumber = update(tasks).where(tasks.c.id == bindparam('task_id')) \
+        .values(position=bindparam('new_position'), version=tasks.c.version + 1)
+    batch = app.config['JOBS_BATCH_SIZE']
+    for start in range(0, len(changes), batch):
+        ctx.check_cancelled()
+        chunk = changes[start:start + batch]
+        db.session.execute(renumber, chunk)
+        ctx.progress(start + len(chunk), len(changes))
+    db.session.commit()
+    tree_cache.invalidate(list_id)
+    tree_indexes.invalidate(list_id)
+    return {'tasks': len(rows), 'renumbered': len(changes)}
+
+
+@job_runner.handler('export_list')
+def export_list_job(ctx, list_id):
+    """Serialize a list and its whole task tree as the job result"""
+    todo_list = db.session.get(TodoList, list_id)
+    if todo_list is None:
+        raise ValueError('List not found')
+    load_list_tasks([todo_list])
+    ctx.progress(1, 1)
+    return todo_list.to_dict(include_tasks=True)
+
+
+@job_runner.handler('import_list')
+def import_list_job(ctx, name, tasks):
+    """Create a list from a task tree (e.g. an export) in one transaction"""
+    total = count_import_tasks(tasks)
+    new_list = TodoList(name=name, user_id=ctx.user_id)
+    db.session.add(new_list)
+    db.session.flush()
+    list_id = new_list.id
+    
+    # Insert level by level so every parent has an id before its children
+    batch = app.config['JOBS_BATCH_SIZE']
+    now = datetime.utcnow()
+    done = 0
+    level = [(None, tasks)]
+    while level:
+        created = [
+            (Task(
+                title=node['title'],
+                completed=bool(node.get('completed')),
+                completed_at=now if node.get('completed') else None,
+                collapsed=bool(node.get('collapsed')),
+                list_id=list_id,
+                parent_id=parent_id,
+                position=position
+            ), node.get('children') or [])
+            for parent_id, nodes in level
+            for position, node in enumerate(nodes)
+        ]
+        for start in range(0, len(created), batch):
+            ctx.check_cancelled()
+            chunk = created[start:start + batch]
+            db.session.add_all(task for task, _ in chunk)
+            db.session.flush()
+            done += len(chunk)
+            ctx.progress(done, total)
+        level = [(task.id, children) for task, children in created if children]
+    
+    db.session.commit()
+    tree_cache.invalidate(list_id)
+    return {'list_id': list_id, 'tasks': total}
+
+
+def archive_sweep_step(cursor):
+    """Archive one batch of old completed subtrees; driven by archive_sweeper.
+
+    The cursor is (shard, last root id); shards are swept one after another.
+    """
+    shard, after_id = cursor or (0, 0)
+    cutoff = datetime.utcnow() - timedelta(days=app.config['ARCHIVE_AFTER_DAYS'])
+    with shard_router.use(shard):
+        rows = archive_candidates(
+            cutoff, after_id=after_id, limit=app.config['ARCHIVE_BATCH_SIZE']
+        )
+        if rows:
+            archive_subtrees([row.id for row in rows])
+            db.session.commit()
+    if rows:
+        tree_cache.invalidate(*{row.list_id for row in rows})
+        tree_indexes.invalidate(*{row.list_id for row in rows})
+        return shard, rows[-1].id
+    if shard + 1 < shard_router.count:
+        return shard + 1, 0
+    return None
+
+
+archive_sweeper = Sweeper(app, archive_sweep_step, app.config['ARCHIVE_SWEEP_INTERVAL'])
+
+
+# ==================== Background Work ====================
+
+# Jobs claimed before this moment were interrupted; later ones belong to
+# processes that are still running
+PROCESS_STARTED = datetime.utcnow()
+_background_pid = None
+_background_lock = threading.Lock()
+
+
+def recover_jobs():
+    """Re-queue jobs interrupted by a previous process"""
+    with app.app_context():
+        try:
+            job_runner.recover(started_before=PROCESS_STARTED)
+        except Exception:  # noqa: BLE001 - a failed recovery must not stop serving
+            app.logger.exception('Job recovery failed')
+
+
+@app.before_request
+def start_background_work():
+    """Start job recovery, revocation sync and archiving in this process.
+
+    Runs on the first request each process serves, so every worker of a
+    forking or WSGI server gets its own threads (threads do not survive a
+    fork). Recovery runs on its own thread to keep the request fast.
+    """
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+        threading.Thread(target=recover_jobs, daemon=True, name='job-recovery').start()
+        revocation_sync.start()
+        if app.config['ARCHIVE_ENABLED']:
+            archive_sweeper.start()
+
+
 # ==================== List Routes ====================
 
 @app.route('/api/lists', methods=['GET'])
+@query_budget(2)
 @require_auth
 def get_lists():
-    """Get all lists for the current user"""
-    lists = TodoList.query.filter_by(user_id=request.current_user_id).all()
-    return jsonify([l.to_dict(include_tasks=True) for l in lists]), 200
+    """Get all lists for the current user.
+
+    Each list's serialized tree comes from the tree cache when possible;
+    only lists that changed since they were cached are loaded and encoded.
+    With ?collapsed=omit, collapsed tasks are sent without their children
+    (see Task.to_dict); ?format=flat|columnar sends each list's tasks as
+    pre-order rows instead of nested children (see flat_tree).
+    """
+    fmt = tree_format()
+    if fmt is None:
+        return jsonify({'error': f'format must be one of {", ".join(TREE_FORMATS)}'}), 400
+    elide = request.args.get('collapsed') == 'omit'
+    variant = (fmt, elide)
+    started = tree_cache.begin()
+    owned_started = owned_lists.begin()
+    lists = db.session.scalars(
+        select(TodoList).where(TodoList.user_id == request.current_user_id)
+    ).all()
+    owned_lists.put(request.current_user_id, [l.id for l in lists], owned_started)
+    fragments = {l.id: tree_cache.get(l.id, variant) for l in lists}
+    missing = [l for l in lists if fragments[l.id] is None]
+    if missing and fmt == 'nested':
+        load_list_tasks(missing)
+        for l in missing:
+            data = app.json.dumps(
+                l.to_dict(include_tasks=True, elide_collapsed=elide), separators=(',', ':')
+            )
+            fragments[l.id] = tree_cache.put(l.id, data.encode(), started, variant)
+    elif missing:
+        by_parent, roots = load_task_rows([l.id for l in missing])
+        for l in missing:
+            result = l.to_dict()
+            result['tasks'] = flat_tree(roots.get(l.id, []), by_parent, fmt, elide)
+            data = app.json.dumps(result, separators=(',', ':'))
+            fragments[l.id] = tree_cache.put(l.id, data.encode(), started, variant)
+    body = b'[' + b','.join(fragments[l.id] for l in lists) + b']\n'
+    return app.response_class(body, mimetype='application/json'), 200
 
 
 @app.route('/api/lists', methods=['POST'])
+@query_budget(3)
 @require_auth
+@grouped
 def create_list():
     """Create a new list"""
     data = request.get_json()
@@ -257,14 +1398,17 @@ def create_list():
     db.session.add(new_list)
     db.session.commit()
     
-    return jsonify(new_list.to_dict(include_tasks=True)), 201
+    load_list_tasks([new_list])
+    return versioned(new_list.to_dict(include_tasks=True), 201)
 
 
 @app.route('/api/lists/<int:list_id>', methods=['PUT'])
+@query_budget(4)
 @require_auth
+@grouped
 def update_list(list_id):
     """Update a list"""
-    todo_list = TodoList.query.get(list_id)
+    todo_list = db.session.get(TodoList, list_id)
     
     if not todo_list:
         return jsonify({'error': 'List not found'}), 404
@@ -273,19 +1417,62 @@ def update_list(list_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     data = request.get_json()
+    error = check_version(todo_list, data)
+    if error:
+        return error
+    
     if data.get('name'):
         todo_list.name = data['name']
     
     db.session.commit()
+    tree_cache.invalidate(list_id)
     
-    return jsonify(todo_list.to_dict(include_tasks=True)), 200
+    load_list_tasks([todo_list])
+    return versioned(todo_list.to_dict(include_tasks=True))
+
+
+@app.route('/api/lists/<int:list_id>/order', methods=['PUT'])
+@query_budget(5)
+@require_auth
+@grouped
+def order_list(list_id):
+    """Set the order of a list's top-level tasks in one call.
+
+    Payload JSON:
+      - order: every top-level task id of the list, in the new order
+    """
+    todo_list = db.session.get(TodoList, list_id)
+    
+    if not todo_list:
+        return jsonify({'error': 'List not found'}), 404
+    
+    if todo_list.user_id != request.current_user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    data = request.get_json() or {}
+    with tree_indexes.writing(list_id) as section:
+        index = section.index(list_id)
+        error = set_sibling_order(list_id, None, data.get('order'), index)
+        if error:
+            return error
+        
+        db.session.commit()
+        if index is not None:
+            index.set_positions({task_id: i for i, task_id in enumerate(data['order'])})
+            section.applied(list_id)
+    tree_cache.invalidate(list_id)
+    
+    load_list_tasks([todo_list])
+    return versioned(todo_list.to_dict(include_tasks=True))
 
 
 @app.route('/api/lists/<int:list_id>', methods=['DELETE'])
+@query_budget(5)
 @require_auth
+@grouped
 def delete_list(list_id):
     """Delete a list"""
-    todo_list = TodoList.query.get(list_id)
+    todo_list = db.session.get(TodoList, list_id)
     
     if not todo_list:
         return jsonify({'error': 'List not found'}), 404
@@ -293,16 +1480,292 @@ def delete_list(list_id):
     if todo_list.user_id != request.current_user_id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    db.session.delete(todo_list)
+    error = check_version(todo_list)
+    if error:
+        return error
+    
+    # Set-based delete; the ORM cascade would load every task first
+    claim_version(todo_list)
+    db.session.execute(
+        delete(Task).where(Task.list_id == list_id),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(ArchivedTask).where(ArchivedTask.list_id == list_id),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(TodoList).where(TodoList.id == list_id),
+        execution_options={'synchronize_session': False}
+    )
     db.session.commit()
+    tree_cache.invalidate(list_id)
+    tree_indexes.invalidate(list_id)
+    owned_lists.forget(request.current_user_id)
     
     return jsonify({'message': 'List deleted successfully'}), 200
 
 
+@app.route('/api/lists/<int:list_id>/completed', methods=['DELETE'])
+@query_budget(2)
+@require_auth
+@grouped
+def clear_completed(list_id):
+    """Delete every completed task in a list, together with its subtree.
+
+    Runs as a single set-based DELETE driven by a recursive CTE, so the cost is
+    one statement regardless of how many tasks are removed.
+    """
+    error = authorize_list(list_id)
+    if error:
+        return error
+
+    completed_roots = select(Task.id).where(
+        Task.list_id == list_id,
+        Task.completed.is_(True)
+    )
+    result = db.session.execute(
+        delete(Task).where(Task.id.in_(subtree_ids(completed_roots))),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    tree_cache.invalidate(list_id)
+    tree_indexes.invalidate(list_id)
+
+    return jsonify({
+        'message': 'Completed tasks cleared',
+        'deleted': result.rowcount
+    }), 200
+
+
+@app.route('/api/lists/<int:list_id>/clone', methods=['POST'])
+@query_budget(6)
+@require_auth
+def clone_list(list_id):
+    """Copy a list and its whole task tree, e.g. from a template list.
+
+    Payload JSON (optional):
+      - name: name of the copy (default: "<name> (copy)")
+      - reset_completed: mark every copied task as not completed
+    """
+    todo_list = db.session.get(TodoList, list_id)
+
+    if not todo_list:
+        return jsonify({'error': 'List not found'}), 404
+
+    if todo_list.user_id != request.current_user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    data = request.get_json(silent=True) or {}
+    new_list = TodoList(
+        name=data.get('name') or f'{todo_list.name} (copy)',
+        user_id=request.current_user_id
+    )
+    db.session.add(new_list)
+    db.session.flush()
+    new_list_id = new_list.id
+    copy_subtree(
+        select(Task.id).where(Task.list_id == list_id), new_list_id,
+        reset_completed=bool(data.get('reset_completed'))
+    )
+    db.session.commit()
+    tree_cache.invalidate(new_list_id)
+
+    load_list_tasks([new_list])
+    return versioned(new_list.to_dict(include_tasks=True), 201)
+
+
+@app.route('/api/lists/<int:list_id>/archive', methods=['POST'])
+@query_budget(5)
+@require_auth
+def archive_list(list_id):
+    """Archive the list's completed subtrees now instead of waiting for the sweep.
+
+    Payload JSON (optional):
+      - older_than_days: only archive tasks completed at least this long ago
+        (default: ARCHIVE_AFTER_DAYS)
+    """
+    error = authorize_list(list_id)
+    if error:
+        return error
+
+    data = request.get_json(silent=True) or {}
+    days = data.get('older_than_days', app.config['ARCHIVE_AFTER_DAYS'])
+    if isinstance(days, bool) or not isinstance(days, (int, float)) or days < 0:
+        return jsonify({'error': 'older_than_days must be a non-negative number'}), 400
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    roots = [row.id for row in archive_candidates(cutoff, list_id=list_id)]
+    archived = archive_subtrees(roots) if roots else 0
+    db.session.commit()
+    tree_cache.invalidate(list_id)
+    tree_indexes.invalidate(list_id)
+
+    return jsonify({'message': 'Completed tasks archived', 'archived': archived}), 200
+
+
+@app.route('/api/lists/<int:list_id>/archive', methods=['GET'])
+@query_budget(3)
+@require_auth
+def get_archive(list_id):
+    """Get a page of a list's archived subtrees, most recently archived first.
+
+    Query parameters: page (default 1) and per_page (default 20, max 100).
+    """
+    error = authorize_list(list_id)
+    if error:
+        return error
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    roots = ArchivedTask.query.filter(
+        ArchivedTask.list_id == list_id,
+        ArchivedTask.id == ArchivedTask.root_id
+    ).order_by(ArchivedTask.archived_at.desc(), ArchivedTask.id.desc()) \
+        .offset((page - 1) * per_page).limit(per_page + 1).all()
+    has_more = len(roots) > per_page
+    roots = roots[:per_page]
+
+    children_by_parent = {}
+    if roots:
+        rows = ArchivedTask.query.filter(
+            ArchivedTask.root_id.in_([root.id for root in roots])
+        ).order_by(ArchivedTask.position, ArchivedTask.id).all()
+        for row in rows:
+            children_by_parent.setdefault(row.parent_id, []).append(row)
+
+    return jsonify({
+        'items': [root.to_dict(children_by_parent) for root in roots],
+        'page': page,
+        'per_page': per_page,
+        'has_more': has_more
+    }), 200
+
+
+@app.route('/api/archive/<int:archive_id>/restore', methods=['POST'])
+@query_budget(8)
+@require_auth
+def restore_archived(archive_id):
+    """Move an archived subtree back into its list.
+
+    The subtree returns under its original parent if that task still exists,
+    otherwise at the top level, after its new siblings. Restored tasks get new
+    ids, and their completion time restarts so the sweep does not archive them
+    again right away.
+    """
+    root = db.session.get(ArchivedTask, archive_id)
+
+    if not root or root.root_id != root.id:
+        return jsonify({'error': 'Archived subtree not found'}), 404
+
+    todo_list = db.session.get(TodoList, root.list_id)
+    if todo_list.user_id != request.current_user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    list_id = root.list_id
+    parent_id = root.task_parent_id
+    if parent_id is not None:
+        parent = db.session.get(Task, parent_id)
+        if not parent or parent.list_id != list_id:
+            parent_id = None
+
+    # Deleting first takes the write lock, so the maximum id below is stable
+    archive = ArchivedTask.__table__
+    rows = db.session.execute(
+        delete(archive).where(archive.c.root_id == archive_id).returning(*archive.c)
+    ).all()
+    max_id, max_position = db.session.execute(select(
+        select(func.max(Task.id)).scalar_subquery(),
+        select(func.max(Task.position))
+        .where(Task.list_id == list_id, Task.parent_id == parent_id).scalar_subquery()
+    )).one()
+    # Dense new ids, the root's first; parent links follow the same mapping
+    rows.sort(key=lambda row: (row.id != archive_id, row.id))
+    new_ids = {row.id: (max_id or 0) + 1 + n for n, row in enumerate(rows)}
+    now = datetime.utcnow()
+    db.session.execute(insert(Task.__table__), [
+        {
+            'id': new_ids[row.id],
+            'title': row.title,
+            'completed': row.completed,
+            'collapsed': row.collapsed,
+            'list_id': list_id,
+            'parent_id': parent_id if row.id == archive_id else new_ids[row.parent_id],
+            'position': (max_position + 1 if max_position is not None else 0)
+            if row.id == archive_id else row.position,
+            'created_at': row.created_at,
+            'completed_at': now if row.completed else None
+        }
+        for row in rows
+    ])
+    db.session.commit()
+    tree_cache.invalidate(list_id)
+    tree_indexes.invalidate(list_id)
+
+    task = db.session.get(Task, new_ids[archive_id])
+    load_subtree(task)
+    return versioned(task.to_dict(include_children=True))
+
+
+@app.route('/api/lists/<int:list_id>/renumber', methods=['POST'])
+@query_budget(4)
+@require_auth
+def renumber_list(list_id):
+    """Start a background job compacting sibling positions to 0..n-1"""
+    error = authorize_list(list_id)
+    if error:
+        return error
+
+    return accepted(job_runner.submit(
+        request.current_user_id, 'renumber_positions', list_id=list_id
+    ))
+
+
+@app.route('/api/lists/<int:list_id>/export', methods=['POST'])
+@query_budget(4)
+@require_auth
+def export_list(list_id):
+    """Start a background job exporting a list; the tree is the job's result"""
+    error = authorize_list(list_id)
+    if error:
+        return error
+
+    return accepted(job_runner.submit(
+        request.current_user_id, 'export_list', list_id=list_id
+    ))
+
+
+@app.route('/api/lists/import', methods=['POST'])
+@query_budget(3)
+@require_auth
+def import_list():
+    """Start a background job creating a list from a task tree.
+
+    Payload JSON (the format produced by an export):
+      - name: name of the new list
+      - tasks: nested tasks, each with title and optional completed,
+        collapsed and children
+    """
+    data = request.get_json()
+
+    if not data or not data.get('name'):
+        return jsonify({'error': 'List name is required'}), 400
+
+    tasks = data.get('tasks', [])
+    if count_import_tasks(tasks) is None:
+        return jsonify({'error': 'tasks must be a tree of objects with a title'}), 400
+
+    return accepted(job_runner.submit(
+        request.current_user_id, 'import_list', name=data['name'], tasks=tasks
+    ))
+
+
 # ==================== Task Routes ====================
 
 @app.route('/api/tasks', methods=['POST'])
+@query_budget(5)
 @require_auth
+@grouped
 def create_task():
     """Create a new task"""
     data = request.get_json()
@@ -311,65 +1774,224 @@ def create_task():
         return jsonify({'error': 'Task title and list_id required'}), 400
     
     # Verify list ownership
-    todo_list = TodoList.query.get(data['list_id'])
-    if not todo_list or todo_list.user_id != request.current_user_id:
+    if list_owner(data['list_id']) != 'owned':
         return jsonify({'error': 'List not found or unauthorized'}), 403
     
     # If parent_id is provided, verify it exists and belongs to same list
     if data.get('parent_id'):
-        parent = Task.query.get(data['parent_id'])
+        parent = db.session.get(Task, data['parent_id'])
         if not parent or parent.list_id != data['list_id']:
             return jsonify({'error': 'Invalid parent task'}), 400
     
-    # Determine position: max position of siblings + 1
-    siblings = Task.query.filter_by(
-        list_id=data['list_id'],
-        parent_id=data.get('parent_id')
-    ).all()
-    max_position = max([s.position for s in siblings], default=-1)
-    
-    new_task = Task(
-        title=data['title'],
-        list_id=data['list_id'],
-        parent_id=data.get('parent_id'),
-        position=max_position + 1
-    )
-    
-    db.session.add(new_task)
-    db.session.commit()
-    
-    return jsonify(new_task.to_dict(include_children=True)), 201
+    list_id, parent_id = data['list_id'], data.get('parent_id')
+    with tree_indexes.writing(list_id) as section:
+        index = section.index(list_id)
+        if index is not None and (parent_id is None or parent_id in index):
+            siblings = index.children(parent_id)
+            max_position = max((index.position(s) for s in siblings), default=-1)
+        else:
+            index = None
+            # Determine position: max position of siblings + 1
+            max_position = db.session.scalar(
+                select(func.coalesce(func.max(Task.position), -1)).where(
+                    Task.list_id == list_id, Task.parent_id == parent_id
+                )
+            )
+        
+        new_task = Task(
+            title=data['title'],
+            list_id=list_id,
+            parent_id=parent_id,
+            position=max_position + 1
+        )
+        
+        db.session.add(new_task)
+        db.session.flush()
+        new_task_id = new_task.id
+        db.session.commit()
+        if index is not None:
+            index.add(new_task_id, parent_id, max_position + 1)
+            section.applied(list_id)
+    tree_cache.invalidate(list_id)
+    
+    load_subtree(new_task)
+    return versioned(new_task.to_dict(include_children=True), 201)
+
+
+@app.route('/api/tasks/<int:task_id>/subtree', methods=['GET'])
+@query_budget(2)
+@require_auth
+def get_subtree(task_id):
+    """Get a task and its descendants, e.g. to expand a collapsed branch.
+
+    Query parameters:
+      - depth (optional): levels of descendants to include; tasks on the
+        last level carry child_count/has_children but no children
+      - collapsed=omit (optional): leave out the children of collapsed tasks
+      - format=flat|columnar (optional): pre-order rows instead of nesting;
+        the response is {id, version, tasks}, with the task itself first
+    """
+    fmt = tree_format()
+    if fmt is None:
+        return jsonify({'error': f'format must be one of {", ".join(TREE_FORMATS)}'}), 400
+    depth = request.args.get('depth')
+    if depth is not None:
+        if not depth.isdigit():
+            return jsonify({'error': 'depth must be a non-negative integer'}), 400
+        depth = int(depth)
+    elide = request.args.get('collapsed') == 'omit'
+
+    task, error = authorize_task(task_id)
+    if error:
+        return error
+
+    by_parent = load_indexed_subtree(task, depth, elide)
+    if by_parent is None and depth is None:
+        by_parent = load_subtree(task)
+    elif by_parent is None:
+        by_parent = load_subtree_levels(task, depth)
+    if fmt != 'nested':
+        return versioned({
+            'id': task.id,
+            'version': task.version,
+            'tasks': flat_tree([task], by_parent, fmt, elide, depth)
+        })
+    return versioned(task.to_dict(include_children=True, elide_collapsed=elide, depth=depth))
 
 
 @app.route('/api/tasks/<int:task_id>', methods=['PUT'])
+@query_budget(3)
 @require_auth
+@grouped
 def update_task(task_id):
     """Update a task"""
-    task = Task.query.get(task_id)
-    
-    if not task:
-        return jsonify({'error': 'Task not found'}), 404
-    
-    # Verify ownership through list
-    if task.list.user_id != request.current_user_id:
-        return jsonify({'error': 'Unauthorized'}), 403
+    task, error = authorize_task(task_id)
+    if error:
+        return error
     
     data = request.get_json()
+    error = check_version(task, data)
+    if error:
+        return error
     
     if 'title' in data:
         task.title = data['title']
     if 'completed' in data:
+        if not data['completed']:
+            task.completed_at = None
+        elif not task.completed:
+            task.completed_at = datetime.utcnow()
         task.completed = data['completed']
     if 'collapsed' in data:
         task.collapsed = data['collapsed']
     
+    list_id, completed, collapsed = task.list_id, task.completed, task.collapsed
+    with tree_indexes.writing(list_id) as section:
+        db.session.commit()
+        index = section.index(list_id, load=False)
+        if index is not None and task_id in index:
+            index.set_flags(task_id, completed=completed, collapsed=collapsed)
+            section.applied(list_id)
+    tree_cache.invalidate(list_id)
+    
+    load_subtree(task)
+    return versioned(task.to_dict(include_children=True))
+
+
+@app.route('/api/tasks/<int:task_id>/subtree', methods=['PUT'])
+@query_budget(4)
+@require_auth
+@grouped
+def update_subtree(task_id):
+    """Set completed and/or collapsed on a task and all of its descendants.
+
+    Payload JSON:
+      - completed (optional): bool applied to the whole subtree
+      - collapsed (optional): bool applied to the whole subtree
+
+    The subtree is updated with one UPDATE statement in one transaction.
+    """
+    task, error = authorize_task(task_id)
+    if error:
+        return error
+
+    data = request.get_json() or {}
+    error = check_version(task, data)
+    if error:
+        return error
+
+    values = {
+        field: data[field]
+        for field in ('completed', 'collapsed')
+        if field in data
+    }
+    if not values:
+        return jsonify({'error': 'Provide completed and/or collapsed'}), 400
+    if not all(isinstance(v, bool) for v in values.values()):
+        return jsonify({'error': 'completed and collapsed must be booleans'}), 400
+    if 'completed' in values:
+        # Keep the completion time of tasks that were already completed
+        values['completed_at'] = func.coalesce(Task.completed_at, datetime.utcnow()) \
+            if values['completed'] else None
+
+    claim_version(task)
+    db.session.execute(
+        update(Task).where(Task.id.in_(subtree_ids([task.id])))
+        # The root's version was bumped by claim_version
+        .values(version=Task.version + case((Task.id == task.id, 0), else_=1), **values),
+        execution_options={'synchronize_session': False}
+    )
+    list_id = task.list_id
     db.session.commit()
-    
-    return jsonify(task.to_dict(include_children=True)), 200
+    tree_cache.invalidate(list_id)
+    tree_indexes.invalidate(list_id)
+
+    load_subtree(task)
+    return versioned(task.to_dict(include_children=True))
+
+
+@app.route('/api/tasks/<int:task_id>/clone', methods=['POST'])
+@query_budget(6)
+@require_auth
+def clone_task(task_id):
+    """Copy a task and its whole subtree, placing the copy right after it.
+
+    Payload JSON (optional):
+      - reset_completed: mark every copied task as not completed
+    """
+    task, error = authorize_task(task_id)
+    if error:
+        return error
+
+    data = request.get_json(silent=True) or {}
+    list_id, parent_id, position = task.list_id, task.parent_id, task.position
+    # Make room after the original among its siblings
+    db.session.execute(
+        update(Task).where(
+            Task.list_id == list_id,
+            Task.parent_id == parent_id,
+            Task.position > position
+        ).values(position=Task.position + 1, version=Task.version + 1),
+        execution_options={'synchronize_session': False}
+    )
+    clone_id = copy_subtree(
+        subtree_ids([task_id]), list_id,
+        root=(task_id, parent_id, position + 1),
+        reset_completed=bool(data.get('reset_completed'))
+    )
+    db.session.commit()
+    tree_cache.invalidate(list_id)
+    tree_indexes.invalidate(list_id)
+
+    clone = db.session.get(Task, clone_id)
+    load_subtree(clone)
+    return versioned(clone.to_dict(include_children=True), 201)
 
 
 @app.route('/api/tasks/<int:task_id>/move', methods=['PUT'])
+@query_budget(7)
 @require_auth
+@grouped
 def move_task(task_id):
     """Move a task to a new parent and/or list.
 
@@ -382,28 +2004,33 @@ def move_task(task_id):
       - Cannot make a task a child of itself or any of its descendants (prevent cycles).
       - When moving across lists, the entire subtree's list_id is updated.
     """
-    task = Task.query.get(task_id)
+    data = request.get_json() or {}
+    # The task and the new parent, each with its list, in one query
+    tasks = load_tasks([task_id, data['parent_id']] if data.get('parent_id') is not None
+                       else [task_id])
+    task = tasks.get(task_id)
 
     if not task:
         return jsonify({'error': 'Task not found'}), 404
 
-    # Verify ownership via current list
     if task.list.user_id != request.current_user_id:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    data = request.get_json() or {}
+    error = check_version(task, data)
+    if error:
+        return error
+
     target_list_id = data.get('list_id', task.list_id)
     target_parent_id = data.get('parent_id') if 'parent_id' in data else task.parent_id
 
-    # Validate target list
-    target_list = TodoList.query.get(target_list_id)
-    if not target_list or target_list.user_id != request.current_user_id:
+    # Validate target list (the task's own list was checked above)
+    if target_list_id != task.list_id and list_owner(target_list_id) != 'owned':
         return jsonify({'error': 'Target list not found or unauthorized'}), 403
 
     # Validate target parent if provided
     target_parent = None
     if target_parent_id is not None:
-        target_parent = Task.query.get(target_parent_id)
+        target_parent = tasks.get(target_parent_id) or db.session.get(Task, target_parent_id)
         if not target_parent:
             return jsonify({'error': 'Target parent task not found'}), 404
         # Parent must be in target list
@@ -411,60 +2038,96 @@ def move_task(task_id):
             return jsonify({'error': 'Target parent must belong to the target list'}), 400
         # Ownership already ensured by list ownership check above
 
-    # Prevent cycles: target parent cannot be the task itself or its descendant
-    def collect_descendant_ids(node: 'Task'):
-        ids = set()
-        stack = list(node.children)
-        while stack:
-            n = stack.pop()
-            ids.add(n.id)
-            stack.extend(n.children)
-        return ids
+    if target_parent_id is not None and target_parent_id == task.id:
+        return jsonify({'error': 'Cannot set a task as its own parent'}), 400
 
-    if target_parent_id is not None:
-        if target_parent_id == task.id:
-            return jsonify({'error': 'Cannot set a task as its own parent'}), 400
-        descendant_ids = collect_descendant_ids(task)
-        if target_parent_id in descendant_ids:
-            return jsonify({'error': 'Cannot move a task under its own descendant'}), 400
-
-    # Apply changes
-    task.parent_id = target_parent_id
-    moving_across_lists = (task.list_id != target_list_id)
-    task.list_id = target_list_id
-
-    # If moving across lists, update subtree list_id as well
-    if moving_across_lists:
-        stack = list(task.children)
-        while stack:
-            n = stack.pop()
-            n.list_id = target_list_id
-            stack.extend(n.children)
-    
-
-    # Insert at specified position (default: end)
-    insert_at = data.get('position')
-    siblings = Task.query.filter_by(
-        list_id=target_list_id,
-        parent_id=target_parent_id
-    ).filter(Task.id != task.id).order_by(Task.position).all()
-    if insert_at is None or not isinstance(insert_at, int) or insert_at < 0 or insert_at > len(siblings):
-        insert_at = len(siblings)
-    # Shift positions of siblings >= insert_at
-    for i, sib in enumerate(siblings):
-        if i >= insert_at:
-            sib.position = i + 1
+    source_list_id = task.list_id
+    moving_across_lists = (source_list_id != target_list_id)
+    with tree_indexes.writing(source_list_id, target_list_id) as section:
+        # The lists' tree indexes, if they know both tasks involved
+        source = section.index(source_list_id)
+        target = section.index(target_list_id)
+        if source is None or task.id not in source or \
+                (target_parent_id is not None and target_parent_id not in target):
+            source = target = None
+
+        # Prevent cycles: target parent cannot be the task's descendant (a
+        # subtree never spans lists, so only same-list moves need checking)
+        if target_parent_id is not None and not moving_across_lists:
+            if source is not None:
+                cycle = source.is_within(target_parent_id, task.id)
+            else:
+                cycle = target_parent_id in set(db.session.scalars(subtree_ids([task.id])))
+            if cycle:
+                section.unchanged(source_list_id)
+                return jsonify({'error': 'Cannot move a task under its own descendant'}), 400
+
+        # Apply changes
+        task.parent_id = target_parent_id
+        task.list_id = target_list_id
+
+        # If moving across lists, update the descendants' list_id as well; the
+        # task itself is updated through the ORM, which checks its version
+        if moving_across_lists:
+            db.session.execute(
+                update(Task).where(Task.id.in_(subtree_ids([task.id])), Task.id != task.id)
+                .values(list_id=target_list_id, version=Task.version + 1),
+                execution_options={'synchronize_session': False}
+            )
+
+        # Insert at specified position (default: end)
+        insert_at = data.get('position')
+        if target is not None:
+            siblings = [(sibling_id, target.position(sibling_id))
+                        for sibling_id in target.children(target_parent_id)
+                        if sibling_id != task.id]
         else:
-            sib.position = i
-    task.position = insert_at
+            siblings = db.session.execute(
+                select(Task.id, Task.position).where(
+                    Task.list_id == target_list_id,
+                    Task.parent_id == target_parent_id,
+                    Task.id != task.id
+                ).order_by(Task.position)
+            ).all()
+        if insert_at is None or not isinstance(insert_at, int) or insert_at < 0 or insert_at > len(siblings):
+            insert_at = len(siblings)
+        # Shift positions of siblings >= insert_at, in one UPDATE
+        positions = {}
+        for i, (sibling_id, sibling_position) in enumerate(siblings):
+            new_position = i + 1 if i >= insert_at else i
+            if sibling_position != new_position:
+                positions[sibling_id] = new_position
+        if positions:
+            db.session.execute(
+                update(Task).where(Task.id.in_(positions)).values(
+                    position=case(positions, value=Task.id),
+                    version=Task.version + 1
+                ),
+                execution_options={'synchronize_session': False}
+            )
+        task.position = insert_at
+        moved_id = task.id
 
-    db.session.commit()
+        db.session.commit()
+        if target is not None:
+            positions[moved_id] = insert_at
+            if moving_across_lists:
+                target.graft(source.remove(moved_id), target_parent_id)
+                target.set_positions(positions)
+            else:
+                target.move(moved_id, target_parent_id, positions)
+            section.applied(source_list_id)
+            section.applied(target_list_id)
+    tree_cache.invalidate(source_list_id, target_list_id)
 
-    return jsonify(task.to_dict(include_children=True)), 200
+    load_subtree(task)
+    return versioned(task.to_dict(include_children=True))
 
 
 @app.route('/api/tasks/<int:task_id>/reorder', methods=['PUT'])
+@query_budget(5)
 @require_auth
+@grouped
 def reorder_task(task_id):
     """Reorder a task among its siblings.
     
@@ -473,74 +2136,202 @@ def reorder_task(task_id):
     
     Swaps position with the previous (up) or next (down) sibling.
     """
-    task = Task.query.get(task_id)
-    
-    if not task:
-        return jsonify({'error': 'Task not found'}), 404
-    
-    if task.list.user_id != request.current_user_id:
-        return jsonify({'error': 'Unauthorized'}), 403
+    task, error = authorize_task(task_id)
+    if error:
+        return error
     
     data = request.get_json() or {}
+    error = check_version(task, data)
+    if error:
+        return error
+    
     direction = data.get('direction')
     
     if direction not in ['up', 'down']:
         return jsonify({'error': 'Direction must be up or down'}), 400
     
-    # Get siblings (same parent and list)
-    siblings = Task.query.filter_by(
-        list_id=task.list_id,
-        parent_id=task.parent_id
-    ).order_by(Task.position).all()
+    list_id = task.list_id
+    with tree_indexes.writing(list_id) as section:
+        index = section.index(list_id)
+        neighbour = None
+        if index is not None and task.id in index:
+            # Only the neighbour is loaded; the index knows the order
+            neighbour_id = index.sibling(task.id, -1 if direction == 'up' else 1)
+            if neighbour_id is not None:
+                neighbour = db.session.get(Task, neighbour_id)
+                if neighbour is None or neighbour.parent_id != task.parent_id:
+                    index = neighbour = None
+        else:
+            index = None
+        if index is None:
+            # Get siblings (same parent and list)
+            siblings = db.session.scalars(
+                select(Task).where(Task.list_id == list_id, Task.parent_id == task.parent_id)
+                .order_by(Task.position)
+            ).all()
+            
+            current_idx = next(
+                (i for i, s in enumerate(siblings) if s.id == task.id),
+                None
+            )
+            if current_idx is None:
+                return jsonify({'error': 'Task not in sibling list'}), 500
+            
+            # Determine swap target
+            if direction == 'up' and current_idx > 0:
+                neighbour = siblings[current_idx - 1]
+            elif direction == 'down' and current_idx < len(siblings) - 1:
+                neighbour = siblings[current_idx + 1]
+        
+        if neighbour is None:
+            section.unchanged(list_id)
+            return jsonify({'message': 'Already at boundary'}), 200
+        
+        # Swap positions
+        task.position, neighbour.position = neighbour.position, task.position
+        positions = {task_id: task.position, neighbour.id: neighbour.position}
+        
+        db.session.commit()
+        if index is not None:
+            index.set_positions(positions)
+            section.applied(list_id)
+    tree_cache.invalidate(list_id)
+    
+    load_subtree(task)
+    return versioned(task.to_dict(include_children=True))
+
+
+@app.route('/api/tasks/<int:task_id>/children/order', methods=['PUT'])
+@query_budget(4)
+@require_auth
+@grouped
+def order_children(task_id):
+    """Set the order of a task's children in one call.
     
-    current_idx = next(
-        (i for i, s in enumerate(siblings) if s.id == task.id),
-        None
-    )
-    if current_idx is None:
-        return jsonify({'error': 'Task not in sibling list'}), 500
+    Payload JSON:
+      - order: every child id of the task, in the new order
+    """
+    task, error = authorize_task(task_id)
+    if error:
+        return error
     
-    # Determine swap target
-    swap_idx = None
-    if direction == 'up' and current_idx > 0:
-        swap_idx = current_idx - 1
-    elif direction == 'down' and current_idx < len(siblings) - 1:
-        swap_idx = current_idx + 1
+    data = request.get_json() or {}
+    list_id = task.list_id
+    with tree_indexes.writing(list_id) as section:
+        index = section.index(list_id)
+        if index is not None and task_id not in index:
+            index = None
+        error = set_sibling_order(list_id, task_id, data.get('order'), index)
+        if error:
+            return error
+        
+        db.session.commit()
+        if index is not None:
+            index.set_positions({child_id: i for i, child_id in enumerate(data['order'])})
+            section.applied(list_id)
+    tree_cache.invalidate(list_id)
+    
+    load_subtree(task)
+    return versioned(task.to_dict(include_children=True))
+
+
+@app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+@query_budget(4)
+@require_auth
+@grouped
+def delete_task(task_id):
+    """Delete a task (and all its children).
     
-    if swap_idx is None:
-        return jsonify({'message': 'Already at boundary'}), 200
+    With ?async=1 the subtree is deleted by a background job instead and the
+    response is 202 with the job.
+    """
+    task, error = authorize_task(task_id)
+    if error:
+        return error
+    
+    error = check_version(task)
+    if error:
+        return error
+    
+    if request.args.get('async') == '1':
+        return accepted(job_runner.submit(
+            request.current_user_id, 'delete_subtree', task_id=task_id
+        ))
+    
+    list_id = task.list_id
+    claim_version(task)
+    with tree_indexes.writing(list_id) as section:
+        db.session.execute(
+            delete(Task).where(Task.id.in_(subtree_ids([task_id]))),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        index = section.index(list_id, load=False)
+        if index is not None and task_id in index:
+            index.remove(task_id)
+            section.applied(list_id)
+    tree_cache.invalidate(list_id)
+    
+    return jsonify({'message': 'Task deleted successfully'}), 200
+
+
+# ==================== Job Routes ====================
+
+@app.route('/api/jobs', methods=['GET'])
+@query_budget(1)
+@require_auth
+def get_jobs():
+    """Get the current user's most recent jobs"""
+    jobs = db.session.scalars(
+        select(Job).where(Job.user_id == request.current_user_id)
+        .order_by(Job.id.desc()).limit(50)
+    ).all()
+    return jsonify([job.to_dict() for job in jobs]), 200
+
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+@query_budget(1)
+@require_auth
+def get_job(job_id):
+    """Get a job's status, progress and, once finished, its result"""
+    job = db.session.get(Job, job_id)
     
-    # Swap positions
-    siblings[current_idx].position, siblings[swap_idx].position = \
-        siblings[swap_idx].position, siblings[current_idx].position
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
     
-    db.session.commit()
+    if job.user_id != request.current_user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    return jsonify(task.to_dict(include_children=True)), 200
+    return jsonify(job.to_dict(include_result=True)), 200
 
 
-@app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+@query_budget(3)
 @require_auth
-def delete_task(task_id):
-    """Delete a task (and all its children)"""
-    task = Task.query.get(task_id)
+def cancel_job(job_id):
+    """Cancel a job.
     
-    if not task:
-        return jsonify({'error': 'Task not found'}), 404
+    Queued jobs are cancelled at once (200). Running jobs stop at their next
+    checkpoint (202). Finished jobs cannot be cancelled (409).
+    """
+    job = db.session.get(Job, job_id)
     
-    # Verify ownership
-    if task.list.user_id != request.current_user_id:
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job.user_id != request.current_user_id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    db.session.delete(task)
-    db.session.commit()
+    if not job_runner.cancel(job):
+        return jsonify({'error': f'Job already {job.status}'}), 409
     
-    return jsonify({'message': 'Task deleted successfully'}), 200
+    return jsonify(job.to_dict()), 200 if job.status == 'cancelled' else 202
 
 
 # ==================== Initialize Database ====================
 
 @app.route('/api/health', methods=['GET'])
+@query_budget(0)
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'ok'}), 200
@@ -549,4 +2340,5 @@ def health_check():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        shard_router.create_all()
     app.run(debug=True, port=5000)
@@ -0,0 +1,537 @@
+"""
+In-process benchmark suite for the Flask backend.
+
+Generates a synthetic dataset in a throwaway SQLite file, then drives every
+route in app.py through the Flask test client (no network, no live server)
+and reports per-route p50/p99 latency, SQL statements per call and peak
+allocation per call.
+
+Usage:
+    python benchmarks/bench.py run --preset small --output base.json
+    python benchmarks/bench.py run --preset large --only get_lists,move_task
+    python benchmarks/bench.py compare base.json new.json --threshold 0.10
+
+`compare` exits with status 1 when any route regressed.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datagen  # noqa: E402
+
+# Latency regressions smaller than this are treated as noise
+NOISE_FLOOR_MS = 0.05
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Bench:
+    """Holds the app, dataset and helpers shared by all scenarios"""
+
+    def __init__(self, app_module, summary, seed):
+        self.mod = app_module
+        self.app = app_module.app
+        self.client = self.app.test_client()
+        self.summary = summary
+        self.rng = random.Random(seed)
+        self.user_id = next(iter(summary['users']))
+        self.username = None
+        self.list_id = summary['users'][self.user_id][0]
+        self.task_ids = list(summary['lists'][self.list_id]['tasks'])
+        with self.app.app_context():
+            self.username = self.mod.db.session.get(self.mod.User, self.user_id).username
+            self.headers = self.auth_headers(self.user_id)
+        # Logging out everywhere must not revoke the bench user's own token
+        self.other_user_id = next((u for u in summary['users'] if u != self.user_id), None)
+        if self.other_user_id is None:
+            self.other_user_id = self.client.post('/api/register', json={
+                'username': self.next_name('bench_other'), 'password': 'pw'
+            }).get_json()['user']['id']
+        self.statements = 0
+        self.counter = 0
+
+    def auth_headers(self, user_id):
+        """Headers carrying a freshly issued token for the user"""
+        with self.app.app_context():
+            return {'Authorization': f'Bearer {self.mod.generate_token(user_id)}'}
+
+    def next_name(self, prefix):
+        self.counter += 1
+        return f'{prefix}_{os.getpid()}_{self.counter}'
+
+    def random_task(self):
+        return self.rng.choice(self.task_ids)
+
+    def wait_for_jobs(self, timeout=60):
+        """Wait until the bench user has no unfinished jobs, so job scenarios
+        stay under the per-user limit"""
+        mod = self.mod
+        deadline = time.time() + timeout
+        with self.app.app_context():
+            while mod.Job.query.filter(
+                mod.Job.user_id == self.user_id, mod.Job.status.in_(['queued', 'running'])
+            ).count() and time.time() < deadline:
+                mod.db.session.rollback()
+                time.sleep(0.005)
+
+    def scratch_list(self, tasks=0, completed_ratio=0.0, shape='skewed', fanout=4):
+        """Create a list for the bench user outside the timed section"""
+        mod = self.mod
+        with self.app.app_context():
+            todo_list = mod.TodoList(name=self.next_name('scratch'), user_id=self.user_id)
+            mod.db.session.add(todo_list)
+            mod.db.session.flush()
+            ids = []
+            parents = datagen.tree_parents(tasks, shape, self.rng, fanout=fanout)
+            positions = {}
+            for i, parent in enumerate(parents):
+                parent_id = None if parent is None else ids[parent]
+                position = positions.get(parent_id, 0)
+                positions[parent_id] = position + 1
+                completed = self.rng.random() < completed_ratio
+                task = mod.Task(
+                    title=f'Scratch {i}', list_id=todo_list.id, parent_id=parent_id,
+                    position=position, completed=completed,
+                    completed_at=datetime.utcnow() if completed else None
+                )
+                mod.db.session.add(task)
+                mod.db.session.flush()
+                ids.append(task.id)
+            mod.db.session.commit()
+            return todo_list.id, ids
+
+
+# Each scenario: name -> (prepare(bench) -> state, call(bench, state) -> response)
+# prepare runs outside the timed section.
+
+def _no_prepare(bench):
+    return None
+
+
+def _archived_list(bench):
+    """A scratch list with archived subtrees, created once per run"""
+    if not hasattr(bench, 'archived_list_id'):
+        bench.archived_list_id = bench.scratch_list(tasks=200, completed_ratio=0.3)[0]
+        bench.client.post(f'/api/lists/{bench.archived_list_id}/archive',
+                          json={'older_than_days': 0}, headers=bench.headers)
+    return bench.archived_list_id
+
+
+def _archived_subtree(bench):
+    """Archive a fresh 20-task subtree and return its archive id"""
+    list_id = bench.scratch_list(tasks=20, completed_ratio=1.0, shape='balanced')[0]
+    bench.client.post(f'/api/lists/{list_id}/archive',
+                      json={'older_than_days': 0}, headers=bench.headers)
+    return bench.client.get(
+        f'/api/lists/{list_id}/archive', headers=bench.headers
+    ).get_json()['items'][0]['id']
+
+
+def _finished_job(bench):
+    bench.wait_for_jobs()
+    job_id = bench.client.post(
+        f'/api/lists/{bench.list_id}/export', headers=bench.headers
+    ).get_json()['id']
+    bench.wait_for_jobs()
+    return job_id
+
+
+def _queued_job(bench):
+    """A queued job row that no worker will pick up"""
+    mod = bench.mod
+    with bench.app.app_context():
+        job = mod.Job(user_id=bench.user_id, kind='export_list', status='queued',
+                      params=json.dumps({'list_id': bench.list_id}))
+        mod.db.session.add(job)
+        mod.db.session.commit()
+        return job.id
+
+
+def _import_tree(bench):
+    bench.wait_for_jobs()
+    return [
+        {'title': f'Imported {i}', 'completed': i % 3 == 0,
+         'children': [{'title': f'Imported {i}.{j}'} for j in range(4)]}
+        for i in range(10)
+    ]
+
+
+def _fresh_leaf(bench):
+    response = bench.client.post(
+        '/api/tasks', json={'title': 'leaf', 'list_id': bench.list_id},
+        headers=bench.headers
+    )
+    return response.get_json()['id']
+
+
+SCENARIOS = {
+    'health_check': (
+        _no_prepare,
+        lambda b, s: b.client.get('/api/health'),
+    ),
+    'register': (
+        lambda b: b.next_name('bench_reg'),
+        lambda b, name: b.client.post(
+            '/api/register', json={'username': name, 'password': 'pw'}
+        ),
+    ),
+    'login': (
+        _no_prepare,
+        lambda b, s: b.client.post(
+            '/api/login', json={'username': b.username, 'password': b.summary['password']}
+        ),
+    ),
+    'get_lists': (
+        _no_prepare,
+        lambda b, s: b.client.get('/api/lists', headers=b.headers),
+    ),
+    'get_lists_flat': (
+        _no_prepare,
+        lambda b, s: b.client.get('/api/lists?format=flat', headers=b.headers),
+    ),
+    'get_lists_columnar': (
+        _no_prepare,
+        lambda b, s: b.client.get('/api/lists?format=columnar', headers=b.headers),
+    ),
+    'create_list': (
+        _no_prepare,
+        lambda b, s: b.client.post('/api/lists', json={'name': 'new'}, headers=b.headers),
+    ),
+    'update_list': (
+        _no_prepare,
+        lambda b, s: b.client.put(
+            f'/api/lists/{b.list_id}', json={'name': b.next_name('list')}, headers=b.headers
+        ),
+    ),
+    'delete_list': (
+        lambda b: b.scratch_list(tasks=50)[0],
+        lambda b, list_id: b.client.delete(f'/api/lists/{list_id}', headers=b.headers),
+    ),
+    'clear_completed': (
+        lambda b: b.scratch_list(tasks=50, completed_ratio=0.3)[0],
+        lambda b, list_id: b.client.delete(
+            f'/api/lists/{list_id}/completed', headers=b.headers
+        ),
+    ),
+    'create_task': (
+        lambda b: b.random_task(),
+        lambda b, parent_id: b.client.post(
+            '/api/tasks', json={'title': 'new', 'list_id': b.list_id, 'parent_id': parent_id},
+            headers=b.headers
+        ),
+    ),
+    'update_task': (
+        lambda b: b.random_task(),
+        lambda b, task_id: b.client.put(
+            f'/api/tasks/{task_id}', json={'title': 'renamed'}, headers=b.headers
+        ),
+    ),
+    'update_subtree': (
+        lambda b: b.random_task(),
+        lambda b, task_id: b.client.put(
+            f'/api/tasks/{task_id}/subtree', json={'collapsed': False}, headers=b.headers
+        ),
+    ),
+    'move_task': (
+        lambda b: (_fresh_leaf(b), b.random_task()),
+        lambda b, s: b.client.put(
+            f'/api/tasks/{s[0]}/move', json={'parent_id': s[1]}, headers=b.headers
+        ),
+    ),
+    'reorder_task': (
+        lambda b: (b.random_task(), b.rng.choice(['up', 'down'])),
+        lambda b, s: b.client.put(
+            f'/api/tasks/{s[0]}/reorder', json={'direction': s[1]}, headers=b.headers
+        ),
+    ),
+    # Reverse the order of 200 top-level tasks in one call
+    'order_list': (
+        lambda b: b.scratch_list(tasks=200, shape='wide'),
+        lambda b, s: b.client.put(
+            f'/api/lists/{s[0]}/order', json={'order': s[1][::-1]}, headers=b.headers
+        ),
+    ),
+    # Reverse the order of 200 children of one task
+    'order_children': (
+        lambda b: b.scratch_list(tasks=201, shape='balanced', fanout=200)[1],
+        lambda b, ids: b.client.put(
+            f'/api/tasks/{ids[0]}/children/order', json={'order': ids[1:][::-1]},
+            headers=b.headers
+        ),
+    ),
+    'get_subtree': (
+        lambda b: b.random_task(),
+        lambda b, task_id: b.client.get(f'/api/tasks/{task_id}/subtree', headers=b.headers),
+    ),
+    'delete_task': (
+        lambda b: b.scratch_list(tasks=20, shape='balanced')[1][0],
+        lambda b, task_id: b.client.delete(f'/api/tasks/{task_id}', headers=b.headers),
+    ),
+    # Clones the preset's list, so `--preset wide` measures a 5k-task copy
+    'clone_list': (
+        _no_prepare,
+        lambda b, s: b.client.post(f'/api/lists/{b.list_id}/clone', headers=b.headers),
+    ),
+    'clone_task': (
+        lambda b: b.scratch_list(tasks=100, shape='deep')[1][0],
+        lambda b, task_id: b.client.post(f'/api/tasks/{task_id}/clone', headers=b.headers),
+    ),
+    'archive_list': (
+        lambda b: b.scratch_list(tasks=50, completed_ratio=0.3)[0],
+        lambda b, list_id: b.client.post(
+            f'/api/lists/{list_id}/archive', json={'older_than_days': 0}, headers=b.headers
+        ),
+    ),
+    'get_archive': (
+        _archived_list,
+        lambda b, list_id: b.client.get(f'/api/lists/{list_id}/archive', headers=b.headers),
+    ),
+    'restore_archived': (
+        _archived_subtree,
+        lambda b, archive_id: b.client.post(
+            f'/api/archive/{archive_id}/restore', headers=b.headers
+        ),
+    ),
+    # Job scenarios time the submission only; prepare waits for earlier jobs
+    'renumber_list': (
+        lambda b: b.wait_for_jobs(),
+        lambda b, s: b.client.post(f'/api/lists/{b.list_id}/renumber', headers=b.headers),
+    ),
+    'export_list': (
+        lambda b: b.wait_for_jobs(),
+        lambda b, s: b.client.post(f'/api/lists/{b.list_id}/export', headers=b.headers),
+    ),
+    'import_list': (
+        _import_tree,
+        lambda b, tasks: b.client.post(
+            '/api/lists/import', json={'name': 'imported', 'tasks': tasks}, headers=b.headers
+        ),
+    ),
+    'get_jobs': (
+        _no_prepare,
+        lambda b, s: b.client.get('/api/jobs', headers=b.headers),
+    ),
+    'get_job': (
+        _finished_job,
+        lambda b, job_id: b.client.get(f'/api/jobs/{job_id}', headers=b.headers),
+    ),
+    'cancel_job': (
+        _queued_job,
+        lambda b, job_id: b.client.post(f'/api/jobs/{job_id}/cancel', headers=b.headers),
+    ),
+    'logout': (
+        lambda b: b.auth_headers(b.user_id),
+        lambda b, headers: b.client.post('/api/logout', headers=headers),
+    ),
+    'logout_all': (
+        lambda b: b.auth_headers(b.other_user_id),
+        lambda b, headers: b.client.post('/api/logout/all', headers=headers),
+    ),
+    'metrics': (
+        _no_prepare,
+        lambda b, s: b.client.get('/metrics'),
+    ),
+}
+
+
+def run_scenario(bench, name, iterations, warmup, alloc_iterations):
+    """Time one scenario and return its result row"""
+    prepare, call = SCENARIOS[name]
+    latencies = []
+    queries = []
+    errors = 0
+
+    for i in range(warmup + iterations):
+        state = prepare(bench)
+        before = bench.statements
+        started = time.perf_counter()
+        response = call(bench, state)
+        elapsed = (time.perf_counter() - started) * 1000
+        if i < warmup:
+            continue
+        if response.status_code >= 400:
+            errors += 1
+        latencies.append(elapsed)
+        queries.append(bench.statements - before)
+
+    # Allocation pass: tracemalloc slows everything down, so it runs separately
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_iterations):
+            state = prepare(bench)
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            call(bench, state)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 4),
+        'p99_ms': round(percentile(latencies, 99), 4),
+        'mean_ms': round(statistics.fmean(latencies), 4),
+        'queries_per_call': round(statistics.fmean(queries), 2),
+        'alloc_peak_kb': round(statistics.median(peaks) / 1024, 1) if peaks else None,
+    }
+
+
+def cmd_run(args):
+    users, lists_per_user, tasks_per_list, shape = datagen.PRESETS[args.preset]
+    users = args.users or users
+    lists_per_user = args.lists or lists_per_user
+    tasks_per_list = args.tasks or tasks_per_list
+    shape = args.shape or shape
+
+    workdir = tempfile.mkdtemp(prefix='todo-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    # /metrics is off by default; the metrics scenario scrapes it without a token
+    os.environ['METRICS_ENABLED'] = '1'
+    os.environ.pop('METRICS_TOKEN', None)
+    import app as app_module
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    with app_module.app.app_context():
+        app_module.db.create_all()
+        started = time.perf_counter()
+        summary = datagen.generate(
+            app_module.db, app_module.User, app_module.TodoList, app_module.Task,
+            users=users, lists_per_user=lists_per_user, tasks_per_list=tasks_per_list,
+            shape=shape, seed=args.seed,
+        )
+        generated_in = time.perf_counter() - started
+    print(f'Generated {users} users x {lists_per_user} lists x {tasks_per_list} '
+          f'{shape} tasks in {generated_in:.1f}s')
+
+    bench = Bench(app_module, summary, args.seed)
+
+    def count_statement(*_):
+        bench.statements += 1
+    event.listen(Engine, 'after_cursor_execute', count_statement)
+
+    names = args.only.split(',') if args.only else list(SCENARIOS)
+    results = {}
+    print(f'{"route":<18}{"p50 ms":>10}{"p99 ms":>10}{"queries":>10}{"alloc KB":>10}{"errors":>8}')
+    for name in names:
+        iterations = args.iterations
+        if name in ('register', 'login'):
+            # Password hashing dominates; a handful of samples is enough
+            iterations = min(iterations, 10)
+        row = run_scenario(bench, name, iterations, args.warmup, args.alloc_iterations)
+        results[name] = row
+        print(f'{name:<18}{row["p50_ms"]:>10.3f}{row["p99_ms"]:>10.3f}'
+              f'{row["queries_per_call"]:>10.1f}{row["alloc_peak_kb"] or 0:>10.1f}'
+              f'{row["errors"]:>8}')
+
+    report = {
+        'meta': {
+            'preset': args.preset,
+            'users': users,
+            'lists_per_user': lists_per_user,
+            'tasks_per_list': tasks_per_list,
+            'shape': shape,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'created_at': datetime.utcnow().isoformat(),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Saved results to {args.output}')
+    return 0
+
+
+def compare(base, new, threshold):
+    """Return (rows, regressed) comparing two result files' routes"""
+    rows = []
+    regressed = False
+    for name, after in new['results'].items():
+        before = base['results'].get(name)
+        if before is None:
+            continue
+        flags = []
+        for metric in ('p50_ms', 'p99_ms'):
+            delta = after[metric] - before[metric]
+            if delta > NOISE_FLOOR_MS and delta > before[metric] * threshold:
+                flags.append(metric)
+        if after['queries_per_call'] > before['queries_per_call']:
+            flags.append('queries')
+        if flags:
+            regressed = True
+        rows.append((name, before, after, flags))
+    return rows, regressed
+
+
+def cmd_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if base['meta'].get('preset') != new['meta'].get('preset'):
+        print('warning: comparing runs of different presets')
+
+    rows, regressed = compare(base, new, args.threshold)
+    print(f'{"route":<18}{"p50 ms":>20}{"p99 ms":>20}{"queries":>14}  flags')
+    for name, before, after, flags in rows:
+        print(f'{name:<18}'
+              f'{before["p50_ms"]:>9.3f} ->{after["p50_ms"]:>7.3f}'
+              f'{before["p99_ms"]:>11.3f} ->{after["p99_ms"]:>7.3f}'
+              f'{before["queries_per_call"]:>7.1f} ->{after["queries_per_call"]:>5.1f}'
+              f'  {"REGRESSION: " + ", ".join(flags) if flags else ""}')
+    return 1 if regressed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='run the benchmark suite')
+    run.add_argument('--preset', choices=sorted(datagen.PRESETS), default='small')
+    run.add_argument('--users', type=int, help='override the preset user count')
+    run.add_argument('--lists', type=int, help='override lists per user')
+    run.add_argument('--tasks', type=int, help='override tasks per list')
+    run.add_argument('--shape', choices=datagen.SHAPES, help='override the tree shape')
+    run.add_argument('--iterations', type=int, default=200)
+    run.add_argument('--warmup', type=int, default=10)
+    run.add_argument('--alloc-iterations', type=int, default=20)
+    run.add_argument('--only', help='comma-separated route names to run')
+    run.add_argument('--seed', type=int, default=1)
+    run.add_argument('--output', help='write results JSON to this file')
+    run.set_defaults(func=cmd_run)
+
+    cmp_ = sub.add_parser('compare', help='compare two result files')
+    cmp_.add_argument('base')
+    cmp_.add_argument('new')
+    cmp_.add_argument('--threshold', type=float, default=0.10,
+                      help='relative latency increase flagged as a regression')
+    cmp_.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Synthetic dataset generator for benchmarks.
+
+Builds users, lists and task trees of a chosen shape directly with bulk
+INSERTs (no per-row ORM overhead), so datasets of 100k tasks load in seconds.
+
+Tree shapes:
+  - wide:     every task is top-level
+  - deep:     a single chain, each task the child of the previous one
+  - balanced: complete tree with a fixed fan-out
+  - skewed:   preferential attachment - a few tasks get most of the children,
+              like real outlines with one huge project and many small ones
+"""
+
+import random
+from datetime import datetime
+
+from sqlalchemy import insert
+
+SHAPES = ('wide', 'deep', 'balanced', 'skewed')
+
+# Named presets: (users, lists per user, tasks per list, shape)
+PRESETS = {
+    'small': (10, 3, 100, 'skewed'),
+    'wide': (2, 1, 5000, 'wide'),
+    'deep': (2, 1, 250, 'deep'),
+    'balanced': (2, 2, 5000, 'balanced'),
+    'large': (4, 1, 25000, 'skewed'),
+}
+
+
+def tree_parents(n, shape, rng, fanout=4, root_ratio=0.05):
+    """Return the parent index (or None) of each of `n` tasks in insertion order"""
+    if shape == 'wide':
+        return [None] * n
+    if shape == 'deep':
+        return [None] + list(range(n - 1))
+    if shape == 'balanced':
+        return [None if i == 0 else (i - 1) // fanout for i in range(n)]
+    if shape == 'skewed':
+        parents = []
+        # Every task enters the pool once, plus once more per child it gets,
+        # so popular parents keep attracting children.
+        pool = []
+        for i in range(n):
+            if not pool or rng.random() < root_ratio:
+                parents.append(None)
+            else:
+                parent = rng.choice(pool)
+                parents.append(parent)
+                pool.append(parent)
+            pool.append(i)
+        return parents
+    raise ValueError(f'Unknown tree shape: {shape}')
+
+
+def generate(db, User, TodoList, Task, users=10, lists_per_user=3,
+             tasks_per_list=100, shape='skewed', seed=1, completed_ratio=0.3,
+             password='bench-password'):
+    """Populate the database and return a summary of what was created.
+
+    The summary maps each user id to its list ids, and each list id to
+    its task ids (insertion order) and parent indices.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    # Hashing is deliberately slow; every synthetic user shares one hash
+    template = User(username='template')
+    template.set_password(password)
+
+    user_rows = [
+        {'username': f'bench_user_{seed}_{u}', 'password_hash': template.password_hash,
+         'created_at': now}
+        for u in range(users)
+    ]
+    db.session.execute(insert(User), user_rows)
+    user_ids = [
+        row.id for row in db.session.query(User.id)
+        .filter(User.username.in_([r['username'] for r in user_rows]))
+        .order_by(User.id)
+    ]
+
+    next_list_id = (db.session.query(db.func.max(TodoList.id)).scalar() or 0) + 1
+    next_task_id = (db.session.query(db.func.max(Task.id)).scalar() or 0) + 1
+
+    summary = {'users': {}, 'lists': {}, 'password': password}
+    list_rows = []
+    task_rows = []
+    for user_id in user_ids:
+        summary['users'][user_id] = []
+        for l in range(lists_per_user):
+            list_id = next_list_id
+            next_list_id += 1
+            list_rows.append({'id': list_id, 'name': f'List {l}', 'user_id': user_id,
+                              'created_at': now})
+            summary['users'][user_id].append(list_id)
+
+            parents = tree_parents(tasks_per_list, shape, rng)
+            ids = list(range(next_task_id, next_task_id + tasks_per_list))
+            next_task_id += tasks_per_list
+            positions = {}
+            for i, parent in enumerate(parents):
+                parent_id = None if parent is None else ids[parent]
+                position = positions.get(parent_id, 0)
+                positions[parent_id] = position + 1
+                task_rows.append({
+                    'id': ids[i],
+                    'title': f'Task {i}',
+                    'completed': rng.random() < completed_ratio,
+                    'collapsed': False,
+                    'list_id': list_id,
+                    'parent_id': parent_id,
+                    'position': position,
+                    'created_at': now,
+                })
+            summary['lists'][list_id] = {'tasks': ids, 'parents': parents}
+
+    db.session.execute(insert(TodoList), list_rows)
+    for start in range(0, len(task_rows), 5000):
+        db.session.execute(insert(Task), task_rows[start:start + 5000])
+    db.session.commit()
+    return summary
@@ -0,0 +1,258 @@
+"""
+Concurrent load-generation harness for the Flask backend.
+
+Starts the app on a threaded WSGI server against a local SQLite file, then
+replays a mixed read/write workload from many simulated users at once:
+fetching lists, creating tasks, toggling completion, drag-moves and
+reorders. For each workload mix it reports throughput, tail latency per
+operation, HTTP errors, client retries and `database is locked` errors
+(counted server-side via SQLAlchemy's handle_error event).
+
+Usage:
+    python benchmarks/loadgen.py --concurrency 16 --duration 10
+    python benchmarks/loadgen.py --mix write-heavy --concurrency 32 --output load.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datagen  # noqa: E402
+from bench import percentile  # noqa: E402
+
+OPERATIONS = ('fetch', 'create', 'toggle', 'move', 'reorder')
+
+# Relative operation weights per workload mix
+MIXES = {
+    'read-heavy': {'fetch': 90, 'create': 4, 'toggle': 4, 'move': 1, 'reorder': 1},
+    'balanced': {'fetch': 50, 'create': 20, 'toggle': 15, 'move': 10, 'reorder': 5},
+    'write-heavy': {'fetch': 10, 'create': 35, 'toggle': 25, 'move': 20, 'reorder': 10},
+}
+
+RETRY_STATUSES = frozenset([429, 500, 503])
+
+
+class LockCounter:
+    """Counts `database is locked` errors raised anywhere in the engine"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, context):
+        if 'database is locked' in str(context.original_exception):
+            with self._lock:
+                self.count += 1
+
+
+class SimulatedUser:
+    """One client: its token, its list and the task ids it knows about"""
+
+    def __init__(self, base_url, token, list_id, task_ids, rng, max_retries):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {token}'
+        self.list_id = list_id
+        self.task_ids = list(task_ids)
+        self.rng = rng
+        self.max_retries = max_retries
+        self.retries = 0
+
+    def request(self, method, path, payload=None):
+        """Send a request, retrying transient failures with jittered backoff"""
+        for attempt in range(self.max_retries + 1):
+            response = self.session.request(method, self.base_url + path, json=payload)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            self.retries += 1
+            delay = float(response.headers.get('Retry-After', 0)) or 0.01 * 2 ** attempt
+            time.sleep(min(delay, 1.0) * (0.5 + self.rng.random()))
+        return response
+
+    def run(self, op):
+        task_ids = self.task_ids
+        if op == 'fetch' or not task_ids:
+            return self.request('GET', '/api/lists')
+        if op == 'create':
+            parent = self.rng.choice(task_ids + [None])
+            response = self.request('POST', '/api/tasks', {
+                'title': 'load', 'list_id': self.list_id, 'parent_id': parent
+            })
+            if response.status_code == 201:
+                task_ids.append(response.json()['id'])
+            return response
+        task_id = self.rng.choice(task_ids)
+        if op == 'toggle':
+            return self.request('PUT', f'/api/tasks/{task_id}',
+                                {'completed': self.rng.random() < 0.5})
+        if op == 'move':
+            # Moving onto a random task may be rejected as a cycle (400); that
+            # still exercises the full validation path.
+            target = self.rng.choice(task_ids + [None])
+            return self.request('PUT', f'/api/tasks/{task_id}/move', {'parent_id': target})
+        return self.request('PUT', f'/api/tasks/{task_id}/reorder',
+                            {'direction': self.rng.choice(['up', 'down'])})
+
+
+def start_server(app):
+    """Serve the app on an ephemeral port in a daemon thread"""
+    from werkzeug.serving import make_server
+    # Per-request access logging would dominate the output and the timings
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def prepare_users(app_module, count, tasks_per_user, seed):
+    """Create one user with one list per simulated client"""
+    with app_module.app.app_context():
+        summary = datagen.generate(
+            app_module.db, app_module.User, app_module.TodoList, app_module.Task,
+            users=count, lists_per_user=1, tasks_per_list=tasks_per_user,
+            shape='skewed', seed=seed,
+        )
+        return [
+            (app_module.generate_token(user_id), list_ids[0],
+             summary['lists'][list_ids[0]]['tasks'])
+            for user_id, list_ids in summary['users'].items()
+        ]
+
+
+def run_mix(base_url, users, mix, duration, seed, max_retries, lock_counter):
+    """Drive all simulated users concurrently for `duration` seconds"""
+    ops, weights = zip(*MIXES[mix].items())
+    samples = {op: [] for op in OPERATIONS}
+    statuses = {}
+    results_lock = threading.Lock()
+    clients = [
+        SimulatedUser(base_url, token, list_id, task_ids, random.Random(seed + i), max_retries)
+        for i, (token, list_id, task_ids) in enumerate(users)
+    ]
+    start_barrier = threading.Barrier(len(clients) + 1)
+    locked_before = lock_counter.count
+
+    def worker(client):
+        local = []
+        start_barrier.wait()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            op = client.rng.choices(ops, weights)[0]
+            started = time.perf_counter()
+            response = client.run(op)
+            local.append((op, (time.perf_counter() - started) * 1000, response.status_code))
+        with results_lock:
+            for op, elapsed, status in local:
+                samples[op].append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in clients]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(v) for v in samples.values())
+    everything = [ms for values in samples.values() for ms in values]
+    return {
+        'mix': mix,
+        'concurrency': len(clients),
+        'duration_s': round(elapsed, 2),
+        'requests': total,
+        'throughput_rps': round(total / elapsed, 1),
+        'p50_ms': round(percentile(everything, 50), 2) if everything else None,
+        'p99_ms': round(percentile(everything, 99), 2) if everything else None,
+        'operations': {
+            op: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 50), 2),
+                'p95_ms': round(percentile(values, 95), 2),
+                'p99_ms': round(percentile(values, 99), 2),
+            }
+            for op, values in samples.items() if values
+        },
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'server_errors': sum(v for k, v in statuses.items() if k >= 500),
+        'retries': sum(c.retries for c in clients),
+        'database_locked': lock_counter.count - locked_before,
+    }
+
+
+def print_result(result):
+    print(f"\n== {result['mix']} x{result['concurrency']} users, {result['duration_s']}s ==")
+    print(f"throughput {result['throughput_rps']} req/s, p50 {result['p50_ms']} ms, "
+          f"p99 {result['p99_ms']} ms")
+    print(f"5xx {result['server_errors']}, retries {result['retries']}, "
+          f"database is locked {result['database_locked']}, statuses {result['statuses']}")
+    print(f'{"op":<10}{"count":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for op, row in result['operations'].items():
+        print(f'{op:<10}{row["count"]:>8}{row["p50_ms"]:>10.2f}{row["p95_ms"]:>10.2f}'
+              f'{row["p99_ms"]:>10.2f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent load harness')
+    parser.add_argument('--mix', action='append', choices=sorted(MIXES),
+                        help='workload mix to run (repeatable; default: all)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='number of simulated users issuing requests at once')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per mix')
+    parser.add_argument('--tasks', type=int, default=50, help='initial tasks per user')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='client retries on 429/500/503')
+    parser.add_argument('--db', help='SQLite file to use (default: a temp file)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results JSON to this file')
+    args = parser.parse_args(argv)
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='todo-load-'), 'load.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(db_path)
+    import app as app_module
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    lock_counter = LockCounter()
+    event.listen(Engine, 'handle_error', lock_counter)
+    with app_module.app.app_context():
+        app_module.db.create_all()
+
+    server = start_server(app_module.app)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    print(f'Serving on {base_url} with database {db_path}')
+
+    results = []
+    try:
+        for i, mix in enumerate(args.mix or list(MIXES)):
+            users = prepare_users(app_module, args.concurrency, args.tasks, args.seed * 1000 + i)
+            result = run_mix(base_url, users, mix, args.duration, args.seed,
+                             args.retries, lock_counter)
+            print_result(result)
+            results.append(result)
+    finally:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'database': db_path, 'results': results}, f, indent=2)
+        print(f'\nSaved results to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
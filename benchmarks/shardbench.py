@@ -0,0 +1,202 @@
+"""
+Write-throughput benchmark for user sharding.
+
+For each shard count, starts the backend in a fresh subprocess
+(SHARD_COUNT=n) on a new set of SQLite files, served by `--workers`
+forked processes sharing one listening socket. It registers simulated users
+(the shard directory spreads them over the shards), gives each a list with
+a few tasks, then has every user create and toggle tasks as fast as it can.
+Reports successful writes per second and tail latency for each shard
+count, plus the speedup over the first count.
+
+Usage:
+    python benchmarks/shardbench.py --shards 1,2,4 --concurrency 16 --duration 10
+    python benchmarks/shardbench.py --shards 1,4 --workers 8 --dir /mnt/disk --output shards.json
+
+Put `--dir` on the disk you deploy on: the gain comes from commits (and
+their fsyncs) on different files proceeding in parallel, so it needs
+several worker processes and CPU cores. A single process is bound by the
+GIL long before the file lock.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench import percentile  # noqa: E402
+from loadgen import SimulatedUser  # noqa: E402
+
+WRITE_OPS = ('create', 'toggle')
+
+
+def start_workers(app_module, workers):
+    """Serve the app from `workers` forked processes on one listening socket"""
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    # Children must open their own SQLite connections
+    with app_module.app.app_context():
+        for engine in app_module.db.engines.values():
+            engine.dispose()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    return server.server_port, pids
+
+
+def stop_workers(pids):
+    for pid in pids:
+        os.kill(pid, signal.SIGTERM)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+
+def prepare_users(base_url, count, tasks_per_user):
+    """Register users through the API so each gets a shard assignment"""
+    users = []
+    for i in range(count):
+        token = requests.post(f'{base_url}/api/register', json={
+            'username': f'shard_bench_{i}', 'password': 'bench'
+        }).json()['token']
+        headers = {'Authorization': f'Bearer {token}'}
+        list_id = requests.post(f'{base_url}/api/lists', json={'name': 'bench'},
+                                headers=headers).json()['id']
+        task_ids = [
+            requests.post(f'{base_url}/api/tasks', json={'title': f't{k}', 'list_id': list_id},
+                          headers=headers).json()['id']
+            for k in range(tasks_per_user)
+        ]
+        users.append((token, list_id, task_ids))
+    return users
+
+
+def drive(base_url, users, duration, seed):
+    """Issue writes from all users at once for `duration` seconds"""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(users) + 1)
+
+    def worker(index, token, list_id, task_ids):
+        client = SimulatedUser(base_url, token, list_id, task_ids,
+                               random.Random(seed + index), max_retries=0)
+        local = []
+        barrier.wait()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = client.run(client.rng.choice(WRITE_OPS))
+            local.append(((time.perf_counter() - started) * 1000, response.status_code))
+        with lock:
+            for elapsed, status in local:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(i, *user)) for i, user in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    ok = sum(count for status, count in statuses.items() if status < 400)
+    return {
+        'duration_s': round(elapsed, 2),
+        'writes': ok,
+        'writes_per_s': round(ok / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+    }
+
+
+def run_one(shards, args):
+    """Benchmark one shard count in this process and print the result as JSON"""
+    directory = tempfile.mkdtemp(prefix=f'todo-shards{shards}-', dir=args.dir)
+    os.environ['SHARD_COUNT'] = str(shards)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directory, 'bench.db')
+    import app as app_module
+    app_module.app.logger.setLevel(logging.ERROR)
+    with app_module.app.app_context():
+        app_module.db.create_all()
+        app_module.shard_router.create_all()
+
+    port, pids = start_workers(app_module, args.workers)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        users = prepare_users(base_url, args.concurrency, args.tasks)
+        result = drive(base_url, users, args.duration, args.seed)
+    finally:
+        stop_workers(pids)
+    result.update({'shards': shards, 'workers': args.workers,
+                   'concurrency': args.concurrency, 'database': directory})
+    print(json.dumps(result))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write throughput vs shard count')
+    parser.add_argument('--shards', default='1,2,4',
+                        help='comma-separated shard counts to compare')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='number of simulated users writing at once')
+    parser.add_argument('--workers', type=int, default=4, help='server processes')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per shard count')
+    parser.add_argument('--tasks', type=int, default=5, help='initial tasks per user')
+    parser.add_argument('--dir', help='directory for the database files (default: temp)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results JSON to this file')
+    parser.add_argument('--run-one', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one is not None:
+        run_one(args.run_one, args)
+        return 0
+
+    results = []
+    for shards in (int(n) for n in args.shards.split(',')):
+        command = [sys.executable, os.path.abspath(__file__), '--run-one', str(shards),
+                   '--concurrency', str(args.concurrency), '--workers', str(args.workers),
+                   '--duration', str(args.duration),
+                   '--tasks', str(args.tasks), '--seed', str(args.seed)]
+        if args.dir:
+            command += ['--dir', args.dir]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    base = results[0]['writes_per_s'] or 1
+    print(f'{"shards":>6}{"writes/s":>12}{"speedup":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for row in results:
+        print(f'{row["shards"]:>6}{row["writes_per_s"]:>12.1f}{row["writes_per_s"] / base:>9.2f}x'
+              f'{row["p50_ms"]:>10.2f}{row["p99_ms"]:>10.2f}{row["errors"]:>8}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'concurrency': args.concurrency, 'workers': args.workers,
+                       'results': results}, f, indent=2)
+        print(f'\nSaved results to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
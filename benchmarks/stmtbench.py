@@ -0,0 +1,213 @@
+"""
+CPU cost of SQL compilation on the hot routes.
+
+Drives a set of routes through the Flask test client (see bench.py) twice,
+each time in a fresh subprocess: once with SQLAlchemy's compiled statement
+cache on (DB_QUERY_CACHE_SIZE, default 500) and once with it disabled
+(DB_QUERY_CACHE_SIZE=0). Reports CPU time per request for both runs, the
+CPU saved per request and the cache hit ratio of the cached run.
+
+The cached run also times the hot lookups on their own, written as legacy
+`Model.query` calls, as the 2.0-style statements app.py uses and as lambda
+statements (`lambda_stmt`), which were measured slower than plain
+statements for lookups this simple.
+
+Usage:
+    python benchmarks/stmtbench.py --preset small --iterations 300
+    python benchmarks/stmtbench.py --only get_lists,create_task --output stmt.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+from sqlalchemy import func, lambda_stmt, select
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datagen  # noqa: E402
+from bench import SCENARIOS, Bench  # noqa: E402
+
+ROUTES = 'login,get_lists,create_task,update_task,reorder_task,move_task,delete_task'
+
+# Models of the imported app; lambda statements must refer to them as
+# globals (closure variables would become part of the cache key)
+Task = TodoList = User = None
+LOOKUP_VARIANTS = ('legacy_us', 'select_us', 'lambda_us')
+
+
+def cpu_per_call(bench, name, iterations, warmup):
+    """Median CPU microseconds per call of one scenario"""
+    prepare, call = SCENARIOS[name]
+    samples = []
+    for i in range(warmup + iterations):
+        state = prepare(bench)
+        started = time.process_time()
+        call(bench, state)
+        if i >= warmup:
+            samples.append((time.process_time() - started) * 1e6)
+    return statistics.median(samples)
+
+
+def lookup_variants(mod, bench):
+    """name -> (legacy call, select call, lambda call) for the hot lookups"""
+    global Task, TodoList, User
+    Task, TodoList, User = mod.Task, mod.TodoList, mod.User
+    session = mod.db.session
+    user_id, list_id, username = bench.user_id, bench.list_id, bench.username
+    return {
+        'list_by_id': (
+            lambda: TodoList.query.get(list_id),
+            lambda: session.get(TodoList, list_id),
+            lambda: session.scalars(lambda_stmt(
+                lambda: select(TodoList).where(TodoList.id == list_id)
+            )).first(),
+        ),
+        'lists_of_user': (
+            lambda: TodoList.query.filter_by(user_id=user_id).all(),
+            lambda: session.scalars(select(TodoList).where(TodoList.user_id == user_id)).all(),
+            lambda: session.scalars(lambda_stmt(
+                lambda: select(TodoList).where(TodoList.user_id == user_id)
+            )).all(),
+        ),
+        'user_by_name': (
+            lambda: User.query.filter_by(username=username).first(),
+            lambda: session.scalars(
+                select(User).where(User.username == username).limit(1)
+            ).first(),
+            lambda: session.scalars(lambda_stmt(
+                lambda: select(User).where(User.username == username).limit(1)
+            )).first(),
+        ),
+        'max_sibling_position': (
+            lambda: max(t.position for t in
+                        Task.query.filter_by(list_id=list_id, parent_id=None).all()),
+            lambda: session.scalar(select(func.max(Task.position)).where(
+                Task.list_id == list_id, Task.parent_id.is_(None))),
+            lambda: session.scalar(lambda_stmt(
+                lambda: select(func.max(Task.position)).where(
+                    Task.list_id == list_id, Task.parent_id.is_(None))
+            )),
+        ),
+    }
+
+
+def time_lookups(mod, bench, iterations):
+    """Median CPU microseconds of each lookup in each style"""
+    rows = {}
+    with bench.app.app_context(), warnings.catch_warnings():
+        # Query.get() warns on every call
+        warnings.simplefilter('ignore')
+        for name, calls in lookup_variants(mod, bench).items():
+            result = {}
+            for label, fn in zip(LOOKUP_VARIANTS, calls):
+                for _ in range(20):
+                    fn()
+                    mod.db.session.expunge_all()
+                samples = []
+                for _ in range(iterations):
+                    started = time.process_time()
+                    fn()
+                    samples.append((time.process_time() - started) * 1e6)
+                    mod.db.session.expunge_all()
+                result[label] = round(statistics.median(samples), 1)
+            rows[name] = result
+    return rows
+
+
+def run_one(cache_size, args):
+    """Benchmark one cache size in this process and print the result as JSON"""
+    users, lists_per_user, tasks_per_list, shape = datagen.PRESETS[args.preset]
+    workdir = tempfile.mkdtemp(prefix='todo-stmt-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['DB_QUERY_CACHE_SIZE'] = str(cache_size)
+    # The statement cache hit/miss counters are only kept with metrics on
+    os.environ['METRICS_ENABLED'] = '1'
+    import app as mod
+    with mod.app.app_context():
+        mod.db.create_all()
+        summary = datagen.generate(
+            mod.db, mod.User, mod.TodoList, mod.Task, users=users,
+            lists_per_user=lists_per_user, tasks_per_list=tasks_per_list,
+            shape=shape, seed=args.seed,
+        )
+        mod.revocations.load()
+    bench = Bench(mod, summary, args.seed)
+
+    routes = {}
+    before = mod.metrics.snapshot()
+    for name in args.only.split(','):
+        iterations = min(args.iterations, 10) if name == 'login' else args.iterations
+        routes[name] = round(cpu_per_call(bench, name, iterations, args.warmup), 1)
+    after = mod.metrics.snapshot()
+    hits = after['sql_cache_hits'] - before['sql_cache_hits']
+    misses = after['sql_cache_misses'] - before['sql_cache_misses']
+    result = {
+        'cache_size': cache_size,
+        'routes_cpu_us': routes,
+        'cache_hits': hits,
+        'cache_misses': misses,
+    }
+    if cache_size:
+        result['lookups'] = time_lookups(mod, bench, args.iterations)
+    print(json.dumps(result))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='CPU saved by the SQL statement cache')
+    parser.add_argument('--preset', default='small', choices=sorted(datagen.PRESETS))
+    parser.add_argument('--only', default=ROUTES, help='comma-separated scenarios')
+    parser.add_argument('--iterations', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--cache-size', type=int, default=500,
+                        help='DB_QUERY_CACHE_SIZE of the cached run')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results JSON to this file')
+    parser.add_argument('--run-one', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one is not None:
+        run_one(args.run_one, args)
+        return 0
+
+    results = []
+    for cache_size in (args.cache_size, 0):
+        command = [sys.executable, os.path.abspath(__file__), '--run-one', str(cache_size),
+                   '--preset', args.preset, '--only', args.only,
+                   '--iterations', str(args.iterations), '--warmup', str(args.warmup),
+                   '--seed', str(args.seed)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    cached, uncached = results
+
+    print(f'{"route":<16}{"cached us":>12}{"uncached us":>13}{"saved us":>10}{"saved":>8}')
+    for name, on in cached['routes_cpu_us'].items():
+        off = uncached['routes_cpu_us'][name]
+        print(f'{name:<16}{on:>12.1f}{off:>13.1f}{off - on:>10.1f}{(off - on) / off:>8.1%}')
+    total = cached['cache_hits'] + cached['cache_misses']
+    print(f'\nstatement cache: {cached["cache_hits"]} hits, {cached["cache_misses"]} misses '
+          f'({cached["cache_hits"] / (total or 1):.1%} hit ratio)')
+
+    print(f'\n{"lookup":<22}{"legacy us":>11}{"select us":>11}{"lambda us":>11}{"saved":>8}')
+    for name, row in cached['lookups'].items():
+        saved = (row['legacy_us'] - row['select_us']) / row['legacy_us']
+        print(f'{name:<22}{row["legacy_us"]:>11.1f}{row["select_us"]:>11.1f}'
+              f'{row["lambda_us"]:>11.1f}{saved:>8.1%}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'preset': args.preset, 'cached': cached, 'uncached': uncached}, f, indent=2)
+        print(f'\nSaved results to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Read/write session routing.
+
+With SQLite in WAL mode, readers run concurrently with the single writer, so
+read traffic does not need to compete with writes for the same connections.
+When enabled, the app gets two engines:
+
+- the default bind (writer): a small pool used for every write and for any
+  read that is not safe to serve from the reader;
+- the `reader` bind: its own pool, opened read-only (`mode=ro`) unless
+  READ_DATABASE_URL points somewhere else (e.g. a replica).
+
+RoutingSession sends SELECTs issued during GET/HEAD requests to the reader.
+Flushes, DML statements and everything outside a request (jobs, sweeps) use
+the writer. Read-your-writes: every commit made while serving a user stamps
+a per-user commit marker, and that user's reads go to the writer until
+DB_READ_YOUR_WRITES_SECONDS have passed.
+
+Configure before creating the SQLAlchemy instance:
+
+    configure_routing(app)
+    db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+    router = ReadRouter(app, db)
+"""
+
+import threading
+import time
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+READ_METHODS = frozenset(['GET', 'HEAD'])
+
+
+def reader_url(url):
+    """Read-only variant of a SQLite URL: `sqlite:///file:<path>?mode=ro&uri=true`"""
+    url = make_url(url)
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        return url
+    return url.set(database=f'file:{url.database}').update_query_dict(
+        {'mode': 'ro', 'uri': 'true'}
+    )
+
+
+def configure_routing(app, read_url=None):
+    """Add the writer pool options and the `reader` bind to the app config"""
+    if not app.config.get('DB_ROUTING_ENABLED', False):
+        return
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('pool_size', app.config.get('DB_WRITE_POOL_SIZE', 2))
+    options.setdefault('max_overflow', 0)
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds['reader'] = {
+        'url': read_url or reader_url(app.config['SQLALCHEMY_DATABASE_URI']),
+        'pool_size': app.config.get('DB_READ_POOL_SIZE', 10),
+        'max_overflow': app.config.get('DB_READ_MAX_OVERFLOW', 10),
+    }
+
+
+class RoutingSession(Session):
+    """Session that serves reads of GET/HEAD requests from the `reader` bind,
+    sends statements on sharded tables to the current shard and joins the
+    writer connection of a group commit (see groupcommit.py)"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shards = current_app.extensions.get('shard_router')
+        if bind is None and shards is not None:
+            # Sharded tables go to the current user's shard (see sharding.py)
+            bind = shards.get_bind(mapper, clause)
+        if bind is None and not self._flushing and \
+                (clause is None or getattr(clause, 'is_select', False)):
+            router = current_app.extensions.get('db_router')
+            if router is not None and router.use_reader():
+                return self._db.engines['reader']
+        bind = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        group = current_app.extensions.get('group_commit')
+        if group is not None:
+            # Grouped operations write through the group's shared connection
+            return group.connection_for(bind) or bind
+        return bind
+
+
+class ReadRouter:
+    """Decides per query whether the reader may serve it; tracks commit markers"""
+
+    def __init__(self, app=None, db=None):
+        self._markers = {}
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.window = 0.0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """Register with the app and put the writer database in WAL mode"""
+        self.enabled = app.config.get('DB_ROUTING_ENABLED', False)
+        self.window = app.config.get('DB_READ_YOUR_WRITES_SECONDS', 2.0)
+        if not self.enabled:
+            return
+        app.extensions['db_router'] = self
+        event.listen(RoutingSession, 'after_commit', self._after_commit)
+        with app.app_context():
+            writer = db.engines[None]
+        if writer.dialect.name == 'sqlite':
+            event.listen(writer, 'connect', _enable_wal)
+
+    def use_reader(self):
+        """True for queries issued while serving a read request that may be stale"""
+        if not has_request_context() or request.method not in READ_METHODS:
+            return False
+        user_id = getattr(request, 'current_user_id', None)
+        if user_id is None:
+            return True
+        stamp = self._markers.get(user_id)
+        return stamp is None or time.monotonic() - stamp > self.window
+
+    def mark(self, user_id):
+        """Route the user's reads to the writer for the next `window` seconds"""
+        now = time.monotonic()
+        with self._lock:
+            self._markers[user_id] = now
+            if len(self._markers) > 10000:
+                self._markers = {
+                    uid: stamp for uid, stamp in self._markers.items()
+                    if now - stamp <= self.window
+                }
+
+    def _after_commit(self, session):
+        if has_request_context():
+            user_id = getattr(request, 'current_user_id', None)
+            if user_id is not None:
+                self.mark(user_id)
+
+
+def _enable_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
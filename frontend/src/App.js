@@ -4,6 +4,7 @@
  */
 
 import React, { useState, useEffect } from 'react';
+import axios from 'axios';
 import './App.css';
 import Auth from './components/Auth';
 import TodoApp from './components/TodoApp';
@@ -34,9 +35,12 @@ function App() {
   };
 
   /**
-   * Handle logout
+   * Handle logout (the token is revoked on the server too)
    */
   const handleLogout = () => {
+    axios.post('/api/logout', null, {
+      headers: { Authorization: `Bearer ${token}` }
+    }).catch(() => {});
     setToken(null);
     setUser(null);
     localStorage.removeItem('token');
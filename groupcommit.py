@@ -0,0 +1,238 @@
+"""
+Group commit for mutating requests.
+
+Every mutating route commits on its own, and with SQLite every commit is a
+separate fsync taken under the database's single write lock. Under bursts
+of writes most of the time goes to queueing for that lock. With
+GROUP_COMMIT_ENABLED=1, views decorated with `@grouped` run on a dedicated
+writer thread per database engine instead:
+
+- the writer takes the first waiting operation, gathers whatever else
+  arrives within GROUP_COMMIT_WINDOW_MS (at most GROUP_COMMIT_MAX_OPS
+  operations), runs them one after another in a single transaction and
+  commits once;
+- each operation runs inside its own SAVEPOINT. An operation that raises is
+  rolled back to its savepoint without affecting the others in the group;
+- the view's own `db.session.commit()` only releases a nested savepoint
+  (the session joins the writer's connection), so each request still
+  answers only after its group has committed. If the group commit fails,
+  every operation in it fails.
+
+Views run in a copy of the request's context (request, g, current shard),
+blocking the request thread until their group commits. Side effects that
+must not happen before the data is durable (cache invalidation, starting
+jobs) go through `GroupCommitter.deferred`, which postpones them until the
+group has committed; in-memory changes made early are undone through
+`GroupCommitter.on_failure`. Statements executed on the writer thread are not
+counted by the per-request query budgets.
+"""
+
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import wraps
+
+from flask import current_app
+
+_current_op = contextvars.ContextVar('group_commit_op', default=None)
+
+
+def grouped(f):
+    """Run the view through the group-commit writer when it is enabled.
+
+    Apply it below `@require_auth`, so authentication and rate limiting
+    still happen on the request thread.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        committer = current_app.extensions.get('group_commit')
+        if committer is None or _current_op.get() is not None:
+            return f(*args, **kwargs)
+        return committer.run(f, *args, **kwargs)
+    return decorated_function
+
+
+class _Operation:
+    """One view call waiting for, or running in, a group"""
+
+    __slots__ = ('call', 'context', 'future', 'connection', 'deferred', 'failed', 'result',
+                 'error')
+
+    def __init__(self, call, context):
+        self.call = call
+        self.context = context
+        self.future = Future()
+        self.connection = None
+        self.deferred = []
+        self.failed = []
+        self.result = None
+        self.error = None
+
+
+class GroupCommitter:
+    """Writer threads that batch operations into shared transactions"""
+
+    def __init__(self, app=None, db=None, engine=None):
+        self._lock = threading.Lock()
+        self._queues = {}
+        self.enabled = False
+        self.groups = 0
+        self.operations = 0
+        if app is not None:
+            self.init_app(app, db, engine)
+
+    def init_app(self, app, db, engine=None):
+        """Bind to the app. `engine()` returns the engine the current request
+        writes to (defaults to the main database)."""
+        self.app = app
+        self.db = db
+        self.engine = engine or (lambda: db.engine)
+        self.enabled = app.config.get('GROUP_COMMIT_ENABLED', False)
+        self.window = app.config.get('GROUP_COMMIT_WINDOW_MS', 2) / 1000
+        self.max_ops = app.config.get('GROUP_COMMIT_MAX_OPS', 64)
+        if self.enabled:
+            app.extensions['group_commit'] = self
+
+    def run(self, f, *args, **kwargs):
+        """Run `f` in the next group and return its result once committed"""
+        op = _Operation(lambda: f(*args, **kwargs), contextvars.copy_context())
+        self._queue_for(self.engine()).put(op)
+        return op.future.result()
+
+    def deferred(self, fn):
+        """Wrap `fn` so that calls made inside a grouped operation run after
+        the group commits (and not at all if the operation fails)"""
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            op = _current_op.get()
+            if op is None:
+                return fn(*args, **kwargs)
+            op.deferred.append((fn, args, kwargs))
+        return wrapper
+
+    def on_failure(self, fn):
+        """Wrap `fn` so that calls made inside a grouped operation run if the
+        operation or its group fails; elsewhere the calls are dropped. Use it
+        to undo in-memory changes made before the commit."""
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            op = _current_op.get()
+            if op is not None:
+                op.failed.append((fn, args, kwargs))
+        return wrapper
+
+    def connection_for(self, engine):
+        """The writer connection the current operation must use for `engine`"""
+        op = _current_op.get()
+        if op is not None and op.connection is not None and op.connection.engine is engine:
+            return op.connection
+        return None
+
+    # ---------- writer ----------
+
+    def _queue_for(self, engine):
+        with self._lock:
+            ops = self._queues.get(engine)
+            if ops is None:
+                ops = self._queues[engine] = queue.Queue()
+                threading.Thread(target=self._loop, args=(engine, ops), daemon=True,
+                                 name='group-commit').start()
+            return ops
+
+    def _loop(self, engine, ops):
+        while True:
+            first = ops.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_ops:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    op = ops.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if op is None:
+                    ops.put(None)
+                    break
+                batch.append(op)
+            self._commit_group(engine, batch)
+
+    def _commit_group(self, engine, batch):
+        try:
+            with engine.connect() as conn:
+                transaction = conn.begin()
+                if engine.dialect.name == 'sqlite':
+                    # pysqlite only opens a transaction before DML; without an
+                    # explicit BEGIN the first RELEASE SAVEPOINT would commit
+                    conn.exec_driver_sql('BEGIN IMMEDIATE')
+                for op in batch:
+                    savepoint = conn.begin_nested()
+                    op.connection = conn
+                    try:
+                        op.context.run(self._execute, op)
+                    except Exception as exc:  # noqa: BLE001 - fails this operation only
+                        savepoint.rollback()
+                        op.error = exc
+                    else:
+                        savepoint.commit()
+                    op.connection = None
+                transaction.commit()
+        except Exception as exc:  # noqa: BLE001 - the group commit itself failed
+            self.app.logger.exception('Group commit of %d operations failed', len(batch))
+            for op in batch:
+                if op.error is None:
+                    op.error = exc
+        with self._lock:
+            self.groups += 1
+            self.operations += len(batch)
+        for op in batch:
+            if op.error is not None:
+                for fn, args, kwargs in op.failed:
+                    try:
+                        op.context.run(fn, *args, **kwargs)
+                    except Exception:  # noqa: BLE001 - report the operation's own error
+                        self.app.logger.exception('Failure handler after group commit failed')
+                op.future.set_exception(op.error)
+                continue
+            for fn, args, kwargs in op.deferred:
+                try:
+                    op.context.run(fn, *args, **kwargs)
+                except Exception:  # noqa: BLE001 - the data is committed regardless
+                    self.app.logger.exception('Deferred call after group commit failed')
+            op.future.set_result(op.result)
+
+    def _execute(self, op):
+        """Run one operation; called inside a copy of the request's context"""
+        token = _current_op.set(op)
+        session = self.db.session
+        # Start from a clean session so it joins the writer's connection
+        session.close()
+        try:
+            op.result = op.call()
+        finally:
+            session.close()
+            _current_op.reset(token)
+
+    def metrics_lines(self):
+        """Exposition lines for the /metrics endpoint"""
+        with self._lock:
+            groups, operations = self.groups, self.operations
+        return [
+            '# HELP todo_group_commits_total Transactions committed by the group-commit writers.',
+            '# TYPE todo_group_commits_total counter',
+            f'todo_group_commits_total {groups}',
+            '# HELP todo_group_commit_operations_total Operations executed in group commits.',
+            '# TYPE todo_group_commit_operations_total counter',
+            f'todo_group_commit_operations_total {operations}',
+        ]
+
+    def shutdown(self):
+        """Let the writers finish queued operations and exit"""
+        with self._lock:
+            for ops in self._queues.values():
+                ops.put(None)
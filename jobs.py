@@ -0,0 +1,319 @@
+"""
+In-process background job runner.
+
+Expensive operations are recorded as rows in the `jobs` table and executed
+on a bounded thread pool, so request handlers can answer `202 Accepted`
+immediately and clients poll `GET /api/jobs/<id>`.
+
+- Concurrency: at most JOBS_MAX_WORKERS jobs run at once, and at most
+  JOBS_PER_USER of them belong to the same user. Further jobs wait in a
+  per-user queue and start as slots free up.
+- Progress: handlers report `(done, total)` through their JobContext. Live
+  progress is kept in memory (a running handler may hold a write
+  transaction) and persisted when the job finishes.
+- Cancellation: cooperative. Queued jobs are cancelled immediately; running
+  handlers see the request the next time they call `ctx.check_cancelled()`.
+- Crash recovery: `recover()` re-queues jobs left queued or running by a
+  previous process, giving up on a job after JOBS_MAX_ATTEMPTS starts.
+  Queued jobs may be scheduled by several processes; the atomic claim
+  lets exactly one of them run it.
+
+`Sweeper` runs periodic maintenance (such as archiving) on its own daemon
+thread in small batches, so it never holds the write lock for long.
+
+Handlers are plain functions registered with `@runner.handler('kind')` and
+called as `handler(ctx, **params)` inside an app context. Their return
+value is stored as the job's JSON result, encoded with the app's JSON
+provider (so results may be deeply nested trees). Because jobs can be
+retried after a crash, handlers must be safe to run again.
+"""
+
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+
+from sqlalchemy import and_, or_, update
+
+TERMINAL_STATUSES = frozenset(['succeeded', 'failed', 'cancelled'])
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled"""
+
+
+class JobContext:
+    """Handle passed to job handlers for progress and cancellation"""
+
+    def __init__(self, runner, job_id, user_id):
+        self._runner = runner
+        self.job_id = job_id
+        self.user_id = user_id
+
+    def progress(self, done, total=None):
+        """Report progress; cheap enough to call per batch"""
+        self._runner._progress[self.job_id] = (done, total)
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested"""
+        if self.job_id in self._runner._cancel_requests:
+            raise JobCancelled()
+
+
+class JobRunner:
+    """Bounded thread pool executing persisted jobs"""
+
+    def __init__(self, app=None, db=None, model=None, scope=None, defer=None):
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._running = {}
+        self._waiting = {}
+        self._progress = {}
+        self._cancel_requests = set()
+        self._finished = {}
+        self._executor = None
+        self.app = None
+        if app is not None:
+            self.init_app(app, db, model, scope, defer)
+
+    def init_app(self, app, db, model, scope=None, defer=None):
+        """Bind to the app, its SQLAlchemy instance and the Job model.
+
+        `scope(user_id)`, if given, returns a context manager entered around
+        each job of that user (e.g. to select the user's database shard).
+        `defer(fn)`, if given, wraps the call that schedules a submitted job,
+        for callers whose commit takes effect later (group commit).
+        """
+        self.app = app
+        self.db = db
+        self.model = model
+        self.scope = scope or (lambda user_id: nullcontext())
+        self._schedule = defer(self._enqueue) if defer else self._enqueue
+        self.max_workers = app.config.get('JOBS_MAX_WORKERS', 4)
+        self.per_user = app.config.get('JOBS_PER_USER', 2)
+        self.max_queued = app.config.get('JOBS_MAX_QUEUED_PER_USER', 20)
+        self.max_attempts = app.config.get('JOBS_MAX_ATTEMPTS', 3)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix='job'
+        )
+
+    def handler(self, kind):
+        """Register a function as the handler for a job kind"""
+        def decorator(f):
+            self._handlers[kind] = f
+            return f
+        return decorator
+
+    # ---------- submission ----------
+
+    def submit(self, user_id, kind, **params):
+        """Persist a new job and schedule it. Returns the Job, or None if the
+        user already has too many unfinished jobs."""
+        if kind not in self._handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        Job = self.model
+        unfinished = Job.query.filter(
+            Job.user_id == user_id, Job.status.in_(['queued', 'running'])
+        ).count()
+        if unfinished >= self.max_queued:
+            return None
+        job = Job(user_id=user_id, kind=kind, params=json.dumps(params), status='queued')
+        self.db.session.add(job)
+        self.db.session.commit()
+        self._schedule(job.id, user_id)
+        return job
+
+    def cancel(self, job):
+        """Request cancellation. Returns False if the job already finished."""
+        if job.status in TERMINAL_STATUSES:
+            return False
+        job.cancel_requested = True
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            job.finished_at = datetime.utcnow()
+            with self._lock:
+                self._finished['cancelled'] = self._finished.get('cancelled', 0) + 1
+        job_id = job.id
+        self.db.session.commit()
+        self._cancel_requests.add(job_id)
+        return True
+
+    def live_progress(self, job_id):
+        """In-memory (done, total) for a job running in this process, if any"""
+        return self._progress.get(job_id)
+
+    def recover(self, started_before=None):
+        """Re-queue jobs a previous process left unfinished. Call at startup
+        inside an app context, after the tables exist.
+
+        When several processes share the table, pass the time this process
+        started as `started_before`: only jobs claimed before then count as
+        interrupted, so jobs that running siblings claimed since are left alone.
+        """
+        Job = self.model
+        interrupted = Job.status == 'running'
+        if started_before is not None:
+            interrupted = and_(interrupted, or_(
+                Job.started_at.is_(None), Job.started_at < started_before
+            ))
+        for job in Job.query.filter(or_(Job.status == 'queued', interrupted)) \
+                .order_by(Job.id).all():
+            if job.cancel_requested:
+                job.status = 'cancelled'
+            elif job.attempts >= self.max_attempts:
+                job.status = 'failed'
+                job.error = 'Gave up after repeated interruptions'
+            else:
+                job.status = 'queued'
+                continue
+            job.finished_at = datetime.utcnow()
+        self.db.session.commit()
+        for job in Job.query.filter_by(status='queued').order_by(Job.id).all():
+            self._enqueue(job.id, job.user_id)
+
+    # ---------- scheduling ----------
+
+    def _enqueue(self, job_id, user_id):
+        with self._lock:
+            if self._running.get(user_id, 0) >= self.per_user:
+                self._waiting.setdefault(user_id, deque()).append(job_id)
+                return
+            self._running[user_id] = self._running.get(user_id, 0) + 1
+        self._executor.submit(self._run, job_id, user_id)
+
+    def _release(self, user_id):
+        with self._lock:
+            waiting = self._waiting.get(user_id)
+            if waiting:
+                next_id = waiting.popleft()
+                if not waiting:
+                    del self._waiting[user_id]
+            else:
+                next_id = None
+                self._running[user_id] -= 1
+                if not self._running[user_id]:
+                    del self._running[user_id]
+        if next_id is not None:
+            self._executor.submit(self._run, next_id, user_id)
+
+    def _run(self, job_id, user_id):
+        try:
+            with self.app.app_context(), self.scope(user_id):
+                self._execute(job_id, user_id)
+        finally:
+            self._progress.pop(job_id, None)
+            self._cancel_requests.discard(job_id)
+            self._release(user_id)
+
+    def _execute(self, job_id, user_id):
+        db = self.db
+        Job = self.model
+        # Claim the job atomically so a concurrent cancel cannot be overwritten
+        claimed = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+                status='running', started_at=datetime.utcnow(), attempts=Job.attempts + 1
+            )
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return
+        job = db.session.get(Job, job_id)
+
+        ctx = JobContext(self, job_id, user_id)
+        handler = self._handlers[job.kind]
+        try:
+            ctx.check_cancelled()
+            result = handler(ctx, **json.loads(job.params or '{}'))
+        except JobCancelled:
+            db.session.rollback()
+            status, result, error = 'cancelled', None, None
+        except Exception as exc:  # noqa: BLE001 - any failure fails the job
+            db.session.rollback()
+            self.app.logger.exception('Job %s (%s) failed', job_id, job.kind)
+            status, result, error = 'failed', None, str(exc)
+        else:
+            status, error = 'succeeded', None
+
+        job = db.session.get(self.model, job_id)
+        job.status = status
+        job.result = self.app.json.dumps(result) if result is not None else None
+        job.error = error
+        done, total = self._progress.get(job_id, (job.progress_done, job.progress_total))
+        if status == 'succeeded' and total is not None:
+            done = total
+        job.progress_done, job.progress_total = done, total
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        with self._lock:
+            self._finished[status] = self._finished.get(status, 0) + 1
+
+    def metrics_lines(self):
+        """Exposition lines for the /metrics endpoint"""
+        with self._lock:
+            running = sum(self._running.values())
+            waiting = sum(len(q) for q in self._waiting.values())
+            finished = dict(self._finished)
+        lines = [
+            '# HELP todo_jobs_running Jobs executing or waiting for a worker thread.',
+            '# TYPE todo_jobs_running gauge',
+            f'todo_jobs_running {running}',
+            '# HELP todo_jobs_waiting Jobs held back by the per-user concurrency limit.',
+            '# TYPE todo_jobs_waiting gauge',
+            f'todo_jobs_waiting {waiting}',
+            '# HELP todo_jobs_finished_total Jobs finished, by final status.',
+            '# TYPE todo_jobs_finished_total counter',
+        ]
+        for status in sorted(TERMINAL_STATUSES):
+            lines.append(f'todo_jobs_finished_total{{status="{status}"}} {finished.get(status, 0)}')
+        return lines
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and optionally wait for running jobs"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+class Sweeper:
+    """Runs an incremental sweep on a daemon thread.
+
+    `step(cursor)` processes one batch after `cursor` (None at the start of
+    a pass) inside an app context and returns the cursor to resume from, or
+    None once the pass is complete. Batches run `pause` seconds apart;
+    passes start every `interval` seconds.
+    """
+
+    def __init__(self, app, step, interval, pause=0.05):
+        self.app = app
+        self.step = step
+        self.interval = interval
+        self.pause = pause
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start sweeping in the background"""
+        # A thread started before a fork is not running in the child
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, daemon=True,
+                                            name='sweeper')
+            self._thread.start()
+
+    def stop(self):
+        """Stop after the current batch"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        cursor = None
+        while not self._stop.wait(self.interval if cursor is None else self.pause):
+            try:
+                with self.app.app_context():
+                    cursor = self.step(cursor)
+            except Exception:  # noqa: BLE001 - keep sweeping on the next pass
+                self.app.logger.exception('Sweep step failed')
+                cursor = None
@@ -0,0 +1,288 @@
+"""
+Prometheus-style metrics for the Flask backend.
+
+Collects per-route request counts, latency and response-size histograms,
+SQL statement counts and SQL time (via SQLAlchemy engine events), compiled
+statement cache hits and misses, commit counts and auth outcomes, and serves them at `GET /metrics` in the
+Prometheus text exposition format.
+
+Metrics are off unless METRICS_ENABLED is set. The exposition reveals
+per-route traffic and auth failures, so with METRICS_TOKEN set a scrape
+must send `Authorization: Bearer <METRICS_TOKEN>` (Prometheus'
+`authorization` / `bearer_token` scrape settings); other requests get 403.
+
+Counters are sharded per thread: each worker thread only ever writes to its
+own shard, so the hot path takes no locks. A scrape sums all shards.
+"""
+
+import hmac
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    """Fixed-bucket histogram; `counts[i]` holds observations <= bounds[i]."""
+
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+
+
+class RouteStats:
+    """Everything recorded for one (route, method) pair"""
+
+    __slots__ = ('statuses', 'latency', 'size', 'sql', 'sql_seconds')
+
+    def __init__(self):
+        self.statuses = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.sql = Histogram(SQL_COUNT_BUCKETS)
+        self.sql_seconds = 0.0
+
+    def merge(self, other):
+        for status, n in list(other.statuses.items()):
+            self.statuses[status] = self.statuses.get(status, 0) + n
+        self.latency.merge(other.latency)
+        self.size.merge(other.size)
+        self.sql.merge(other.sql)
+        self.sql_seconds += other.sql_seconds
+
+
+class Shard:
+    """Per-thread counters. Only the owning thread ever writes to its shard."""
+
+    __slots__ = ('routes', 'sql_statements', 'sql_seconds', 'sql_cache_hits',
+                 'sql_cache_misses', 'commits', 'auth_checks', 'auth_failures', 'current')
+
+    def __init__(self):
+        self.routes = {}
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.sql_cache_hits = 0
+        self.sql_cache_misses = 0
+        self.commits = 0
+        self.auth_checks = 0
+        self.auth_failures = 0
+        # [statement count, sql seconds] for the request running on this thread
+        self.current = None
+
+
+class Metrics:
+    """Registry of sharded counters plus the Flask/SQLAlchemy hooks feeding it"""
+
+    def __init__(self, app=None):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._collectors = []
+        self.token = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Install request hooks, engine events and the /metrics route"""
+        if not app.config.get('METRICS_ENABLED', False):
+            return
+        self.token = app.config.get('METRICS_TOKEN') or None
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.render_view, methods=['GET'])
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(Engine, 'commit', self._on_commit)
+
+    def register_collector(self, collector):
+        """Add a callable returning extra exposition lines at scrape time"""
+        self._collectors.append(collector)
+
+    # ---------- recording ----------
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def count_auth(self, ok):
+        """Record the outcome of an authentication check"""
+        shard = self._shard()
+        shard.auth_checks += 1
+        if not ok:
+            shard.auth_failures += 1
+
+    def _before_request(self):
+        shard = self._shard()
+        shard.current = [0, 0.0]
+        request.environ['todo.metrics_start'] = time.perf_counter()
+
+    def _after_request(self, response):
+        started = request.environ.get('todo.metrics_start')
+        shard = self._shard()
+        current = shard.current
+        shard.current = None
+        if started is None or current is None:
+            return response
+
+        key = (request.endpoint or 'unmatched', request.method)
+        stats = shard.routes.get(key)
+        if stats is None:
+            stats = shard.routes[key] = RouteStats()
+        status = response.status_code
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.latency.observe(time.perf_counter() - started)
+        stats.size.observe(response.content_length or 0)
+        stats.sql.observe(current[0])
+        stats.sql_seconds += current[1]
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_start', None)
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        shard = self._shard()
+        shard.sql_statements += 1
+        shard.sql_seconds += elapsed
+        # Statements without a cache key (raw SQL, PRAGMAs) count as neither
+        cache_hit = getattr(context, 'cache_hit', None)
+        if cache_hit is CACHE_HIT:
+            shard.sql_cache_hits += 1
+        elif cache_hit is CACHE_MISS:
+            shard.sql_cache_misses += 1
+        if shard.current is not None:
+            shard.current[0] += 1
+            shard.current[1] += elapsed
+
+    def _on_commit(self, conn):
+        self._shard().commits += 1
+
+    # ---------- exposition ----------
+
+    def snapshot(self):
+        """Merge every thread's shard into one totals dict"""
+        with self._shards_lock:
+            shards = list(self._shards)
+        routes = {}
+        totals = {
+            'sql_statements': 0, 'sql_seconds': 0.0, 'sql_cache_hits': 0,
+            'sql_cache_misses': 0, 'commits': 0,
+            'auth_checks': 0, 'auth_failures': 0,
+        }
+        for shard in shards:
+            for key, stats in list(shard.routes.items()):
+                merged = routes.get(key)
+                if merged is None:
+                    merged = routes[key] = RouteStats()
+                merged.merge(stats)
+            for name in totals:
+                totals[name] += getattr(shard, name)
+        totals['routes'] = routes
+        return totals
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        snap = self.snapshot()
+        routes = sorted(snap['routes'].items())
+        lines = []
+
+        lines.append('# HELP todo_http_requests_total HTTP requests by route, method and status.')
+        lines.append('# TYPE todo_http_requests_total counter')
+        for (route, method), stats in routes:
+            for status, n in sorted(stats.statuses.items()):
+                lines.append(
+                    f'todo_http_requests_total{{route="{route}",method="{method}",'
+                    f'status="{status}"}} {n}'
+                )
+
+        _histogram(lines, 'todo_http_request_duration_seconds',
+                   'Request latency in seconds.', routes, 'latency')
+        _histogram(lines, 'todo_http_response_size_bytes',
+                   'Response body size in bytes.', routes, 'size')
+        _histogram(lines, 'todo_sql_statements_per_request',
+                   'SQL statements executed per request.', routes, 'sql')
+
+        lines.append('# HELP todo_sql_request_seconds_total Time spent in SQL per route.')
+        lines.append('# TYPE todo_sql_request_seconds_total counter')
+        for (route, method), stats in routes:
+            lines.append(
+                f'todo_sql_request_seconds_total{{route="{route}",method="{method}"}} '
+                f'{stats.sql_seconds:.6f}'
+            )
+
+        for name, kind, help_text, value in (
+            ('todo_sql_statements_total', 'counter', 'SQL statements executed.',
+             snap['sql_statements']),
+            ('todo_sql_seconds_total', 'counter', 'Time spent executing SQL.',
+             f"{snap['sql_seconds']:.6f}"),
+            ('todo_sql_cache_hits_total', 'counter',
+             'SQL statements whose compiled form came from the statement cache.',
+             snap['sql_cache_hits']),
+            ('todo_sql_cache_misses_total', 'counter',
+             'SQL statements compiled because they were not cached.',
+             snap['sql_cache_misses']),
+            ('todo_db_commits_total', 'counter', 'Database transactions committed.',
+             snap['commits']),
+            ('todo_auth_checks_total', 'counter', 'Authentication checks performed.',
+             snap['auth_checks']),
+            ('todo_auth_failures_total', 'counter', 'Authentication checks that failed.',
+             snap['auth_failures']),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {value}')
+
+        for collector in self._collectors:
+            lines.extend(collector())
+
+        return '\n'.join(lines) + '\n'
+
+    def render_view(self):
+        """Flask view for GET /metrics"""
+        if self.token is not None:
+            sent = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(sent.encode(), f'Bearer {self.token}'.encode()):
+                return Response('Forbidden\n', status=403, mimetype='text/plain')
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _histogram(lines, name, help_text, routes, attr):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for (route, method), stats in routes:
+        hist = getattr(stats, attr)
+        labels = f'route="{route}",method="{method}"'
+        cumulative = 0
+        for bound, n in zip(hist.bounds, hist.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += hist.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {hist.sum}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
@@ -0,0 +1,33 @@
+"""
+Migration script for the cold archive.
+Adds tasks.completed_at and creates the archived_tasks table.
+Run this once after updating the models.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from app import app, db, Task
+
+def migrate_archive():
+    """Add completed_at to tasks and create the archive table."""
+    with app.app_context():
+        columns = [c['name'] for c in inspect(db.engine).get_columns('tasks')]
+        if 'completed_at' not in columns:
+            db.session.execute(text('ALTER TABLE tasks ADD COLUMN completed_at DATETIME'))
+        
+        # The real completion time is unknown; start the archive clock now
+        updated = Task.query.filter(
+            Task.completed.is_(True),
+            Task.completed_at.is_(None)
+        ).update({'completed_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        
+        db.create_all()
+        print(f"✅ Set completed_at on {updated} completed tasks")
+
+if __name__ == '__main__':
+    print("Starting archive migration...")
+    migrate_archive()
+    print("Migration complete!")
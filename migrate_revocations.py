@@ -0,0 +1,36 @@
+"""
+Migration script for token revocations.
+Rebuilds token_revocations with AUTOINCREMENT, so ids of purged rows are
+never handed out again (other processes sync revocations by increasing id).
+Run this once after updating the models, with the backend stopped.
+"""
+
+from sqlalchemy import insert, select, text
+
+from app import app, db, TokenRevocation
+
+def migrate_revocations():
+    """Recreate token_revocations with AUTOINCREMENT, keeping its rows."""
+    with app.app_context():
+        table = TokenRevocation.__table__
+        schema = db.session.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': table.name}).scalar()
+        if schema is None or 'AUTOINCREMENT' in schema.upper():
+            db.create_all()
+            print("✅ token_revocations already uses AUTOINCREMENT")
+            return
+
+        rows = [dict(row) for row in db.session.execute(select(table)).mappings()]
+        db.session.commit()
+        table.drop(db.engine)
+        table.create(db.engine)
+        if rows:
+            db.session.execute(insert(table), rows)
+        db.session.commit()
+        print(f"✅ Rebuilt token_revocations with {len(rows)} revocations")
+
+if __name__ == '__main__':
+    print("Starting revocation migration...")
+    migrate_revocations()
+    print("Migration complete!")
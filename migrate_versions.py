@@ -0,0 +1,26 @@
+"""
+Migration script to add row versions for optimistic concurrency control.
+Run this once after adding the version column to the Task and TodoList models.
+"""
+
+from sqlalchemy import inspect, text
+
+from app import app, db
+
+def migrate_add_versions():
+    """Add a version column (starting at 1) to tasks and todo_lists."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        for table in ('tasks', 'todo_lists'):
+            columns = [c['name'] for c in inspector.get_columns(table)]
+            if 'version' not in columns:
+                db.session.execute(text(
+                    f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1'
+                ))
+                print(f"✅ Added version to {table}")
+        db.session.commit()
+
+if __name__ == '__main__':
+    print("Starting version migration...")
+    migrate_add_versions()
+    print("Migration complete!")
@@ -0,0 +1,110 @@
+"""
+Short-lived per-user cache of owned list ids.
+
+Most list and task routes start by checking that the current user owns a
+list. Lists never change owner, so once a user's list ids are known a
+request can skip that lookup. OwnedListCache keeps each user's set of list
+ids for OWNERSHIP_CACHE_TTL seconds, in an LRU of at most
+OWNERSHIP_CACHE_SIZE users.
+
+Only positive answers are trusted: a list id missing from the set may have
+been created since it was cached, so callers look it up and refresh the
+set. Deleting a list must `forget` its owner, after committing. As in
+TreeCache, a request records a tick before reading (`begin`) and `put`
+refuses sets read before the user was last forgotten. Stamps are kept for
+at most OWNERSHIP_CACHE_SIZE users; a user whose stamp was dropped counts as
+forgotten at the newest dropped tick.
+
+The cache is per process. Other processes learn about a deleted list when
+their entry expires, so keep the TTL short when running several workers.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class OwnedListCache:
+    """LRU of user id -> frozenset of owned list ids, with expiry"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stamps = OrderedDict()
+        self._floor = 0
+        self._tick = 0
+        self.ttl = 30.0
+        self.max_users = 10000
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Load settings from the Flask config"""
+        self.ttl = app.config.get('OWNERSHIP_CACHE_TTL', self.ttl)
+        self.max_users = app.config.get('OWNERSHIP_CACHE_SIZE', self.max_users)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def begin(self):
+        """Return the current tick; call before reading list ids from the database"""
+        return self._tick
+
+    def owns(self, user_id, list_id):
+        """True if the list is cached as the user's; False means unknown"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic() and list_id in entry[1]:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def put(self, user_id, list_ids, started):
+        """Cache the ids of every list the user owns.
+
+        `started` is the value of `begin()` from before the ids were read.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._stamps.get(user_id, self._floor) > started:
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, frozenset(list_ids))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def forget(self, *user_ids):
+        """Drop the users' sets; call after committing a list deletion"""
+        with self._lock:
+            self._tick += 1
+            for user_id in user_ids:
+                self._stamps[user_id] = self._tick
+                self._stamps.move_to_end(user_id)
+                self._entries.pop(user_id, None)
+            while len(self._stamps) > self.max_users:
+                _, self._floor = self._stamps.popitem(last=False)
+
+    def metrics_lines(self):
+        """Exposition lines for the /metrics endpoint"""
+        with self._lock:
+            users = len(self._entries)
+        lines = []
+        for name, kind, help_text, value in (
+            ('todo_ownership_cache_hits_total', 'counter',
+             'Ownership checks answered from the owned-list cache.', self.hits),
+            ('todo_ownership_cache_misses_total', 'counter',
+             'Ownership checks that had to query the database.', self.misses),
+            ('todo_ownership_cache_users', 'gauge', 'Users with cached list ids.', users),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {value}')
+        return lines
@@ -0,0 +1,213 @@
+"""
+On-demand per-request profiling.
+
+A slow request is easiest to explain with a call profile of that very
+request. RequestProfiler wraps the WSGI app, so a profile covers routing,
+request hooks, authentication, the ORM and JSON serialization. A request is
+profiled when
+
+- it carries `X-Profile: <PROFILE_TOKEN>` (an admin secret), or
+- it is picked at random, with probability PROFILE_SAMPLE_RATE.
+
+Each profile is saved to PROFILE_DIR as a pstats file (`<id>.prof`, for
+`python -m pstats` or snakeviz) next to `<id>.json`, which holds the
+method, path, endpoint, user id, status, duration and the slowest functions
+by cumulative time. Only the newest PROFILE_KEEP profiles are kept.
+`GET /api/debug/profiles` lists them, newest first, and
+`GET /api/debug/profiles/<id>` downloads one; both require the
+`X-Profile` token.
+
+With neither a token nor a sample rate configured nothing is installed, so
+disabled profiling costs nothing. Profiles only cover the request thread:
+grouped mutations run on the group commit writer thread and show up as
+time spent waiting for it.
+"""
+
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import jsonify, request, send_file
+
+_PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{12}-[0-9a-f]{8}$')
+
+
+def short_path(filename):
+    """The last two components of a path, e.g. `flask/app.py`"""
+    return '/'.join(filename.replace(os.sep, '/').split('/')[-2:])
+
+
+class RequestProfiler:
+    """Flask extension saving cProfile profiles of selected requests"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.token = None
+        self.sample_rate = 0.0
+        self.directory = None
+        self.keep = 100
+        self.top = 25
+        self.saved = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Wrap the WSGI app and add the listing routes when a token or a
+        sample rate is configured"""
+        self.token = app.config.get('PROFILE_TOKEN') or None
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.directory = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.keep = app.config.get('PROFILE_KEEP', self.keep)
+        self.enabled = bool(self.token) or self.sample_rate > 0
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        app.wsgi_app = self._middleware(app.wsgi_app)
+        app.after_request(self._after_request)
+        app.add_url_rule('/api/debug/profiles', 'list_profiles', self.list_view,
+                         methods=['GET'])
+        app.add_url_rule('/api/debug/profiles/<profile_id>', 'get_profile', self.get_view,
+                         methods=['GET'])
+
+    # ---------- profiling ----------
+
+    def _has_token(self, value):
+        return bool(self.token) and value is not None and \
+            hmac.compare_digest(value.encode(), self.token.encode())
+
+    def _middleware(self, wsgi_app):
+        def profiled_app(environ, start_response):
+            if environ.get('PATH_INFO', '').startswith('/api/debug/profiles'):
+                return wsgi_app(environ, start_response)
+            if self._has_token(environ.get('HTTP_X_PROFILE')):
+                reason = 'requested'
+            elif self.sample_rate > 0 and random.random() < self.sample_rate:
+                reason = 'sampled'
+            else:
+                return wsgi_app(environ, start_response)
+
+            statuses = []
+
+            def recording_start_response(status, headers, exc_info=None):
+                statuses.append(status)
+                return start_response(status, headers, exc_info)
+
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            profile.enable()
+            try:
+                # Drain the body while profiling, so streamed output counts too
+                response = wsgi_app(environ, recording_start_response)
+                try:
+                    body = list(response)
+                finally:
+                    if hasattr(response, 'close'):
+                        response.close()
+            finally:
+                profile.disable()
+                elapsed = time.perf_counter() - started
+                self._save(profile, environ, reason, statuses, elapsed)
+            return body
+        return profiled_app
+
+    def _after_request(self, response):
+        # The request context is gone by the time the middleware saves the
+        # profile, so leave the endpoint and user where it can find them
+        request.environ['todo.profile_endpoint'] = request.endpoint
+        request.environ['todo.profile_user'] = getattr(request, 'current_user_id', None)
+        return response
+
+    def _save(self, profile, environ, reason, statuses, elapsed):
+        now = datetime.utcnow()
+        profile_id = f'{now:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top]
+        meta = {
+            'id': profile_id,
+            'created_at': now.isoformat(),
+            'reason': reason,
+            'method': environ.get('REQUEST_METHOD'),
+            'path': environ.get('PATH_INFO'),
+            'query': environ.get('QUERY_STRING') or None,
+            'endpoint': environ.get('todo.profile_endpoint'),
+            'user_id': environ.get('todo.profile_user'),
+            'status': int(statuses[-1].split()[0]) if statuses else None,
+            'duration_ms': round(elapsed * 1000, 2),
+            'total_calls': stats.total_calls,
+            'top': [
+                {
+                    'function': f'{short_path(filename)}:{line}({name})',
+                    'calls': calls,
+                    'own_ms': round(own * 1000, 3),
+                    'cumulative_ms': round(cumulative * 1000, 3),
+                }
+                for (filename, line, name), (_, calls, own, cumulative, _) in top
+            ],
+        }
+        base = os.path.join(self.directory, profile_id)
+        profile.dump_stats(base + '.prof')
+        with open(base + '.json', 'w') as f:
+            json.dump(meta, f)
+        with self._lock:
+            self.saved += 1
+            self._prune()
+
+    def _prune(self):
+        """Delete all but the newest `keep` profiles"""
+        ids = self._profile_ids()
+        for profile_id in ids[self.keep:]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _profile_ids(self):
+        """Saved profile ids, newest first"""
+        names = (name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+        return sorted((n for n in names if _PROFILE_ID.match(n)), reverse=True)
+
+    # ---------- views ----------
+
+    def _authorized(self):
+        return self._has_token(request.headers.get('X-Profile'))
+
+    def list_view(self):
+        """Flask view for GET /api/debug/profiles"""
+        if not self._authorized():
+            return jsonify({'error': 'Profile token required'}), 403
+        limit = request.args.get('limit', 20, type=int)
+        endpoint = request.args.get('endpoint')
+        profiles = []
+        for profile_id in self._profile_ids():
+            try:
+                with open(os.path.join(self.directory, profile_id + '.json')) as f:
+                    meta = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            if endpoint and meta.get('endpoint') != endpoint:
+                continue
+            profiles.append(meta)
+            if len(profiles) >= limit:
+                break
+        return jsonify(profiles), 200
+
+    def get_view(self, profile_id):
+        """Flask view for GET /api/debug/profiles/<id>: the pstats file"""
+        if not self._authorized():
+            return jsonify({'error': 'Profile token required'}), 403
+        path = os.path.join(self.directory, profile_id + '.prof')
+        if not _PROFILE_ID.match(profile_id) or not os.path.exists(path):
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=profile_id + '.prof')
@@ -0,0 +1,235 @@
+"""
+Per-request SQL query budgets and N+1 detection.
+
+When enabled, every SQL statement executed while serving a request is
+recorded. At the end of the request:
+
+- the statement count is compared with the route's declared budget
+  (see `query_budget`); overruns are logged and flagged with an
+  `X-Query-Budget-Exceeded: <statements>/<budget>` response header;
+- statement shapes repeated `n1_threshold` or more times in one request
+  are reported as N+1 suspects.
+
+In strict mode overruns fail loudly so test suites catch them, without
+ever reporting a committed write as failed: a request already over budget
+when it commits is stopped before the commit (the transaction is rolled
+back and the response is a 500), and an overrun after nothing was
+committed replaces the response with a 500. Once a commit went through,
+the response stands and only carries the header.
+
+Per-route aggregates are kept for a worst-offenders report, served at
+`GET /api/debug/query-report`. When disabled, no hooks are installed.
+"""
+
+import re
+import threading
+from contextlib import contextmanager
+
+from flask import current_app, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+_IN_LIST = re.compile(r'\(\?(?:, \?)+\)')
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode to stop a commit by a request over its budget"""
+
+    def __init__(self, session, endpoint, queries, budget):
+        super().__init__(f'{endpoint}: {queries} statements (budget {budget})')
+        self.session = session
+        self.endpoint = endpoint
+        self.queries = queries
+        self.budget = budget
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL statements a route may execute.
+
+    Apply it below `@app.route` and above `@require_auth` so the budget is
+    copied onto the registered view by `functools.wraps`.
+    """
+    def decorator(f):
+        f.query_budget = max_queries
+        return f
+    return decorator
+
+
+def statement_shape(statement):
+    """Normalize a statement so expanded IN lists of any length compare equal"""
+    return _IN_LIST.sub('(?...)', ' '.join(statement.split()))
+
+
+class RouteQueryStats:
+    """Aggregated query counts for one endpoint"""
+
+    __slots__ = ('requests', 'queries', 'max_queries', 'violations', 'suspects')
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.violations = 0
+        # statement shape -> largest repeat count seen in a single request
+        self.suspects = {}
+
+    def to_dict(self, endpoint, budget):
+        return {
+            'endpoint': endpoint,
+            'budget': budget,
+            'requests': self.requests,
+            'avg_queries': round(self.queries / self.requests, 2) if self.requests else 0,
+            'max_queries': self.max_queries,
+            'violations': self.violations,
+            'n_plus_one_suspects': [
+                {'statement': shape, 'max_repeats': n}
+                for shape, n in sorted(self.suspects.items(), key=lambda i: -i[1])
+            ],
+        }
+
+
+class QueryBudget:
+    """Flask extension enforcing per-route query budgets"""
+
+    def __init__(self, app=None):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.strict = False
+        self.n1_threshold = 3
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Install hooks when QUERY_BUDGET_ENABLED is set"""
+        if not app.config.get('QUERY_BUDGET_ENABLED', False):
+            return
+        self.strict = app.config.get('QUERY_BUDGET_STRICT', False)
+        self.n1_threshold = app.config.get('QUERY_BUDGET_N1_THRESHOLD', 3)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule(
+            '/api/debug/query-report', 'query_report', self.report_view, methods=['GET']
+        )
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        if self.strict:
+            event.listen(Session, 'before_commit', self._before_commit)
+            event.listen(Session, 'after_commit', self._after_commit)
+            app.register_error_handler(QueryBudgetExceeded, self._handle_exceeded)
+
+    @contextmanager
+    def uncounted(self):
+        """Leave statements executed in the block (such as warming an
+        in-memory cache) out of the current request's count"""
+        statements = getattr(self._local, 'statements', None)
+        self._local.statements = None
+        try:
+            yield
+        finally:
+            self._local.statements = statements
+
+    def _before_request(self):
+        self._local.statements = []
+        self._local.committed = False
+
+    def _budget(self):
+        view = current_app.view_functions.get(request.endpoint)
+        return getattr(view, 'query_budget', None)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        statements = getattr(self._local, 'statements', None)
+        if statements is not None:
+            statements.append(statement)
+
+    def _before_commit(self, session):
+        statements = getattr(self._local, 'statements', None)
+        if statements is None or not has_request_context():
+            return
+        budget = self._budget()
+        if budget is not None and len(statements) > budget:
+            raise QueryBudgetExceeded(session, request.endpoint, len(statements), budget)
+
+    def _after_commit(self, session):
+        if getattr(self._local, 'statements', None) is not None:
+            self._local.committed = True
+
+    def _handle_exceeded(self, error):
+        error.session.rollback()
+        return self._failure(error.endpoint, self._local.statements or [], error.budget)
+
+    def _failure(self, endpoint, statements, budget):
+        """The strict-mode 500 response"""
+        counts = {}
+        for statement in statements:
+            shape = statement_shape(statement)
+            counts[shape] = counts.get(shape, 0) + 1
+        response = jsonify({
+            'error': 'Query budget exceeded',
+            'endpoint': endpoint,
+            'queries': len(statements),
+            'budget': budget,
+            'n_plus_one_suspects': sorted(s for s, n in counts.items() if n >= self.n1_threshold),
+        })
+        response.status_code = 500
+        return response
+
+    def _after_request(self, response):
+        statements = getattr(self._local, 'statements', None)
+        self._local.statements = None
+        if statements is None or request.endpoint in (None, 'query_report'):
+            return response
+
+        endpoint = request.endpoint
+        budget = self._budget()
+
+        counts = {}
+        for statement in statements:
+            shape = statement_shape(statement)
+            counts[shape] = counts.get(shape, 0) + 1
+        suspects = {s: n for s, n in counts.items() if n >= self.n1_threshold}
+        over_budget = budget is not None and len(statements) > budget
+
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = RouteQueryStats()
+            stats.requests += 1
+            stats.queries += len(statements)
+            stats.max_queries = max(stats.max_queries, len(statements))
+            if over_budget:
+                stats.violations += 1
+            for shape, n in suspects.items():
+                stats.suspects[shape] = max(stats.suspects.get(shape, 0), n)
+
+        for shape, n in suspects.items():
+            current_app.logger.warning(
+                'Possible N+1 in %s: statement repeated %d times: %s', endpoint, n, shape
+            )
+        if over_budget:
+            current_app.logger.warning(
+                'Query budget exceeded in %s: %d statements (budget %d)',
+                endpoint, len(statements), budget
+            )
+            # Once a write is committed, a 500 would invite a retry of a
+            # request that succeeded
+            if self.strict and not getattr(self._local, 'committed', False):
+                response = self._failure(endpoint, statements, budget)
+            response.headers['X-Query-Budget-Exceeded'] = f'{len(statements)}/{budget}'
+        return response
+
+    def report(self, limit=10):
+        """Return the worst offending endpoints, most queries per request first"""
+        with self._lock:
+            items = list(self._stats.items())
+        rows = []
+        for endpoint, stats in items:
+            view = current_app.view_functions.get(endpoint)
+            rows.append(stats.to_dict(endpoint, getattr(view, 'query_budget', None)))
+        rows.sort(key=lambda r: (r['violations'], r['max_queries'], r['avg_queries']), reverse=True)
+        return rows[:limit]
+
+    def report_view(self):
+        """Flask view for GET /api/debug/query-report"""
+        limit = request.args.get('limit', 10, type=int)
+        return jsonify(self.report(limit)), 200
@@ -0,0 +1,220 @@
+"""
+Admission control for the Flask backend.
+
+- RateLimiter: per-user token buckets with separate read and write budgets,
+  plus optional per-endpoint budgets. Checked from `require_auth` once the
+  caller is known.
+- LoadShedder: rejects requests early with 503 when too many are in flight
+  or recent latency is above a threshold, so an overloaded server degrades
+  instead of queueing everyone behind the SQLite write lock.
+
+Limiter state is guarded by a small pool of striped locks rather than one
+global lock, so unrelated users never contend with each other.
+"""
+
+import math
+import threading
+import time
+
+from flask import jsonify, request
+
+READ_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+_LOCK_STRIPES = 64
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity`."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now):
+        """Consume one token. Return 0 on success, else seconds until one is available."""
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens >= 1:
+            self.tokens = tokens - 1
+            return 0.0
+        self.tokens = tokens
+        return (1 - tokens) / self.rate
+
+    def refund(self):
+        """Give back a token taken by `take` (used when a later check fails)."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def idle_since(self, now):
+        """Seconds this bucket has been full, or 0 if it is still refilling."""
+        refill_time = (self.capacity - self.tokens) / self.rate
+        return max(0.0, now - self.updated - refill_time)
+
+
+class RateLimiter:
+    """Per-user token buckets keyed by (user, read/write) and (user, endpoint).
+
+    Budgets are `(rate_per_second, burst)` tuples. Disabled limiters accept
+    everything without touching any state.
+    """
+
+    def __init__(self, app=None, clock=time.monotonic, **settings):
+        self._clock = clock
+        self._buckets = {}
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self._prune_lock = threading.Lock()
+        self.configure(**settings)
+        if app is not None:
+            self.init_app(app)
+
+    def configure(self, enabled=False, read=(20.0, 40), write=(5.0, 20),
+                  endpoints=None, max_buckets=100000):
+        """Set budgets; existing buckets are dropped so new limits apply at once."""
+        self.enabled = enabled
+        self.read = read
+        self.write = write
+        self.endpoints = dict(endpoints or {})
+        self.max_buckets = max_buckets
+        self._buckets = {}
+
+    def init_app(self, app):
+        """Load budgets from the Flask config"""
+        self.configure(
+            enabled=app.config.get('RATELIMIT_ENABLED', False),
+            read=app.config.get('RATELIMIT_READ', self.read),
+            write=app.config.get('RATELIMIT_WRITE', self.write),
+            endpoints=app.config.get('RATELIMIT_ENDPOINTS'),
+        )
+
+    def check(self, user_id, endpoint, method):
+        """Charge one request to the user's budgets.
+
+        Returns None if the request is admitted, otherwise the number of
+        seconds the client should wait before retrying.
+        """
+        if not self.enabled:
+            return None
+
+        now = self._clock()
+        kind = 'read' if method in READ_METHODS else 'write'
+        budget = self.read if kind == 'read' else self.write
+
+        class_bucket = self._bucket((user_id, kind), budget, now)
+        wait = self._take(class_bucket, (user_id, kind), now)
+        if wait:
+            return wait
+
+        endpoint_budget = self.endpoints.get(endpoint)
+        if endpoint_budget is not None:
+            key = (user_id, endpoint)
+            wait = self._take(self._bucket(key, endpoint_budget, now), key, now)
+            if wait:
+                with self._lock_for((user_id, kind)):
+                    class_bucket.refund()
+                return wait
+        return None
+
+    def _lock_for(self, key):
+        return self._locks[hash(key) % _LOCK_STRIPES]
+
+    def _take(self, bucket, key, now):
+        with self._lock_for(key):
+            return bucket.take(now)
+
+    def _bucket(self, key, budget, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune(now)
+            rate, burst = budget
+            # setdefault is atomic, so racing creators end up sharing one bucket
+            bucket = self._buckets.setdefault(key, TokenBucket(rate, burst, now))
+        return bucket
+
+    def _prune(self, now):
+        """Drop buckets that have been full for a while; they carry no state."""
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            for key, bucket in list(self._buckets.items()):
+                if bucket.idle_since(now) > 60:
+                    self._buckets.pop(key, None)
+        finally:
+            self._prune_lock.release()
+
+
+class LoadShedder:
+    """Reject work early when the server is saturated.
+
+    - More than `max_in_flight` concurrent requests: shed with 503.
+    - Smoothed latency above `latency_ms`: admit only half of `max_in_flight`
+      until latency recovers, so the backlog drains instead of growing.
+    """
+
+    def __init__(self, app=None, **settings):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.latency_ms = 0.0
+        self.configure(**settings)
+        if app is not None:
+            self.init_app(app)
+
+    def configure(self, max_in_flight=0, latency_ms=0, retry_after=1, exempt=()):
+        self.max_in_flight = max_in_flight
+        self.latency_threshold_ms = latency_ms
+        self.retry_after = retry_after
+        self.exempt = frozenset(exempt)
+
+    def init_app(self, app):
+        """Load thresholds from the Flask config and install request hooks"""
+        self.configure(
+            max_in_flight=app.config.get('SHED_MAX_IN_FLIGHT', 0),
+            latency_ms=app.config.get('SHED_LATENCY_MS', 0),
+            retry_after=app.config.get('SHED_RETRY_AFTER', 1),
+            exempt=app.config.get('SHED_EXEMPT_ENDPOINTS', ('health_check',)),
+        )
+        if self.max_in_flight:
+            app.before_request(self._before_request)
+            app.teardown_request(self._teardown_request)
+
+    def admit(self):
+        """Reserve a slot for a request. Returns False if it should be shed."""
+        limit = self.max_in_flight
+        if self.latency_threshold_ms and self.latency_ms > self.latency_threshold_ms:
+            limit = max(1, limit // 2)
+        with self._lock:
+            if self.in_flight >= limit:
+                return False
+            self.in_flight += 1
+        return True
+
+    def release(self, elapsed_ms):
+        """Free a slot and fold the request's latency into the moving average"""
+        with self._lock:
+            self.in_flight -= 1
+            self.latency_ms += 0.1 * (elapsed_ms - self.latency_ms)
+
+    def _before_request(self):
+        if request.endpoint in self.exempt:
+            return None
+        if not self.admit():
+            return (
+                jsonify({'error': 'Server overloaded, please retry'}),
+                503,
+                {'Retry-After': retry_after_header(self.retry_after)},
+            )
+        request.environ['todo.admitted_at'] = time.perf_counter()
+        return None
+
+    def _teardown_request(self, exc):
+        started = request.environ.pop('todo.admitted_at', None)
+        if started is not None:
+            self.release((time.perf_counter() - started) * 1000)
+
+
+def retry_after_header(seconds):
+    """Format a wait time for the Retry-After header (whole seconds, at least 1)"""
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,220 @@
+"""
+Offline tool to rebalance users across database shards.
+Stop the backend first: moves copy rows between shard files and update the
+shard directory, which running processes cache in memory.
+
+Usage:
+    SHARD_COUNT=4 python rebalance_shards.py --dry-run
+    SHARD_COUNT=4 python rebalance_shards.py --max-moves 100
+    SHARD_COUNT=4 python rebalance_shards.py --user 42 --to 3
+
+Each user is weighted by 1 + their number of tasks. Users are moved one at a
+time from the heaviest shard to the lightest while that narrows the gap.
+A move copies the user's lists, tasks and archived tasks to the target
+shard under new ids from the target's id range, points the directory at the
+target and then deletes the originals, committing after each step. If the
+tool is interrupted, the next run first removes the half-copied rows.
+"""
+
+import argparse
+
+from sqlalchemy import delete, func, insert, select, text
+
+from app import app, db, shard_router, User, UserShard, TodoList, Task, ArchivedTask
+
+LISTS = TodoList.__table__
+TASKS = Task.__table__
+ARCHIVED = ArchivedTask.__table__
+
+# Columns holding ids of each sharded table, remapped when a user moves
+ID_COLUMNS = {
+    LISTS: {'id': LISTS},
+    TASKS: {'id': TASKS, 'list_id': LISTS, 'parent_id': TASKS},
+    ARCHIVED: {'id': ARCHIVED, 'root_id': ARCHIVED, 'parent_id': ARCHIVED,
+               'list_id': LISTS, 'task_id': TASKS, 'task_parent_id': TASKS},
+}
+
+
+def user_weights():
+    """Map every user id to (shard, weight)"""
+    directory = dict(db.session.execute(select(UserShard.user_id, UserShard.shard)).all())
+    users = {
+        user_id: (directory.get(user_id, 0), 1)
+        for user_id in db.session.execute(select(User.id)).scalars()
+    }
+    for shard in range(shard_router.count):
+        with shard_router.use(shard):
+            rows = db.session.execute(
+                select(TodoList.user_id, func.count(Task.id))
+                .outerjoin(Task, Task.list_id == TodoList.id)
+                .group_by(TodoList.user_id)
+            ).all()
+        for user_id, tasks in rows:
+            home, weight = users.get(user_id, (shard, 1))
+            if home == shard:
+                users[user_id] = (home, weight + tasks)
+    return users
+
+
+def plan_moves(users, count, max_moves):
+    """Greedy plan of (user_id, source, target) moves evening out shard weights"""
+    loads = [0] * count
+    members = {shard: {} for shard in range(count)}
+    for user_id, (shard, weight) in users.items():
+        if shard < count:
+            loads[shard] += weight
+            members[shard][user_id] = weight
+    moves = []
+    while len(moves) < max_moves:
+        heavy = max(range(count), key=loads.__getitem__)
+        light = min(range(count), key=loads.__getitem__)
+        gap = loads[heavy] - loads[light]
+        # Moving weight w < gap strictly narrows the gap between the two;
+        # w closest to gap / 2 evens them out best
+        candidates = [(abs(gap - 2 * w), uid) for uid, w in members[heavy].items() if w < gap]
+        if not candidates:
+            break
+        user_id = min(candidates)[1]
+        weight = members[heavy][user_id]
+        del members[heavy][user_id]
+        members[light][user_id] = weight
+        loads[heavy] -= weight
+        loads[light] += weight
+        moves.append((user_id, heavy, light))
+    return moves, loads
+
+
+def delete_rows(user_ids):
+    """Delete the users' lists, tasks and archived tasks on the current shard"""
+    list_ids = select(TodoList.id).where(TodoList.user_id.in_(user_ids)).scalar_subquery()
+    for model in (Task, ArchivedTask):
+        db.session.execute(
+            delete(model).where(model.list_id.in_(list_ids)),
+            execution_options={'synchronize_session': False}
+        )
+    db.session.execute(
+        delete(TodoList).where(TodoList.user_id.in_(user_ids)),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def purge_strays(users):
+    """Remove rows left on a shard the directory does not assign their user to"""
+    purged = 0
+    for shard in range(shard_router.count):
+        with shard_router.use(shard):
+            owners = db.session.execute(select(TodoList.user_id).distinct()).scalars()
+            stray = [uid for uid in owners if users.get(uid, (shard,))[0] != shard]
+            if stray:
+                delete_rows(stray)
+                db.session.commit()
+                purged += len(stray)
+    return purged
+
+
+def next_id(table, shard):
+    """First unused id of a table on a shard"""
+    bind = {'bind': shard_router.engine(shard) if shard else db.engine}
+    seq = None
+    # Databases created before AUTOINCREMENT was enabled have no sqlite_sequence
+    if db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'"
+    ), bind_arguments=bind).first():
+        seq = db.session.execute(
+            text('SELECT seq FROM sqlite_sequence WHERE name = :name'),
+            {'name': table.name}, bind_arguments=bind
+        ).scalar()
+    highest = db.session.execute(select(func.max(table.c.id)), bind_arguments=bind).scalar()
+    return max(seq or 0, highest or 0) + 1
+
+
+def move_user(user_id, source, target):
+    """Move one user's data to another shard. Returns the number of rows moved."""
+    with shard_router.use(source):
+        list_ids = db.session.execute(
+            select(LISTS.c.id).where(LISTS.c.user_id == user_id)
+        ).scalars().all()
+        rows = {LISTS: db.session.execute(
+            select(LISTS).where(LISTS.c.user_id == user_id)
+        ).mappings().all()}
+        for table in (TASKS, ARCHIVED):
+            rows[table] = db.session.execute(
+                select(table).where(table.c.list_id.in_(list_ids))
+            ).mappings().all()
+        db.session.rollback()
+
+    with shard_router.use(target):
+        delete_rows([user_id])
+        # New ids continue the target's own range densely, in the old id order
+        new_ids = {}
+        for table in rows:
+            ids = sorted(row['id'] for row in rows[table])
+            first = next_id(table, target) if ids else 0
+            new_ids[table] = {old: first + n for n, old in enumerate(ids)}
+        for table, columns in ID_COLUMNS.items():
+            if not rows[table]:
+                continue
+            copied = []
+            for row in rows[table]:
+                row = dict(row)
+                for column, refers_to in columns.items():
+                    # Archived rows also name tasks that no longer exist;
+                    # those ids are kept as they were
+                    if row[column] is not None:
+                        row[column] = new_ids[refers_to].get(row[column], row[column])
+                copied.append(row)
+            db.session.execute(insert(table), copied)
+        db.session.commit()
+
+    db.session.merge(UserShard(user_id=user_id, shard=target))
+    db.session.commit()
+
+    with shard_router.use(source):
+        delete_rows([user_id])
+        db.session.commit()
+    return sum(len(r) for r in rows.values())
+
+
+def rebalance(max_moves, dry_run=False, user_id=None, target=None):
+    """Plan and apply moves; returns the list of moves"""
+    with app.app_context():
+        # New shard files (after raising SHARD_COUNT) start out empty
+        shard_router.create_all()
+        users = user_weights()
+        if not dry_run:
+            purged = purge_strays(users)
+            if purged:
+                print(f"🧹 Removed leftover rows of {purged} users")
+        if user_id is not None:
+            if user_id not in users:
+                raise SystemExit(f"Unknown user {user_id}")
+            source = users[user_id][0]
+            moves = [(user_id, source, target)] if source != target else []
+        else:
+            moves, loads = plan_moves(users, shard_router.count, max_moves)
+            print(f"Shard weights after rebalancing: {loads}")
+        for uid, source, dest in moves:
+            if dry_run:
+                print(f"Would move user {uid}: shard {source} -> {dest}")
+                continue
+            moved = move_user(uid, source, dest)
+            print(f"✅ Moved user {uid}: shard {source} -> {dest} ({moved} rows)")
+        return moves
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebalance users across shards')
+    parser.add_argument('--dry-run', action='store_true', help='only print the planned moves')
+    parser.add_argument('--max-moves', type=int, default=1000)
+    parser.add_argument('--user', type=int, help='move only this user (with --to)')
+    parser.add_argument('--to', type=int, help='target shard for --user')
+    args = parser.parse_args()
+    if shard_router.count <= 1:
+        raise SystemExit("Set SHARD_COUNT > 1 to use sharding")
+    if (args.user is None) != (args.to is None):
+        parser.error('--user and --to go together')
+    if args.to is not None and not 0 <= args.to < shard_router.count:
+        parser.error(f'--to must be between 0 and {shard_router.count - 1}')
+    print("Starting shard rebalance...")
+    moves = rebalance(args.max_moves, args.dry_run, args.user, args.to)
+    print(f"Rebalance complete! {len(moves)} moves")
@@ -0,0 +1,277 @@
+"""
+Token revocation with an in-memory Bloom filter fast path.
+
+Tokens carry a unique id (`jti`) and their issue time (`iat`). Logging out
+stores the token's jti in the revocation table; logging out everywhere
+stores a per-user cutoff, and tokens issued before it are rejected.
+
+Looking tokens up in the table would add a query to every authenticated
+request, so each process mirrors the unexpired revocations in memory:
+
+- revoked jtis go into Bloom filters, one per REVOCATION_BUCKET_SECONDS
+  slice of token expiry time. A jti missing from its bucket's filter is
+  certainly not revoked; only filter hits (revoked tokens, or false
+  positives at about REVOCATION_FALSE_POSITIVE_RATE) are confirmed against
+  the table, and the answer is cached;
+- once every token in a bucket has expired the bucket is dropped whole, so
+  expired revocations leave the filter without rebuilding it;
+- per-user cutoffs are rare and kept exactly, in a dict.
+
+Revoking adds a row to the session; the process that committed it mirrors
+it in memory right after the commit (`remember_token`/`remember_cutoff`),
+so a failed commit never leaves a token rejected here but accepted
+elsewhere. `load` reads the table on first use; `sync` (run by a Sweeper every
+REVOCATION_SYNC_INTERVAL seconds) picks up revocations made by other
+processes, drops expired buckets and purges expired rows.
+"""
+
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+
+def _epoch(value):
+    """Seconds since the epoch for a naive UTC datetime"""
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    @property
+    def nbytes(self):
+        return len(self._bits)
+
+
+class ExpiringBloomFilter:
+    """Bloom filters bucketed by expiry time.
+
+    Each bucket grows by appending filters of doubling capacity and halving
+    error rate once the last one is full, so its false-positive rate stays
+    below `error_rate` however many keys it holds.
+    """
+
+    def __init__(self, bucket_seconds, error_rate, initial_capacity=1024):
+        self.bucket_seconds = bucket_seconds
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self._buckets = {}
+
+    def _bucket(self, expires_at):
+        return int(expires_at // self.bucket_seconds)
+
+    def add(self, key, expires_at):
+        """Add `key`, which can be forgotten after `expires_at` (epoch seconds)"""
+        filters = self._buckets.setdefault(self._bucket(expires_at), [])
+        if not filters or filters[-1].count >= filters[-1].capacity:
+            n = len(filters)
+            filters.append(BloomFilter(self.initial_capacity * 2 ** n,
+                                       self.error_rate / 2 ** (n + 1)))
+        filters[-1].add(key)
+
+    def might_contain(self, key, expires_at):
+        """False if `key` was certainly not added with this expiry time"""
+        return any(key in f for f in self._buckets.get(self._bucket(expires_at), ()))
+
+    def expire(self, now):
+        """Drop buckets whose keys have all expired; returns how many"""
+        expired = [b for b in self._buckets if (b + 1) * self.bucket_seconds <= now]
+        for bucket in expired:
+            del self._buckets[bucket]
+        return len(expired)
+
+    def __len__(self):
+        return sum(f.count for filters in self._buckets.values() for f in filters)
+
+    @property
+    def nbytes(self):
+        return sum(f.nbytes for filters in self._buckets.values() for f in filters)
+
+
+class TokenRevocations:
+    """Revoked tokens and per-user cutoffs, checked without a query per request"""
+
+    def __init__(self, app=None, db=None, model=None):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._last_id = 0
+        self._cutoffs = {}
+        self._confirmed = OrderedDict()
+        self.filter_hits = 0
+        self.lookups = 0
+        if app is not None:
+            self.init_app(app, db, model)
+
+    def init_app(self, app, db, model):
+        """Bind to the app and the revocation model. Syncing reads rows by
+        increasing id, so the model's table must never reuse ids (SQLite
+        AUTOINCREMENT) once expired rows are purged."""
+        self.db = db
+        self.model = model
+        self.lifetime = app.config.get('TOKEN_LIFETIME', timedelta(days=7))
+        self.cache_size = app.config.get('REVOCATION_CACHE_SIZE', 10000)
+        self._filter = ExpiringBloomFilter(
+            app.config.get('REVOCATION_BUCKET_SECONDS', 3600),
+            app.config.get('REVOCATION_FALSE_POSITIVE_RATE', 0.001)
+        )
+
+    # ---------- revoking ----------
+
+    def revoke_token(self, payload):
+        """Revoke one token; adds its row to the session. After committing,
+        call `remember_token` with the same payload."""
+        self.db.session.add(self.model(
+            user_id=payload['user_id'], jti=payload['jti'],
+            expires_at=datetime.utcfromtimestamp(payload['exp'])
+        ))
+
+    def revoke_user(self, user_id):
+        """Revoke every token issued to the user so far; adds its row to the
+        session and returns the cutoff. After committing, call
+        `remember_cutoff` with the user id and the cutoff."""
+        now = datetime.utcnow()
+        self.db.session.add(self.model(
+            user_id=user_id, issued_before=now, expires_at=now + self.lifetime
+        ))
+        return now
+
+    def remember_token(self, payload):
+        """Reject a token revoked by this process; call after committing"""
+        with self._lock:
+            self._add_token(payload['jti'], payload['exp'])
+
+    def remember_cutoff(self, user_id, issued_before):
+        """Reject the user's tokens issued before a committed cutoff; call
+        after committing"""
+        with self._lock:
+            self._add_cutoff(user_id, _epoch(issued_before),
+                             _epoch(issued_before + self.lifetime))
+
+    def _add_token(self, jti, expires_at):
+        self._filter.add(jti, expires_at)
+        self._remember(jti, True)
+
+    def _add_cutoff(self, user_id, cutoff, expires_at):
+        current = self._cutoffs.get(user_id)
+        if current is None or current[0] < cutoff:
+            self._cutoffs[user_id] = (cutoff, expires_at)
+
+    def _remember(self, jti, revoked):
+        self._confirmed[jti] = revoked
+        self._confirmed.move_to_end(jti)
+        while len(self._confirmed) > self.cache_size:
+            self._confirmed.popitem(last=False)
+
+    # ---------- checking ----------
+
+    def is_revoked(self, payload):
+        """Whether a decoded, unexpired token has been revoked"""
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            cutoff = self._cutoffs.get(payload['user_id'])
+            if cutoff is not None and payload.get('iat', 0) < cutoff[0]:
+                return True
+            jti = payload.get('jti')
+            if jti is None or not self._filter.might_contain(jti, payload['exp']):
+                return False
+            self.filter_hits += 1
+            revoked = self._confirmed.get(jti)
+            if revoked is not None:
+                self._confirmed.move_to_end(jti)
+                return revoked
+            self.lookups += 1
+        revoked = self.db.session.execute(
+            select(self.model.id).where(self.model.jti == jti).limit(1)
+        ).first() is not None
+        with self._lock:
+            self._remember(jti, revoked)
+        return revoked
+
+    # ---------- loading ----------
+
+    def load(self):
+        """Read every unexpired revocation into memory"""
+        rows = self.db.session.execute(
+            select(self.model).where(self.model.expires_at > datetime.utcnow())
+            .order_by(self.model.id)
+        ).scalars().all()
+        self._apply(rows)
+        self._loaded = True
+
+    def sync(self, cursor=None):
+        """Sweeper step: apply revocations added since the last sync and drop
+        expired ones. Always completes in one step."""
+        if not self._loaded:
+            self.load()
+        else:
+            self._apply(self.db.session.execute(
+                select(self.model).where(self.model.id > self._last_id)
+                .order_by(self.model.id)
+            ).scalars().all())
+        now = datetime.utcnow()
+        with self._lock:
+            expired = self._filter.expire(_epoch(now))
+            for user_id in [u for u, (_, exp) in self._cutoffs.items() if exp <= _epoch(now)]:
+                del self._cutoffs[user_id]
+                expired += 1
+        if expired:
+            self.db.session.execute(delete(self.model).where(self.model.expires_at <= now))
+            self.db.session.commit()
+        return None
+
+    def _apply(self, rows):
+        with self._lock:
+            for row in rows:
+                if row.jti is not None:
+                    self._add_token(row.jti, _epoch(row.expires_at))
+                else:
+                    self._add_cutoff(row.user_id, _epoch(row.issued_before),
+                                     _epoch(row.expires_at))
+                self._last_id = max(self._last_id, row.id)
+
+    def metrics_lines(self):
+        """Exposition lines for the /metrics endpoint"""
+        with self._lock:
+            hits, lookups = self.filter_hits, self.lookups
+            size, nbytes = len(self._filter), self._filter.nbytes
+        return [
+            '# HELP todo_revocation_filter_hits_total Token checks that hit the revocation filter.',
+            '# TYPE todo_revocation_filter_hits_total counter',
+            f'todo_revocation_filter_hits_total {hits}',
+            '# HELP todo_revocation_lookups_total Filter hits confirmed against the database.',
+            '# TYPE todo_revocation_lookups_total counter',
+            f'todo_revocation_lookups_total {lookups}',
+            '# HELP todo_revocation_filter_entries Revoked tokens held in the filter.',
+            '# TYPE todo_revocation_filter_entries gauge',
+            f'todo_revocation_filter_entries {size}',
+            '# HELP todo_revocation_filter_bytes Memory used by the filter bits.',
+            '# TYPE todo_revocation_filter_bytes gauge',
+            f'todo_revocation_filter_bytes {nbytes}',
+        ]
@@ -0,0 +1,209 @@
+"""
+User sharding across several SQLite databases.
+
+SQLite serializes every write on one file lock, so a single database caps
+write throughput no matter how many workers serve requests. With
+SHARD_COUNT > 1 each user's lists, tasks and archived tasks live in one of
+SHARD_COUNT database files, and writes for users on different shards
+commit in parallel:
+
+- shard 0 is the main database (DATABASE_URL), which also keeps the tables
+  that are not sharded (users, jobs) and the shard directory;
+- shard n > 0 is a sibling file, e.g. `todo_app.shard2.db`, registered as
+  the `shardN` bind.
+
+The directory table maps user ids to shards. Users without a directory row
+live on shard 0, so existing databases keep working unchanged. Lookups are
+cached in memory; the directory only changes on registration and when
+`rebalance_shards.py` moves users (offline, with the backend stopped).
+
+Routing: the current shard is held in a context variable. `activate` sets
+it for the authenticated user of a request (reset on teardown) and `use`
+scopes it explicitly for jobs, sweeps and tools. RoutingSession asks
+`get_bind` for every statement; statements on sharded tables go to the
+current shard, everything else to the main database.
+
+Ids stay unique across shards: every shard file draws ids from its own
+range (`n * SHARD_ID_STRIDE` upwards, via AUTOINCREMENT), so cached trees,
+URLs and moved rows never collide.
+
+Configure before creating the SQLAlchemy instance:
+
+    configure_sharding(app)
+    db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+    ...
+    shards = ShardRouter(app, db, directory_model, tables)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.util import find_tables
+
+SHARD_ID_STRIDE = 10 ** 12
+
+_current_shard = ContextVar('current_shard', default=None)
+
+
+def shard_url(url, shard):
+    """URL of shard `shard` for a main SQLite database URL"""
+    url = make_url(url)
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        raise ValueError('Sharding needs a file-backed SQLite DATABASE_URL')
+    root, ext = os.path.splitext(url.database)
+    return url.set(database=f'{root}.shard{shard}{ext or ".db"}')
+
+
+def bind_key(shard):
+    """Flask-SQLAlchemy bind key of a shard (None for the main database)"""
+    return f'shard{shard}' if shard else None
+
+
+def configure_sharding(app):
+    """Register one bind per additional shard in the app config"""
+    count = app.config.get('SHARD_COUNT', 1)
+    if count <= 1:
+        return
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for shard in range(1, count):
+        binds[bind_key(shard)] = shard_url(app.config['SQLALCHEMY_DATABASE_URI'], shard)
+
+
+class ShardRouter:
+    """Maps users to shards and picks the engine for sharded statements"""
+
+    def __init__(self, app=None, db=None, directory=None, tables=()):
+        self._lock = threading.Lock()
+        self._directory_cache = OrderedDict()
+        self.count = 1
+        self.cache_size = 100000
+        if app is not None:
+            self.init_app(app, db, directory, tables)
+
+    def init_app(self, app, db, directory, tables):
+        """Bind to the app, the directory model and the sharded tables"""
+        self.db = db
+        self.directory = directory
+        self.tables = list(tables)
+        self._table_set = frozenset(self.tables)
+        self.count = max(1, app.config.get('SHARD_COUNT', 1))
+        self.cache_size = app.config.get('SHARD_DIRECTORY_CACHE_SIZE', self.cache_size)
+        if self.count <= 1:
+            return
+        app.extensions['shard_router'] = self
+        app.teardown_request(self._reset)
+
+    @property
+    def enabled(self):
+        return self.count > 1
+
+    # ---------- directory ----------
+
+    def assign(self, user_id):
+        """Pick a shard for a new user and add its directory row to the
+        session (committed by the caller). Returns the shard."""
+        shard = user_id % self.count
+        if shard:
+            self.db.session.add(self.directory(user_id=user_id, shard=shard))
+        self._remember(user_id, shard)
+        return shard
+
+    def shard_of(self, user_id):
+        """Shard holding the user's data; one directory lookup on a cache miss"""
+        with self._lock:
+            shard = self._directory_cache.get(user_id)
+            if shard is not None:
+                self._directory_cache.move_to_end(user_id)
+                return shard
+        with self.use(0):
+            shard = self.db.session.execute(
+                select(self.directory.shard).where(self.directory.user_id == user_id)
+            ).scalar()
+        shard = shard or 0
+        self._remember(user_id, shard)
+        return shard
+
+    def _remember(self, user_id, shard):
+        with self._lock:
+            self._directory_cache[user_id] = shard
+            self._directory_cache.move_to_end(user_id)
+            while len(self._directory_cache) > self.cache_size:
+                self._directory_cache.popitem(last=False)
+
+    def forget(self):
+        """Drop cached directory entries (after moving users)"""
+        with self._lock:
+            self._directory_cache.clear()
+
+    # ---------- routing ----------
+
+    def activate(self, user_id):
+        """Route the rest of the current request to the user's shard"""
+        if self.enabled:
+            _current_shard.set(self.shard_of(user_id))
+
+    def _reset(self, exc=None):
+        _current_shard.set(None)
+
+    @contextmanager
+    def use(self, shard):
+        """Route sharded statements in the block to `shard`"""
+        token = _current_shard.set(shard)
+        try:
+            yield
+        finally:
+            _current_shard.reset(token)
+
+    def for_user(self, user_id):
+        """Context manager routing the block to the user's shard"""
+        return self.use(self.shard_of(user_id) if self.enabled else 0)
+
+    def current(self):
+        return _current_shard.get() or 0
+
+    def current_engine(self):
+        """Engine that sharded statements go to right now"""
+        shard = self.current()
+        return self.engine(shard) if shard else self.db.engine
+
+    def get_bind(self, mapper=None, clause=None):
+        """Engine of the current shard if the statement touches a sharded
+        table, else None (the main database)"""
+        shard = _current_shard.get()
+        if not shard:
+            return None
+        if mapper is not None:
+            sharded = mapper.local_table in self._table_set
+        elif clause is not None:
+            sharded = any(t in self._table_set for t in find_tables(clause, include_crud=True))
+        else:
+            sharded = False
+        return self.engine(shard) if sharded else None
+
+    def engine(self, shard):
+        return self.db.engines[bind_key(shard)]
+
+    # ---------- schema ----------
+
+    def create_all(self):
+        """Create the sharded tables in every shard file and reserve each
+        shard's id range. Call inside an app context after db.create_all()."""
+        for shard in range(1, self.count):
+            engine = self.engine(shard)
+            self.db.metadata.create_all(engine, tables=self.tables)
+            with engine.begin() as conn:
+                for table in self.tables:
+                    exists = conn.execute(
+                        text('SELECT 1 FROM sqlite_sequence WHERE name = :name'),
+                        {'name': table.name}
+                    ).first()
+                    if not exists:
+                        conn.execute(
+                            text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+                            {'name': table.name, 'seq': shard * SHARD_ID_STRIDE}
+                        )
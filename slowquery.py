@@ -0,0 +1,184 @@
+"""
+Slow-query log with automatic query plans.
+
+With SLOW_QUERY_MS > 0, every SQL statement taking at least that many
+milliseconds is written as one JSON line to SLOW_QUERY_LOG, a rotating log
+(SLOW_QUERY_LOG_BYTES per file, SLOW_QUERY_LOG_BACKUPS old files). Each
+entry records:
+
+- the duration and the statement shape (IN lists collapsed, as in the
+  query budgets) with the shape of its bound parameters - types only,
+  never values;
+- the route (Flask endpoint) or, outside requests, the thread, and the call
+  site: the innermost frame in the application's own code;
+- on SQLite, `EXPLAIN QUERY PLAN` for the first slow occurrence of each
+  shape, run through a raw DBAPI cursor so it is neither timed nor counted
+  by the other engine hooks. Plan steps that scan a whole table or index
+  are repeated under `scans`.
+
+When disabled, no hooks are installed.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from querybudget import statement_shape
+
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+_THIS_FILE = os.path.normpath(os.path.abspath(__file__))
+
+
+def _is_scan(step):
+    """Whether a plan step reads a whole table or index"""
+    step = step.strip()
+    return step.startswith('SCAN') and 'CONSTANT ROW' not in step
+
+
+def parameter_shape(parameters, executemany=False):
+    """Types of the bound parameters (a list, or a dict for named styles);
+    for executemany, the row count and the shape of the first row"""
+    if executemany:
+        rows = list(parameters or ())
+        return {'rows': len(rows), 'row': parameter_shape(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+class SlowQueryLog:
+    """Flask extension logging slow statements through SQLAlchemy engine events"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._explained = set()
+        self.threshold = 0.0
+        self.max_plans = 10000
+        self.logged = 0
+        self.plans = 0
+        self.logger = None
+        self._root = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Install engine events when SLOW_QUERY_MS is above zero"""
+        threshold_ms = app.config.get('SLOW_QUERY_MS', 0)
+        if not threshold_ms or threshold_ms <= 0:
+            return
+        self.threshold = threshold_ms / 1000
+        path = app.config.get('SLOW_QUERY_LOG') or \
+            os.path.join(app.instance_path, 'slow_queries.log')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=app.config.get('SLOW_QUERY_LOG_BYTES', 10 * 1024 * 1024),
+            backupCount=app.config.get('SLOW_QUERY_LOG_BACKUPS', 5),
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger = logging.getLogger(f'todo.slow_queries.{id(self)}')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(handler)
+        self._root = os.path.normpath(os.path.abspath(app.root_path)) + os.sep
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    @property
+    def enabled(self):
+        return self.logger is not None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_slow_query_start', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed < self.threshold:
+            return
+
+        shape = statement_shape(statement)
+        entry = {
+            'at': datetime.utcnow().isoformat(),
+            'duration_ms': round(elapsed * 1000, 3),
+            'statement': shape,
+            'parameters': parameter_shape(parameters, executemany),
+            'route': request.endpoint if has_request_context() else None,
+            'thread': threading.current_thread().name,
+            'call_site': self._call_site(),
+            'database': conn.engine.url.database,
+        }
+        with self._lock:
+            explain = shape not in self._explained and len(self._explained) < self.max_plans
+            if explain:
+                self._explained.add(shape)
+        if explain and conn.dialect.name == 'sqlite':
+            plan = self._explain(cursor, statement, parameters, executemany)
+            if plan is not None:
+                entry['plan'] = plan
+                entry['scans'] = [step.strip() for step in plan if _is_scan(step)]
+        with self._lock:
+            self.logged += 1
+            self.plans += 'plan' in entry
+        self.logger.info(json.dumps(entry, default=str))
+
+    def _call_site(self):
+        """file:line (function) of the innermost frame in the application's
+        own code, outside this module"""
+        frame = sys._getframe(2)
+        while frame is not None:
+            filename = os.path.normpath(frame.f_code.co_filename)
+            if filename.startswith(self._root) and filename != _THIS_FILE \
+                    and os.sep + 'site-packages' + os.sep not in filename:
+                return (f'{os.path.relpath(filename, self._root)}:{frame.f_lineno} '
+                        f'({frame.f_code.co_name})')
+            frame = frame.f_back
+        return None
+
+    def _explain(self, cursor, statement, parameters, executemany):
+        """SQLite's query plan for the statement, one indented line per step"""
+        if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        if executemany:
+            parameters = next(iter(parameters or ()), ())
+        try:
+            raw = cursor.connection.cursor()
+            try:
+                rows = raw.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ()).fetchall()
+            finally:
+                raw.close()
+        except Exception:  # noqa: BLE001 - a missing plan must not fail the query
+            return None
+        depths = {0: -1}
+        plan = []
+        for step_id, parent, _, detail in rows:
+            depth = depths.get(parent, -1) + 1
+            depths[step_id] = depth
+            plan.append('  ' * depth + detail)
+        return plan
+
+    def metrics_lines(self):
+        """Exposition lines for the /metrics endpoint"""
+        lines = []
+        for name, help_text, value in (
+            ('todo_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.', self.logged),
+            ('todo_slow_query_plans_total', 'Query plans captured for slow statements.',
+             self.plans),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {value}')
+        return lines
@@ -0,0 +1,215 @@
+"""
+Cold archive test suite
+Tests archiving completed subtrees, the paginated archive and restoring
+"""
+
+import os
+import time
+
+import requests
+import pytest
+
+BASE_URL = os.environ.get("TODO_API_BASE", "http://localhost:5000/api")
+
+
+@pytest.fixture
+def auth_headers():
+    """Fixture to create an authenticated user"""
+    username = f"archive_user_{os.urandom(4).hex()}"
+    response = requests.post(
+        f"{BASE_URL}/register",
+        json={"username": username, "password": "archivepass123"}
+    )
+    token = response.json()["token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def create_list(name, headers):
+    r = requests.post(f"{BASE_URL}/lists", json={"name": name}, headers=headers)
+    assert r.status_code == 201
+    return r.json()["id"]
+
+
+def create_task(title, list_id, headers, parent_id=None):
+    payload = {"title": title, "list_id": list_id}
+    if parent_id is not None:
+        payload["parent_id"] = parent_id
+    r = requests.post(f"{BASE_URL}/tasks", json=payload, headers=headers)
+    assert r.status_code == 201
+    return r.json()["id"]
+
+
+def complete(task_id, headers, subtree=False):
+    path = f"{BASE_URL}/tasks/{task_id}" + ("/subtree" if subtree else "")
+    r = requests.put(path, json={"completed": True}, headers=headers)
+    assert r.status_code == 200
+    return r.json()
+
+
+def get_list(list_id, headers):
+    r = requests.get(f"{BASE_URL}/lists", headers=headers)
+    assert r.status_code == 200
+    return next(l for l in r.json() if l["id"] == list_id)
+
+
+def archive_now(list_id, headers):
+    r = requests.post(f"{BASE_URL}/lists/{list_id}/archive",
+                      json={"older_than_days": 0}, headers=headers)
+    assert r.status_code == 200
+    return r.json()["archived"]
+
+
+def get_archive(list_id, headers, **params):
+    r = requests.get(f"{BASE_URL}/lists/{list_id}/archive", params=params, headers=headers)
+    assert r.status_code == 200
+    return r.json()
+
+
+class TestArchive:
+    """Test moving completed subtrees to the archive and back"""
+
+    def test_completed_at_tracks_completion(self, auth_headers):
+        """Test completed_at is set on completion and cleared when reopened"""
+        list_id = create_list("Times", auth_headers)
+        task_id = create_task("Task", list_id, auth_headers)
+        task = complete(task_id, auth_headers)
+        assert task["completed_at"] is not None
+
+        r = requests.put(f"{BASE_URL}/tasks/{task_id}", json={"completed": False},
+                         headers=auth_headers)
+        assert r.json()["completed_at"] is None
+
+    def test_archive_moves_completed_subtrees(self, auth_headers):
+        """Test fully completed subtrees leave the list and appear in the archive"""
+        list_id = create_list("Archive", auth_headers)
+        done = create_task("Done", list_id, auth_headers)
+        create_task("Done child", list_id, auth_headers, parent_id=done)
+        complete(done, auth_headers, subtree=True)
+        keep = create_task("Open", list_id, auth_headers)
+
+        assert archive_now(list_id, auth_headers) == 2
+        assert [t["id"] for t in get_list(list_id, auth_headers)["tasks"]] == [keep]
+
+        archive = get_archive(list_id, auth_headers)
+        assert archive["has_more"] is False
+        [item] = archive["items"]
+        assert item["task_id"] == done
+        assert item["title"] == "Done"
+        assert [c["title"] for c in item["children"]] == ["Done child"]
+
+    def test_open_descendants_block_archiving(self, auth_headers):
+        """Test a completed task with an open subtask stays in the list"""
+        list_id = create_list("Partial", auth_headers)
+        parent = create_task("Parent", list_id, auth_headers)
+        create_task("Open child", list_id, auth_headers, parent_id=parent)
+        complete(parent, auth_headers)
+
+        assert archive_now(list_id, auth_headers) == 0
+        assert get_archive(list_id, auth_headers)["items"] == []
+
+    def test_root_below_archived_root_goes_once(self, auth_headers):
+        """Test an old task under a recently completed one is archived once,
+        with its old grandparent's subtree"""
+        list_id = create_list("Nested roots", auth_headers)
+        grandparent = create_task("Grandparent", list_id, auth_headers)
+        parent = create_task("Parent", list_id, auth_headers, parent_id=grandparent)
+        grandchild = create_task("Grandchild", list_id, auth_headers, parent_id=parent)
+        complete(grandchild, auth_headers)
+        complete(grandparent, auth_headers)
+        time.sleep(1.2)
+        complete(parent, auth_headers)
+
+        r = requests.post(f"{BASE_URL}/lists/{list_id}/archive",
+                          json={"older_than_days": 1 / 86400}, headers=auth_headers)
+        assert r.status_code == 200
+        assert r.json()["archived"] == 3
+        assert get_list(list_id, auth_headers)["tasks"] == []
+        [item] = get_archive(list_id, auth_headers)["items"]
+        assert item["task_id"] == grandparent
+        assert [item["children"][0]["id"], item["children"][0]["children"][0]["id"]] == \
+            [item["id"] + 1, item["id"] + 2]
+        assert [c["title"] for c in item["children"]] == ["Parent"]
+        assert [c["title"] for c in item["children"][0]["children"]] == ["Grandchild"]
+
+    def test_default_age_keeps_recent_tasks(self, auth_headers):
+        """Test recently completed tasks are not archived by default"""
+        list_id = create_list("Recent", auth_headers)
+        complete(create_task("Fresh", list_id, auth_headers), auth_headers)
+        r = requests.post(f"{BASE_URL}/lists/{list_id}/archive", headers=auth_headers)
+        assert r.json()["archived"] == 0
+
+    def test_archive_pagination(self, auth_headers):
+        """Test archived subtrees are paged newest first"""
+        list_id = create_list("Pages", auth_headers)
+        for i in range(3):
+            complete(create_task(f"Done {i}", list_id, auth_headers), auth_headers)
+            archive_now(list_id, auth_headers)
+
+        first = get_archive(list_id, auth_headers, per_page=2)
+        assert [t["title"] for t in first["items"]] == ["Done 2", "Done 1"]
+        assert first["has_more"] is True
+        second = get_archive(list_id, auth_headers, per_page=2, page=2)
+        assert [t["title"] for t in second["items"]] == ["Done 0"]
+        assert second["has_more"] is False
+
+    def test_restore_returns_subtree_to_parent(self, auth_headers):
+        """Test a restored subtree goes back under its parent with new ids"""
+        list_id = create_list("Restore", auth_headers)
+        parent = create_task("Parent", list_id, auth_headers)
+        done = create_task("Done", list_id, auth_headers, parent_id=parent)
+        create_task("Done child", list_id, auth_headers, parent_id=done)
+        complete(done, auth_headers, subtree=True)
+        create_task("Sibling", list_id, auth_headers, parent_id=parent)
+        archive_now(list_id, auth_headers)
+
+        [item] = get_archive(list_id, auth_headers)["items"]
+        r = requests.post(f"{BASE_URL}/archive/{item['id']}/restore", headers=auth_headers)
+        assert r.status_code == 200
+        restored = r.json()
+        assert restored["parent_id"] == parent
+        assert restored["completed"] is True
+        assert [c["title"] for c in restored["children"]] == ["Done child"]
+        assert restored["children"][0]["parent_id"] == restored["id"]
+
+        assert restored["children"][0]["id"] == restored["id"] + 1
+
+        children = get_list(list_id, auth_headers)["tasks"][0]["children"]
+        assert [(c["title"], c["position"]) for c in children] == [("Sibling", 1), ("Done", 2)]
+        assert get_archive(list_id, auth_headers)["items"] == []
+
+        r = requests.post(f"{BASE_URL}/archive/{item['id']}/restore", headers=auth_headers)
+        assert r.status_code == 404
+
+    def test_restore_without_parent_goes_top_level(self, auth_headers):
+        """Test a subtree whose parent was deleted is restored at the top level"""
+        list_id = create_list("Orphan", auth_headers)
+        parent = create_task("Parent", list_id, auth_headers)
+        done = create_task("Done", list_id, auth_headers, parent_id=parent)
+        complete(done, auth_headers)
+        archive_now(list_id, auth_headers)
+        requests.delete(f"{BASE_URL}/tasks/{parent}", headers=auth_headers)
+
+        [item] = get_archive(list_id, auth_headers)["items"]
+        r = requests.post(f"{BASE_URL}/archive/{item['id']}/restore", headers=auth_headers)
+        assert r.status_code == 200
+        assert r.json()["parent_id"] is None
+        assert [t["title"] for t in get_list(list_id, auth_headers)["tasks"]] == ["Done"]
+
+    def test_archive_is_private(self, auth_headers):
+        """Test other users cannot read, archive or restore a list's archive"""
+        list_id = create_list("Private", auth_headers)
+        complete(create_task("Done", list_id, auth_headers), auth_headers)
+        archive_now(list_id, auth_headers)
+        [item] = get_archive(list_id, auth_headers)["items"]
+
+        r = requests.post(
+            f"{BASE_URL}/register",
+            json={"username": f"archive_other_{os.urandom(4).hex()}", "password": "x"}
+        )
+        other = {"Authorization": f"Bearer {r.json()['token']}"}
+        assert requests.get(f"{BASE_URL}/lists/{list_id}/archive",
+                            headers=other).status_code == 403
+        assert requests.post(f"{BASE_URL}/lists/{list_id}/archive",
+                             headers=other).status_code == 403
+        assert requests.post(f"{BASE_URL}/archive/{item['id']}/restore",
+                             headers=other).status_code == 403
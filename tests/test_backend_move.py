@@ -115,3 +115,44 @@ def test_infinite_nesting_and_move(auth_headers):
     assert moved2 is not None
     assert moved2["parent_id"] == task3_id
     assert moved2["list_id"] == list_a
+
+
+def outline(node):
+    """(title, [children...]) of a task tree, for comparing structure"""
+    return node["title"], [outline(child) for child in node["children"]]
+
+
+def test_structure_survives_mixed_edits(auth_headers):
+    # Moves, reorders, explicit orders and deletes answered from the same
+    # list's structure (the tree index, when enabled) must match the database
+    list_a = create_list("Mixed A", auth_headers)
+    list_b = create_list("Mixed B", auth_headers)
+    root, _ = create_task("root", list_a, auth_headers)
+    ids = {}
+    for name in ("a", "b", "c"):
+        ids[name], _ = create_task(name, list_a, auth_headers, parent_id=root)
+    ids["a1"], _ = create_task("a1", list_a, auth_headers, parent_id=ids["a"])
+    ids["x"], _ = create_task("x", list_b, auth_headers)
+
+    def put(path, payload):
+        r = requests.put(f"{BASE_URL}/tasks/{path}", json=payload, headers=auth_headers)
+        assert r.status_code in (200, 400), r.text
+        return r.status_code
+
+    put(f"{ids['c']}/reorder", {"direction": "up"})             # a c b
+    put(f"{ids['b']}/move", {"parent_id": ids["a1"]})            # a(a1(b)) c
+    assert put(f"{ids['a']}/move", {"parent_id": ids["b"]}) == 400
+    put(f"{root}/children/order", {"order": [ids["c"], ids["a"]]})  # c a(a1(b))
+    put(f"{ids['a1']}/move", {"list_id": list_b, "parent_id": ids["x"]})
+    ids["d"], _ = create_task("d", list_a, auth_headers, parent_id=root)
+    put(f"{ids['d']}/reorder", {"direction": "up"})             # c d a
+    r = requests.delete(f"{BASE_URL}/tasks/{ids['c']}", headers=auth_headers)
+    assert r.status_code == 200
+    assert put(f"{ids['x']}/move", {"list_id": list_b, "parent_id": ids["b"]}) == 400
+
+    r = requests.get(f"{BASE_URL}/tasks/{root}/subtree", headers=auth_headers)
+    assert outline(r.json()) == ("root", [("d", []), ("a", [])])
+    r = requests.get(f"{BASE_URL}/tasks/{ids['x']}/subtree", headers=auth_headers)
+    assert outline(r.json()) == ("x", [("a1", [("b", [])])])
+    lists = {lst["id"]: lst for lst in get_lists(auth_headers)}
+    assert [outline(t) for t in lists[list_a]["tasks"]] == [("root", [("d", []), ("a", [])])]
@@ -0,0 +1,287 @@
+"""
+Bulk operation test suite
+Tests set-based subtree updates, clearing completed tasks and cloning
+"""
+
+import os
+import requests
+import pytest
+
+BASE_URL = os.environ.get("TODO_API_BASE", "http://localhost:5000/api")
+
+
+@pytest.fixture
+def auth_headers():
+    """Fixture to create an authenticated user"""
+    username = f"bulk_user_{os.urandom(4).hex()}"
+    response = requests.post(
+        f"{BASE_URL}/register",
+        json={"username": username, "password": "bulkpass123"}
+    )
+    token = response.json()["token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def create_list(name, headers):
+    r = requests.post(f"{BASE_URL}/lists", json={"name": name}, headers=headers)
+    assert r.status_code == 201
+    return r.json()["id"]
+
+
+def create_task(title, list_id, headers, parent_id=None):
+    payload = {"title": title, "list_id": list_id}
+    if parent_id is not None:
+        payload["parent_id"] = parent_id
+    r = requests.post(f"{BASE_URL}/tasks", json=payload, headers=headers)
+    assert r.status_code == 201
+    return r.json()["id"]
+
+
+def flatten(tasks):
+    """Yield every task in a nested task tree"""
+    stack = list(tasks)
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.get("children", []))
+
+
+def get_list(list_id, headers):
+    r = requests.get(f"{BASE_URL}/lists", headers=headers)
+    assert r.status_code == 200
+    return next(l for l in r.json() if l["id"] == list_id)
+
+
+class TestSubtreeUpdate:
+    """Test completing/collapsing a whole subtree in one call"""
+
+    def test_complete_and_uncomplete_subtree(self, auth_headers):
+        """Test completed is applied to the task and every descendant"""
+        list_id = create_list("Project", auth_headers)
+        root = create_task("Root", list_id, auth_headers)
+        child = create_task("Child", list_id, auth_headers, parent_id=root)
+        create_task("Grandchild", list_id, auth_headers, parent_id=child)
+        other = create_task("Unrelated", list_id, auth_headers)
+
+        response = requests.put(
+            f"{BASE_URL}/tasks/{root}/subtree",
+            json={"completed": True},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert all(t["completed"] for t in flatten([response.json()]))
+
+        tasks = {t["id"]: t for t in flatten(get_list(list_id, auth_headers)["tasks"])}
+        assert tasks[other]["completed"] is False
+        assert sum(t["completed"] for t in tasks.values()) == 3
+
+        response = requests.put(
+            f"{BASE_URL}/tasks/{root}/subtree",
+            json={"completed": False},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert not any(t["completed"] for t in flatten([response.json()]))
+
+    def test_collapse_subtree(self, auth_headers):
+        """Test collapsed is applied to the whole subtree"""
+        list_id = create_list("Outline", auth_headers)
+        root = create_task("Root", list_id, auth_headers)
+        create_task("Child", list_id, auth_headers, parent_id=root)
+
+        response = requests.put(
+            f"{BASE_URL}/tasks/{root}/subtree",
+            json={"collapsed": True},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert all(t["collapsed"] for t in flatten([response.json()]))
+
+    def test_subtree_update_requires_boolean_fields(self, auth_headers):
+        """Test missing or non-boolean fields are rejected"""
+        list_id = create_list("List", auth_headers)
+        task_id = create_task("Task", list_id, auth_headers)
+
+        response = requests.put(
+            f"{BASE_URL}/tasks/{task_id}/subtree", json={}, headers=auth_headers
+        )
+        assert response.status_code == 400
+
+        response = requests.put(
+            f"{BASE_URL}/tasks/{task_id}/subtree",
+            json={"completed": "yes"},
+            headers=auth_headers
+        )
+        assert response.status_code == 400
+
+    def test_cannot_update_other_users_subtree(self, auth_headers):
+        """Test another user cannot cascade over someone else's task"""
+        list_id = create_list("Private", auth_headers)
+        task_id = create_task("Task", list_id, auth_headers)
+
+        username = f"bulk_other_{os.urandom(4).hex()}"
+        r = requests.post(
+            f"{BASE_URL}/register",
+            json={"username": username, "password": "pass123"}
+        )
+        other_headers = {"Authorization": f"Bearer {r.json()['token']}"}
+
+        response = requests.put(
+            f"{BASE_URL}/tasks/{task_id}/subtree",
+            json={"completed": True},
+            headers=other_headers
+        )
+        assert response.status_code == 403
+
+
+class TestClearCompleted:
+    """Test deleting all completed tasks in a list"""
+
+    def test_clear_completed_removes_completed_subtrees(self, auth_headers):
+        """Test completed tasks and their descendants are deleted"""
+        list_id = create_list("Chores", auth_headers)
+        done = create_task("Done", list_id, auth_headers)
+        create_task("Child of done", list_id, auth_headers, parent_id=done)
+        keep = create_task("Keep", list_id, auth_headers)
+        done_child = create_task("Done child", list_id, auth_headers, parent_id=keep)
+
+        for task_id in (done, done_child):
+            requests.put(
+                f"{BASE_URL}/tasks/{task_id}",
+                json={"completed": True},
+                headers=auth_headers
+            )
+
+        response = requests.delete(
+            f"{BASE_URL}/lists/{list_id}/completed", headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert response.json()["deleted"] == 3
+
+        remaining = [t["id"] for t in flatten(get_list(list_id, auth_headers)["tasks"])]
+        assert remaining == [keep]
+
+    def test_clear_completed_other_users_list(self, auth_headers):
+        """Test clearing another user's list is forbidden"""
+        list_id = create_list("Private", auth_headers)
+
+        username = f"bulk_other_{os.urandom(4).hex()}"
+        r = requests.post(
+            f"{BASE_URL}/register",
+            json={"username": username, "password": "pass123"}
+        )
+        other_headers = {"Authorization": f"Bearer {r.json()['token']}"}
+
+        response = requests.delete(
+            f"{BASE_URL}/lists/{list_id}/completed", headers=other_headers
+        )
+        assert response.status_code == 403
+
+
+def shape(tasks):
+    """Nested (title, completed) tuples describing a task tree"""
+    return [(t["title"], t["completed"], shape(t["children"])) for t in tasks]
+
+
+class TestClone:
+    """Test copying lists and subtrees in one call"""
+
+    def build_template(self, headers):
+        list_id = create_list("Release", headers)
+        prep = create_task("Prepare", list_id, headers)
+        create_task("Changelog", list_id, headers, parent_id=prep)
+        tag = create_task("Tag", list_id, headers, parent_id=prep)
+        create_task("Sign", list_id, headers, parent_id=tag)
+        create_task("Publish", list_id, headers)
+        requests.put(f"{BASE_URL}/tasks/{tag}", json={"completed": True}, headers=headers)
+        return list_id, prep
+
+    def test_clone_list_copies_hierarchy(self, auth_headers):
+        """Test a cloned list has the same tree with new ids"""
+        list_id, _ = self.build_template(auth_headers)
+        original = get_list(list_id, auth_headers)
+
+        response = requests.post(
+            f"{BASE_URL}/lists/{list_id}/clone", headers=auth_headers
+        )
+        assert response.status_code == 201
+        clone = response.json()
+        assert clone["name"] == "Release (copy)"
+        assert shape(clone["tasks"]) == shape(original["tasks"])
+
+        original_ids = {t["id"] for t in flatten(original["tasks"])}
+        cloned = list(flatten(clone["tasks"]))
+        assert not original_ids & {t["id"] for t in cloned}
+        assert all(t["list_id"] == clone["id"] for t in cloned)
+
+        # The original is untouched and the copy is served by GET too
+        assert get_list(list_id, auth_headers) == original
+        assert get_list(clone["id"], auth_headers)["tasks"] == clone["tasks"]
+
+    def test_clone_ids_stay_dense(self, auth_headers):
+        """Test clones of a growing template get consecutive ids, not a gap
+        the size of the template's id range"""
+        list_id, _ = self.build_template(auth_headers)
+        for i in range(4):
+            create_task(f"Extra {i}", list_id, auth_headers)
+            response = requests.post(
+                f"{BASE_URL}/lists/{list_id}/clone", headers=auth_headers
+            )
+            assert response.status_code == 201
+            ids = sorted(t["id"] for t in flatten(response.json()["tasks"]))
+            assert ids == list(range(ids[0], ids[0] + len(ids)))
+            list_id = response.json()["id"]
+
+    def test_clone_list_reset_completed(self, auth_headers):
+        """Test reset_completed clears completion on every copied task"""
+        list_id, _ = self.build_template(auth_headers)
+        response = requests.post(
+            f"{BASE_URL}/lists/{list_id}/clone",
+            json={"name": "Release 2.0", "reset_completed": True},
+            headers=auth_headers
+        )
+        assert response.status_code == 201
+        assert response.json()["name"] == "Release 2.0"
+        assert not any(t["completed"] for t in flatten(response.json()["tasks"]))
+
+    def test_clone_task_places_copy_after_original(self, auth_headers):
+        """Test a cloned subtree is inserted right after the original"""
+        list_id, prep = self.build_template(auth_headers)
+        response = requests.post(f"{BASE_URL}/tasks/{prep}/clone", headers=auth_headers)
+        assert response.status_code == 201
+        clone = response.json()
+        assert clone["parent_id"] is None
+
+        tasks = get_list(list_id, auth_headers)["tasks"]
+        assert [t["title"] for t in tasks] == ["Prepare", "Prepare", "Publish"]
+        assert [t["position"] for t in tasks] == [0, 1, 2]
+        assert tasks[1]["id"] == clone["id"]
+        assert shape(tasks[1]["children"]) == shape(tasks[0]["children"])
+        ids = sorted(t["id"] for t in flatten([clone]))
+        assert ids == list(range(clone["id"], clone["id"] + len(ids)))
+
+    def test_clone_nested_task(self, auth_headers):
+        """Test cloning a nested task keeps it under the same parent"""
+        list_id, prep = self.build_template(auth_headers)
+        tag = get_list(list_id, auth_headers)["tasks"][0]["children"][1]["id"]
+        response = requests.post(f"{BASE_URL}/tasks/{tag}/clone", headers=auth_headers)
+        assert response.status_code == 201
+        assert response.json()["parent_id"] == prep
+
+        children = get_list(list_id, auth_headers)["tasks"][0]["children"]
+        assert [(c["title"], c["position"]) for c in children] == \
+            [("Changelog", 0), ("Tag", 1), ("Tag", 2)]
+        assert [c["title"] for c in children[2]["children"]] == ["Sign"]
+
+    def test_clone_other_users_data(self, auth_headers):
+        """Test cloning another user's list or task is forbidden"""
+        list_id, prep = self.build_template(auth_headers)
+        r = requests.post(
+            f"{BASE_URL}/register",
+            json={"username": f"bulk_other_{os.urandom(4).hex()}", "password": "pass123"}
+        )
+        other_headers = {"Authorization": f"Bearer {r.json()['token']}"}
+        assert requests.post(f"{BASE_URL}/lists/{list_id}/clone",
+                             headers=other_headers).status_code == 403
+        assert requests.post(f"{BASE_URL}/tasks/{prep}/clone",
+                             headers=other_headers).status_code == 403
@@ -0,0 +1,189 @@
+"""
+Optimistic concurrency test suite
+Tests row versions, ETag / If-Match preconditions and 412 conflicts
+"""
+
+import os
+import threading
+
+import requests
+import pytest
+
+BASE_URL = os.environ.get("TODO_API_BASE", "http://localhost:5000/api")
+
+
+@pytest.fixture
+def auth_headers():
+    """Fixture to create an authenticated user"""
+    username = f"occ_user_{os.urandom(4).hex()}"
+    response = requests.post(
+        f"{BASE_URL}/register",
+        json={"username": username, "password": "occpass123"}
+    )
+    token = response.json()["token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def create_list(name, headers):
+    r = requests.post(f"{BASE_URL}/lists", json={"name": name}, headers=headers)
+    assert r.status_code == 201
+    return r.json()
+
+
+def create_task(title, list_id, headers, parent_id=None):
+    payload = {"title": title, "list_id": list_id}
+    if parent_id is not None:
+        payload["parent_id"] = parent_id
+    r = requests.post(f"{BASE_URL}/tasks", json=payload, headers=headers)
+    assert r.status_code == 201
+    return r.json()
+
+
+def if_match(headers, version):
+    return {**headers, "If-Match": f'"{version}"'}
+
+
+class TestOptimisticConcurrency:
+    """Test compare-and-set updates on tasks and lists"""
+
+    def test_etag_tracks_version(self, auth_headers):
+        """Test responses carry the version as the ETag and updates bump it"""
+        todo_list = create_list("Versions", auth_headers)
+        r = requests.post(f"{BASE_URL}/tasks",
+                          json={"title": "Task", "list_id": todo_list["id"]},
+                          headers=auth_headers)
+        task = r.json()
+        assert task["version"] == 1
+        assert r.headers["ETag"] == '"1"'
+
+        r = requests.put(f"{BASE_URL}/tasks/{task['id']}", json={"title": "Renamed"},
+                         headers=if_match(auth_headers, 1))
+        assert r.status_code == 200
+        assert r.json()["version"] == 2
+        assert r.headers["ETag"] == '"2"'
+
+    def test_stale_if_match_is_rejected(self, auth_headers):
+        """Test a second editor with an old version gets 412 and changes nothing"""
+        todo_list = create_list("Conflict", auth_headers)
+        task = create_task("Task", todo_list["id"], auth_headers)
+        path = f"{BASE_URL}/tasks/{task['id']}"
+
+        first = requests.put(path, json={"title": "First"},
+                             headers=if_match(auth_headers, task["version"]))
+        assert first.status_code == 200
+        second = requests.put(path, json={"title": "Second"},
+                              headers=if_match(auth_headers, task["version"]))
+        assert second.status_code == 412
+        assert second.json()["current_version"] == first.json()["version"]
+
+        # Retrying with the current version succeeds
+        r = requests.put(path, json={"title": "Second"},
+                         headers=if_match(auth_headers, first.json()["version"]))
+        assert r.status_code == 200
+        assert r.json()["title"] == "Second"
+
+    def test_version_in_body(self, auth_headers):
+        """Test the expected version can also be sent as a JSON field"""
+        todo_list = create_list("Body", auth_headers)
+        task = create_task("Task", todo_list["id"], auth_headers)
+        path = f"{BASE_URL}/tasks/{task['id']}"
+        r = requests.put(path, json={"completed": True, "version": 99}, headers=auth_headers)
+        assert r.status_code == 412
+        r = requests.put(path, json={"completed": True, "version": 1}, headers=auth_headers)
+        assert r.status_code == 200
+
+    def test_preconditions_on_other_mutations(self, auth_headers):
+        """Test move, reorder, subtree updates, deletes and renames check versions"""
+        todo_list = create_list("Mutations", auth_headers)
+        task = create_task("Task", todo_list["id"], auth_headers)
+        stale = if_match(auth_headers, 42)
+        checks = [
+            ("put", f"/tasks/{task['id']}/move", {"parent_id": None}),
+            ("put", f"/tasks/{task['id']}/reorder", {"direction": "up"}),
+            ("put", f"/tasks/{task['id']}/subtree", {"completed": True}),
+            ("delete", f"/tasks/{task['id']}", None),
+            ("put", f"/lists/{todo_list['id']}", {"name": "Renamed"}),
+            ("delete", f"/lists/{todo_list['id']}", None),
+        ]
+        for method, path, payload in checks:
+            r = requests.request(method, BASE_URL + path, json=payload, headers=stale)
+            assert r.status_code == 412, path
+
+        r = requests.put(f"{BASE_URL}/lists/{todo_list['id']}", json={"name": "Renamed"},
+                         headers=if_match(auth_headers, todo_list["version"]))
+        assert r.status_code == 200
+        assert r.json()["version"] == todo_list["version"] + 1
+
+    def test_bulk_updates_bump_versions(self, auth_headers):
+        """Test set-based subtree updates bump every affected task's version"""
+        todo_list = create_list("Bulk", auth_headers)
+        parent = create_task("Parent", todo_list["id"], auth_headers)
+        child = create_task("Child", todo_list["id"], auth_headers, parent_id=parent["id"])
+
+        r = requests.put(f"{BASE_URL}/tasks/{parent['id']}/subtree",
+                         json={"completed": True}, headers=auth_headers)
+        assert r.status_code == 200
+        [updated_child] = r.json()["children"]
+        assert updated_child["version"] == child["version"] + 1
+
+        r = requests.put(f"{BASE_URL}/tasks/{child['id']}", json={"title": "Stale"},
+                         headers=if_match(auth_headers, child["version"]))
+        assert r.status_code == 412
+
+    def test_concurrent_writers_one_wins(self, auth_headers):
+        """Test simultaneous updates from the same version: exactly one succeeds"""
+        todo_list = create_list("Race", auth_headers)
+        task = create_task("Task", todo_list["id"], auth_headers)
+        headers = if_match(auth_headers, task["version"])
+        statuses = []
+        barrier = threading.Barrier(8)
+
+        def writer(i):
+            barrier.wait()
+            r = requests.put(f"{BASE_URL}/tasks/{task['id']}",
+                             json={"title": f"Writer {i}"}, headers=headers)
+            statuses.append(r.status_code)
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(statuses) == [200] + [412] * 7
+
+    def test_concurrent_bulk_writers_one_wins(self, auth_headers):
+        """Test set-based writes from the same version: exactly one succeeds,
+        even when the others passed the version check before it committed"""
+        todo_list = create_list("Bulk race", auth_headers)
+        task = create_task("Task", todo_list["id"], auth_headers)
+        create_task("Child", todo_list["id"], auth_headers, parent_id=task["id"])
+
+        def race(method, path, version, count=8):
+            statuses = []
+            barrier = threading.Barrier(count)
+
+            def writer(i):
+                barrier.wait()
+                r = requests.request(method, BASE_URL + path,
+                                     json={"completed": i % 2 == 0},
+                                     headers=if_match(auth_headers, version))
+                statuses.append(r.status_code)
+
+            threads = [threading.Thread(target=writer, args=(i,)) for i in range(count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return statuses
+
+        statuses = race("put", f"/tasks/{task['id']}/subtree", task["version"])
+        assert sorted(statuses) == [200] + [412] * 7
+
+        # Late deletes may find the task already gone
+        statuses = race("delete", f"/tasks/{task['id']}", task["version"] + 1)
+        assert statuses.count(200) == 1
+        assert set(statuses) <= {200, 404, 412}
+
+        statuses = race("delete", f"/lists/{todo_list['id']}", todo_list["version"])
+        assert statuses.count(200) == 1
+        assert set(statuses) <= {200, 404, 412}
@@ -0,0 +1,94 @@
+"""
+Read/write routing unit tests
+Exercises reader/writer engine selection on a throwaway Flask app
+"""
+
+import os
+import sys
+
+import pytest
+from flask import Flask, jsonify, request
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dbrouting import ReadRouter, RoutingSession, configure_routing, reader_url  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path):
+    """App with one model, a read route and a write route"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path}/routing.db'
+    app.config['DB_ROUTING_ENABLED'] = True
+    app.config['DB_READ_YOUR_WRITES_SECONDS'] = 60
+    configure_routing(app)
+    db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+    ReadRouter(app, db)
+
+    class Item(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String(50))
+
+    def as_user():
+        if 'user' in request.args:
+            request.current_user_id = int(request.args['user'])
+
+    @app.route('/items', methods=['GET'])
+    def read_items():
+        as_user()
+        items = Item.query.all()
+        bind = db.session.get_bind(mapper=Item, clause=Item.__table__.select())
+        return jsonify({'engine': str(bind.url), 'count': len(items)})
+
+    @app.route('/items', methods=['POST'])
+    def write_item():
+        as_user()
+        db.session.add(Item(name='x'))
+        db.session.commit()
+        return jsonify({'engine': str(db.session.get_bind(mapper=Item).url)})
+
+    with app.app_context():
+        db.create_all()
+    with app.test_client() as client:
+        client.db = db
+        yield client
+
+
+class TestReadRouting:
+    """Test reads go to the read-only pool and writes to the writer"""
+
+    def test_reader_url_is_read_only(self):
+        """Test SQLite URLs are rewritten to mode=ro URIs"""
+        url = reader_url('sqlite:////tmp/app.db')
+        assert url.database == 'file:/tmp/app.db'
+        assert url.query == {'mode': 'ro', 'uri': 'true'}
+        assert str(reader_url('sqlite://')) == 'sqlite://'
+
+    def test_get_reads_from_reader(self, client):
+        """Test a GET request queries the read-only engine"""
+        body = client.get('/items').get_json()
+        assert 'mode=ro' in body['engine']
+
+    def test_post_writes_through_writer(self, client):
+        """Test mutations use the writer and are visible to later reads"""
+        body = client.post('/items').get_json()
+        assert 'mode=ro' not in body['engine']
+        assert client.get('/items').get_json()['count'] == 1
+
+    def test_reader_cannot_write(self, client):
+        """Test the reader pool is opened read-only"""
+        with client.application.app_context():
+            reader = client.db.engines['reader']
+        with pytest.raises(OperationalError, match='readonly'):
+            with reader.begin() as conn:
+                conn.execute(text("INSERT INTO item (name) VALUES ('y')"))
+
+    def test_read_your_writes(self, client):
+        """Test a user who just committed reads from the writer"""
+        client.post('/items?user=1')
+        assert 'mode=ro' not in client.get('/items?user=1').get_json()['engine']
+        # Other users are unaffected
+        assert 'mode=ro' in client.get('/items?user=2').get_json()['engine']
@@ -0,0 +1,149 @@
+"""
+Group commit unit tests
+Exercises batching, savepoint isolation, deferred and failure calls on a
+throwaway Flask app
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+
+import pytest
+from flask import Flask, jsonify, request
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dbrouting import RoutingSession  # noqa: E402
+from groupcommit import GroupCommitter, grouped  # noqa: E402
+
+
+@pytest.fixture
+def env(tmp_path):
+    """App whose POST /items runs through a group committer"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path}/group.db'
+    app.config['GROUP_COMMIT_ENABLED'] = True
+    app.config['GROUP_COMMIT_WINDOW_MS'] = 200
+    app.config['GROUP_COMMIT_MAX_OPS'] = 4
+    db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+    committer = GroupCommitter(app, db)
+    after_commit = []
+    # Records each name and whether another connection can already see it
+    record = committer.deferred(
+        lambda name: after_commit.append((name, name in stored_names(tmp_path / 'group.db')))
+    )
+
+    class Item(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String(50))
+
+    @app.route('/items', methods=['POST'])
+    @grouped
+    def create_item():
+        name = request.args['name']
+        db.session.add(Item(name=name))
+        db.session.commit()
+        if name.startswith('fail'):
+            raise RuntimeError(name)
+        record(name)
+        return jsonify({'name': name}), 201
+
+    with app.app_context():
+        db.create_all()
+        commits = []
+        event.listen(db.engine, 'commit', lambda conn: commits.append(1))
+    yield app, committer, after_commit, commits, tmp_path / 'group.db'
+    committer.shutdown()
+
+
+def post_concurrently(app, names):
+    """POST one item per name, all at once; returns name -> status"""
+    statuses = {}
+    barrier = threading.Barrier(len(names))
+
+    def post(name):
+        client = app.test_client()
+        barrier.wait()
+        statuses[name] = client.post(f'/items?name={name}').status_code
+
+    threads = [threading.Thread(target=post, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def stored_names(path):
+    with sqlite3.connect(path) as conn:
+        return sorted(row[0] for row in conn.execute('SELECT name FROM item'))
+
+
+class TestGroupCommit:
+    """Test batching mutations into shared transactions"""
+
+    def test_concurrent_writes_share_commits(self, env):
+        """Test concurrent requests are committed together, at most N per group"""
+        app, committer, after_commit, commits, path = env
+        names = [f'item{i}' for i in range(8)]
+        assert set(post_concurrently(app, names).values()) == {201}
+        assert stored_names(path) == sorted(names)
+        assert committer.operations == 8
+        assert 2 <= committer.groups < 8
+        assert len(commits) == committer.groups
+
+    def test_failed_operation_is_isolated(self, env):
+        """Test a failing request is rolled back without failing its group"""
+        app, committer, after_commit, commits, path = env
+        statuses = post_concurrently(app, ['ok1', 'fail', 'ok2'])
+        assert statuses == {'ok1': 201, 'fail': 500, 'ok2': 201}
+        assert stored_names(path) == ['ok1', 'ok2']
+
+    def test_deferred_calls_run_after_commit(self, env):
+        """Test deferred calls run once the data is durable, and only on success"""
+        app, committer, after_commit, commits, path = env
+        post_concurrently(app, ['first', 'fail'])
+        assert after_commit == [('first', True)]
+
+    def test_failure_handlers_run_only_on_failure(self, env):
+        """Test on_failure calls run for failed operations and are dropped otherwise"""
+        app, committer, after_commit, commits, path = env
+        undone = []
+        undo = committer.on_failure(undone.append)
+
+        @app.route('/undo', methods=['POST'])
+        @grouped
+        def undoable():
+            name = request.args['name']
+            undo(name)
+            if name.startswith('fail'):
+                raise RuntimeError(name)
+            return jsonify({}), 201
+
+        client = app.test_client()
+        assert client.post('/undo?name=ok').status_code == 201
+        assert client.post('/undo?name=fail').status_code == 500
+        assert undone == ['fail']
+        undo('outside')
+        assert undone == ['fail']
+
+    def test_disabled_runs_inline(self, tmp_path):
+        """Test views run on the request thread when group commit is off"""
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path}/inline.db'
+        db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+        committer = GroupCommitter(app, db)
+        threads = []
+
+        @app.route('/where', methods=['POST'])
+        @grouped
+        def where():
+            threads.append(threading.current_thread().name)
+            return jsonify({})
+
+        app.test_client().post('/where')
+        assert not committer.enabled
+        assert threads == [threading.main_thread().name]
@@ -0,0 +1,202 @@
+"""
+Job runner unit tests
+Exercises concurrency limits, cancellation, crash recovery and the sweeper
+on a throwaway app
+"""
+
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from jobs import JobRunner, Sweeper  # noqa: E402
+
+
+@pytest.fixture
+def env(tmp_path):
+    """Flask app with a minimal job table and a runner bound to it"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path}/jobs.db'
+    app.config['JOBS_MAX_WORKERS'] = 4
+    app.config['JOBS_PER_USER'] = 1
+    db = SQLAlchemy(app)
+
+    class Job(db.Model):
+        __tablename__ = 'jobs'
+        id = db.Column(db.Integer, primary_key=True)
+        user_id = db.Column(db.Integer, nullable=False)
+        kind = db.Column(db.String(50), nullable=False)
+        params = db.Column(db.Text)
+        status = db.Column(db.String(20), nullable=False, default='queued')
+        progress_done = db.Column(db.Integer, default=0)
+        progress_total = db.Column(db.Integer, nullable=True)
+        result = db.Column(db.Text, nullable=True)
+        error = db.Column(db.Text, nullable=True)
+        cancel_requested = db.Column(db.Boolean, default=False)
+        attempts = db.Column(db.Integer, default=0)
+        created_at = db.Column(db.DateTime, default=datetime.utcnow)
+        started_at = db.Column(db.DateTime, nullable=True)
+        finished_at = db.Column(db.DateTime, nullable=True)
+
+    with app.app_context():
+        db.create_all()
+    runner = JobRunner(app, db, Job)
+    yield app, db, Job, runner
+    runner.shutdown()
+
+
+def wait_status(app, db, Job, job_id, statuses=('succeeded', 'failed', 'cancelled')):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        with app.app_context():
+            job = db.session.get(Job, job_id)
+            if job.status in statuses:
+                return job.status, job.result, job.error
+        time.sleep(0.01)
+    pytest.fail(f'job {job_id} stuck')
+
+
+class TestJobRunner:
+    """Test the background job runner"""
+
+    def test_result_and_failure(self, env):
+        """Test handler results are stored and exceptions fail the job"""
+        app, db, Job, runner = env
+
+        @runner.handler('add')
+        def add(ctx, a, b):
+            ctx.progress(1, 1)
+            return {'sum': a + b}
+
+        @runner.handler('boom')
+        def boom(ctx):
+            raise RuntimeError('boom')
+
+        with app.app_context():
+            ok = runner.submit(1, 'add', a=2, b=3).id
+            bad = runner.submit(2, 'boom').id
+        assert wait_status(app, db, Job, ok) == ('succeeded', '{"sum": 5}', None)
+        assert wait_status(app, db, Job, bad) == ('failed', None, 'boom')
+
+    def test_per_user_concurrency_limit(self, env):
+        """Test a user's jobs run one at a time while other users proceed"""
+        app, db, Job, runner = env
+        active = {}
+        peak = {}
+        lock = threading.Lock()
+
+        @runner.handler('sleep')
+        def sleep(ctx):
+            with lock:
+                active[ctx.user_id] = active.get(ctx.user_id, 0) + 1
+                peak[ctx.user_id] = max(peak.get(ctx.user_id, 0), active[ctx.user_id])
+            time.sleep(0.05)
+            with lock:
+                active[ctx.user_id] -= 1
+
+        with app.app_context():
+            ids = [runner.submit(user, 'sleep').id for user in (1, 1, 1, 2, 2)]
+        for job_id in ids:
+            assert wait_status(app, db, Job, job_id)[0] == 'succeeded'
+        assert peak == {1: 1, 2: 1}
+
+    def test_cancel_queued_and_running(self, env):
+        """Test queued jobs cancel at once and running jobs at a checkpoint"""
+        app, db, Job, runner = env
+        started = threading.Event()
+
+        @runner.handler('loop')
+        def loop(ctx):
+            started.set()
+            while True:
+                ctx.check_cancelled()
+                time.sleep(0.01)
+
+        with app.app_context():
+            running = runner.submit(1, 'loop').id
+            queued = runner.submit(1, 'loop').id
+            assert started.wait(5)
+            assert runner.cancel(db.session.get(Job, queued))
+            assert runner.cancel(db.session.get(Job, running))
+        assert wait_status(app, db, Job, running)[0] == 'cancelled'
+        assert wait_status(app, db, Job, queued)[0] == 'cancelled'
+        with app.app_context():
+            assert not runner.cancel(db.session.get(Job, running))
+
+    def test_recover_requeues_interrupted_jobs(self, env):
+        """Test jobs left running by a crashed process are retried or given up"""
+        app, db, Job, runner = env
+
+        @runner.handler('noop')
+        def noop(ctx):
+            return 'done'
+
+        with app.app_context():
+            db.session.add_all([
+                Job(id=1, user_id=1, kind='noop', status='running', attempts=1),
+                Job(id=2, user_id=1, kind='noop', status='running', attempts=3),
+                Job(id=3, user_id=2, kind='noop', status='running', attempts=1,
+                    cancel_requested=True),
+                Job(id=4, user_id=2, kind='noop', status='queued'),
+            ])
+            db.session.commit()
+            runner.recover()
+        assert wait_status(app, db, Job, 1) == ('succeeded', '"done"', None)
+        assert wait_status(app, db, Job, 2)[0] == 'failed'
+        assert wait_status(app, db, Job, 3)[0] == 'cancelled'
+        assert wait_status(app, db, Job, 4)[0] == 'succeeded'
+
+    def test_recover_leaves_jobs_of_live_siblings(self, env):
+        """Test only jobs claimed before this process started are taken over"""
+        app, db, Job, runner = env
+        started = datetime.utcnow()
+
+        @runner.handler('noop')
+        def noop(ctx):
+            return 'done'
+
+        with app.app_context():
+            db.session.add_all([
+                Job(id=1, user_id=1, kind='noop', status='running', attempts=1,
+                    started_at=started - timedelta(minutes=5)),
+                Job(id=2, user_id=2, kind='noop', status='running', attempts=1,
+                    started_at=started + timedelta(seconds=1)),
+            ])
+            db.session.commit()
+            runner.recover(started_before=started)
+        assert wait_status(app, db, Job, 1)[0] == 'succeeded'
+        with app.app_context():
+            assert db.session.get(Job, 2).status == 'running'
+
+
+class TestSweeper:
+    """Test the incremental background sweeper"""
+
+    def test_batches_resume_from_cursor(self):
+        """Test a pass runs batch after batch until the step reports it is done"""
+        app = Flask(__name__)
+        items = list(range(7))
+        batches = []
+        done = threading.Event()
+
+        def step(cursor):
+            start = 0 if cursor is None else cursor
+            batch = items[start:start + 3]
+            if not batch:
+                done.set()
+                return None
+            batches.append(batch)
+            return start + len(batch)
+
+        sweeper = Sweeper(app, step, interval=0.01, pause=0)
+        sweeper.start()
+        assert done.wait(5)
+        sweeper.stop()
+        assert batches[:3] == [[0, 1, 2], [3, 4, 5], [6]]
@@ -0,0 +1,186 @@
+"""
+Background job test suite
+Tests 202 job submission, polling, results and cancellation
+"""
+
+import os
+import time
+
+import requests
+import pytest
+
+BASE_URL = os.environ.get("TODO_API_BASE", "http://localhost:5000/api")
+
+
+@pytest.fixture
+def auth_headers():
+    """Fixture to create an authenticated user"""
+    username = f"job_user_{os.urandom(4).hex()}"
+    response = requests.post(
+        f"{BASE_URL}/register",
+        json={"username": username, "password": "jobpass123"}
+    )
+    token = response.json()["token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def create_list(name, headers):
+    r = requests.post(f"{BASE_URL}/lists", json={"name": name}, headers=headers)
+    assert r.status_code == 201
+    return r.json()["id"]
+
+
+def create_task(title, list_id, headers, parent_id=None):
+    payload = {"title": title, "list_id": list_id}
+    if parent_id is not None:
+        payload["parent_id"] = parent_id
+    r = requests.post(f"{BASE_URL}/tasks", json=payload, headers=headers)
+    assert r.status_code == 201
+    return r.json()["id"]
+
+
+def get_list(list_id, headers):
+    r = requests.get(f"{BASE_URL}/lists", headers=headers)
+    assert r.status_code == 200
+    return next((l for l in r.json() if l["id"] == list_id), None)
+
+
+def wait_for(job_id, headers, timeout=10):
+    """Poll a job until it reaches a final status"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        r = requests.get(f"{BASE_URL}/jobs/{job_id}", headers=headers)
+        assert r.status_code == 200
+        job = r.json()
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return job
+        time.sleep(0.05)
+    pytest.fail(f"job {job_id} did not finish")
+
+
+def submit(response):
+    """Check a 202 response and return the job id"""
+    assert response.status_code == 202
+    job = response.json()
+    assert response.headers["Location"].endswith(f"/jobs/{job['id']}")
+    assert job["status"] in ("queued", "running", "succeeded")
+    return job["id"]
+
+
+class TestJobs:
+    """Test expensive operations running as background jobs"""
+
+    def test_async_subtree_delete(self, auth_headers):
+        """Test ?async=1 deletes the whole subtree in the background"""
+        list_id = create_list("Delete", auth_headers)
+        root = create_task("Root", list_id, auth_headers)
+        child = create_task("Child", list_id, auth_headers, parent_id=root)
+        create_task("Grandchild", list_id, auth_headers, parent_id=child)
+        keep = create_task("Keep", list_id, auth_headers)
+
+        job_id = submit(requests.delete(
+            f"{BASE_URL}/tasks/{root}?async=1", headers=auth_headers
+        ))
+        job = wait_for(job_id, auth_headers)
+        assert job["status"] == "succeeded"
+        assert job["result"]["deleted"] == 3
+        assert job["progress"] == {"done": 3, "total": 3}
+
+        tasks = get_list(list_id, auth_headers)["tasks"]
+        assert [t["id"] for t in tasks] == [keep]
+
+    def test_export_then_import_roundtrip(self, auth_headers):
+        """Test an exported tree imports as an identical new list"""
+        list_id = create_list("Source", auth_headers)
+        root = create_task("Root", list_id, auth_headers)
+        create_task("Child A", list_id, auth_headers, parent_id=root)
+        create_task("Child B", list_id, auth_headers, parent_id=root)
+        requests.put(f"{BASE_URL}/tasks/{root}", json={"completed": True},
+                     headers=auth_headers)
+
+        job = wait_for(submit(requests.post(
+            f"{BASE_URL}/lists/{list_id}/export", headers=auth_headers
+        )), auth_headers)
+        assert job["status"] == "succeeded"
+        exported = job["result"]
+        assert exported["name"] == "Source"
+
+        job = wait_for(submit(requests.post(
+            f"{BASE_URL}/lists/import",
+            json={"name": "Copy", "tasks": exported["tasks"]},
+            headers=auth_headers
+        )), auth_headers)
+        assert job["status"] == "succeeded"
+        assert job["result"]["tasks"] == 3
+
+        copy = get_list(job["result"]["list_id"], auth_headers)
+        assert copy["name"] == "Copy"
+        [copied_root] = copy["tasks"]
+        assert copied_root["title"] == "Root"
+        assert copied_root["completed"] is True
+        assert [c["title"] for c in copied_root["children"]] == ["Child A", "Child B"]
+
+    def test_import_rejects_invalid_tree(self, auth_headers):
+        """Test malformed imports are rejected before a job is created"""
+        r = requests.post(
+            f"{BASE_URL}/lists/import",
+            json={"name": "Bad", "tasks": [{"children": []}]},
+            headers=auth_headers
+        )
+        assert r.status_code == 400
+
+    def test_renumber_positions(self, auth_headers):
+        """Test renumbering keeps sibling order and compacts positions"""
+        list_id = create_list("Renumber", auth_headers)
+        ids = [create_task(f"T{i}", list_id, auth_headers) for i in range(4)]
+        # Deleting leaves a gap in the positions
+        requests.delete(f"{BASE_URL}/tasks/{ids[1]}", headers=auth_headers)
+
+        job = wait_for(submit(requests.post(
+            f"{BASE_URL}/lists/{list_id}/renumber", headers=auth_headers
+        )), auth_headers)
+        assert job["status"] == "succeeded"
+        assert job["result"] == {"tasks": 3, "renumbered": 2}
+
+        tasks = get_list(list_id, auth_headers)["tasks"]
+        assert [(t["id"], t["position"]) for t in tasks] == \
+            [(ids[0], 0), (ids[2], 1), (ids[3], 2)]
+
+    def test_cancel_finished_job_conflicts(self, auth_headers):
+        """Test a finished job cannot be cancelled"""
+        list_id = create_list("Cancel", auth_headers)
+        job_id = submit(requests.post(
+            f"{BASE_URL}/lists/{list_id}/export", headers=auth_headers
+        ))
+        wait_for(job_id, auth_headers)
+        r = requests.post(f"{BASE_URL}/jobs/{job_id}/cancel", headers=auth_headers)
+        assert r.status_code == 409
+
+    def test_jobs_are_private(self, auth_headers):
+        """Test other users cannot read or cancel a job"""
+        list_id = create_list("Private", auth_headers)
+        job_id = submit(requests.post(
+            f"{BASE_URL}/lists/{list_id}/export", headers=auth_headers
+        ))
+        other = requests.post(
+            f"{BASE_URL}/register",
+            json={"username": f"job_other_{os.urandom(4).hex()}", "password": "x"}
+        ).json()["token"]
+        other_headers = {"Authorization": f"Bearer {other}"}
+        assert requests.get(f"{BASE_URL}/jobs/{job_id}",
+                            headers=other_headers).status_code == 403
+        assert requests.post(f"{BASE_URL}/jobs/{job_id}/cancel",
+                             headers=other_headers).status_code == 403
+        assert requests.post(f"{BASE_URL}/lists/{list_id}/export",
+                             headers=other_headers).status_code == 403
+
+    def test_list_jobs(self, auth_headers):
+        """Test the user's jobs are listed newest first"""
+        list_id = create_list("Listing", auth_headers)
+        first = submit(requests.post(f"{BASE_URL}/lists/{list_id}/export",
+                                     headers=auth_headers))
+        second = submit(requests.post(f"{BASE_URL}/lists/{list_id}/renumber",
+                                      headers=auth_headers))
+        r = requests.get(f"{BASE_URL}/jobs", headers=auth_headers)
+        assert r.status_code == 200
+        assert [j["id"] for j in r.json()] == [second, first]
@@ -0,0 +1,104 @@
+"""
+Metrics endpoint test suite
+Tests the Prometheus-style /metrics exposition
+"""
+
+import os
+import re
+import requests
+import pytest
+
+BASE_URL = os.environ.get("TODO_API_BASE", "http://localhost:5000/api")
+METRICS_URL = BASE_URL.rsplit("/api", 1)[0] + "/metrics"
+# The backend must run with METRICS_ENABLED=1; pass its METRICS_TOKEN, if any
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+
+def scrape():
+    """Fetch /metrics and parse unlabelled and labelled samples into a dict"""
+    headers = {"Authorization": f"Bearer {METRICS_TOKEN}"} if METRICS_TOKEN else {}
+    response = requests.get(METRICS_URL, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain")
+    samples = {}
+    for line in response.text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, value = line.rsplit(" ", 1)
+        samples[name] = float(value)
+    return samples
+
+
+@pytest.fixture
+def auth_headers():
+    """Fixture to create an authenticated user"""
+    username = f"metrics_user_{os.urandom(4).hex()}"
+    response = requests.post(
+        f"{BASE_URL}/register",
+        json={"username": username, "password": "metricspass"}
+    )
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+class TestMetrics:
+    """Test request, SQL and auth metrics"""
+
+    def test_request_counts_and_latency(self, auth_headers):
+        """Test a request shows up in the per-route counter and histograms"""
+        key = 'todo_http_requests_total{route="get_lists",method="GET",status="200"}'
+        before = scrape().get(key, 0)
+
+        requests.get(f"{BASE_URL}/lists", headers=auth_headers)
+
+        samples = scrape()
+        assert samples[key] == before + 1
+        assert samples['todo_http_request_duration_seconds_count{route="get_lists",method="GET"}'] >= 1
+        assert samples['todo_http_response_size_bytes_count{route="get_lists",method="GET"}'] >= 1
+        assert samples['todo_sql_statements_per_request_count{route="get_lists",method="GET"}'] >= 1
+
+    def test_sql_and_commit_counters(self, auth_headers):
+        """Test writes increase SQL statement and commit totals"""
+        before = scrape()
+        response = requests.post(
+            f"{BASE_URL}/lists", json={"name": "Metrics"}, headers=auth_headers
+        )
+        assert response.status_code == 201
+
+        after = scrape()
+        assert after["todo_sql_statements_total"] > before["todo_sql_statements_total"]
+        assert after["todo_db_commits_total"] > before["todo_db_commits_total"]
+
+    def test_statement_cache_hits(self, auth_headers):
+        """Test repeated requests reuse compiled statements"""
+        requests.get(f"{BASE_URL}/lists", headers=auth_headers)
+        before = scrape()
+        for _ in range(3):
+            requests.get(f"{BASE_URL}/lists", headers=auth_headers)
+        after = scrape()
+        assert after["todo_sql_cache_hits_total"] >= before["todo_sql_cache_hits_total"] + 3
+        assert after["todo_sql_cache_misses_total"] == before["todo_sql_cache_misses_total"]
+
+    def test_auth_failures_counted(self):
+        """Test rejected tokens increase the auth failure counter"""
+        before = scrape()["todo_auth_failures_total"]
+        requests.get(
+            f"{BASE_URL}/lists", headers={"Authorization": "Bearer not_a_token"}
+        )
+        assert scrape()["todo_auth_failures_total"] == before + 1
+
+    def test_histogram_buckets_are_cumulative(self, auth_headers):
+        """Test bucket counts never decrease and end at the total count"""
+        requests.get(f"{BASE_URL}/lists", headers=auth_headers)
+        samples = scrape()
+        pattern = re.compile(
+            r'todo_http_request_duration_seconds_bucket\{route="get_lists",method="GET",le="([^"]+)"\}'
+        )
+        buckets = [value for name, value in samples.items() if pattern.fullmatch(name)]
+        assert buckets == sorted(buckets)
+        assert buckets[-1] == samples['todo_http_request_duration_seconds_count{route="get_lists",method="GET"}']
+
+    @pytest.mark.skipif(not METRICS_TOKEN, reason="METRICS_TOKEN not set")
+    def test_scrape_requires_token(self, auth_headers):
+        """Test scrapes without the metrics token, or with a user's token, are refused"""
+        assert requests.get(METRICS_URL).status_code == 403
+        assert requests.get(METRICS_URL, headers=auth_headers).status_code == 403
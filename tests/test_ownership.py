@@ -0,0 +1,77 @@
+"""
+Owned-list cache unit tests
+Exercises expiry, forgetting and the LRU bound on a throwaway Flask app
+"""
+
+import os
+import sys
+import time
+
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ownership import OwnedListCache  # noqa: E402
+
+
+def make_cache(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    return OwnedListCache(app)
+
+
+class TestOwnedListCache:
+    """Test caching the ids of each user's lists"""
+
+    def test_owns_cached_lists_only(self):
+        """Test only cached lists of the same user count as owned"""
+        cache = make_cache()
+        assert not cache.owns(1, 10)
+        cache.put(1, [10, 11], cache.begin())
+        assert cache.owns(1, 10) and cache.owns(1, 11)
+        assert not cache.owns(1, 12)
+        assert not cache.owns(2, 10)
+        assert (cache.hits, cache.misses) == (2, 3)
+
+    def test_entries_expire(self):
+        """Test sets are dropped after the TTL"""
+        cache = make_cache(OWNERSHIP_CACHE_TTL=0.05)
+        cache.put(1, [10], cache.begin())
+        assert cache.owns(1, 10)
+        time.sleep(0.06)
+        assert not cache.owns(1, 10)
+
+    def test_forget_rejects_older_reads(self):
+        """Test a set read before the user was forgotten is not cached"""
+        cache = make_cache()
+        cache.put(1, [10], cache.begin())
+        started = cache.begin()
+        cache.forget(1)
+        assert not cache.owns(1, 10)
+        cache.put(1, [10], started)
+        assert not cache.owns(1, 10)
+        cache.put(1, [11], cache.begin())
+        assert cache.owns(1, 11)
+
+    def test_size_bound_and_disabled(self):
+        """Test the least recently used user is evicted, and TTL 0 disables"""
+        cache = make_cache(OWNERSHIP_CACHE_SIZE=2)
+        for user_id in (1, 2, 3):
+            cache.put(user_id, [user_id * 10], cache.begin())
+        assert not cache.owns(1, 10)
+        assert cache.owns(3, 30)
+        cache = make_cache(OWNERSHIP_CACHE_TTL=0)
+        cache.put(1, [10], cache.begin())
+        assert not cache.enabled and not cache.owns(1, 10)
+
+    def test_stamps_are_bounded(self):
+        """Test stamps are kept for at most the cache size, conservatively"""
+        cache = make_cache(OWNERSHIP_CACHE_SIZE=2)
+        started = cache.begin()
+        for user_id in (1, 2, 3, 4):
+            cache.forget(user_id)
+        assert len(cache._stamps) == 2
+        cache.put(1, [10], started)
+        assert not cache.owns(1, 10)
+        cache.put(1, [10], cache.begin())
+        assert cache.owns(1, 10)
@@ -0,0 +1,97 @@
+"""
+Request profiler unit tests
+Exercises token and sampled profiling, saved profiles and the listing
+endpoints on a throwaway Flask app
+"""
+
+import os
+import pstats
+import sys
+
+import pytest
+from flask import Flask, jsonify, request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from profiler import RequestProfiler  # noqa: E402
+
+TOKEN = 'profile-secret'
+
+
+def make_app(tmp_path, **config):
+    app = Flask(__name__)
+    app.config['PROFILE_DIR'] = str(tmp_path / 'profiles')
+    app.config.update(config)
+
+    @app.route('/api/lists')
+    def lists():
+        request.current_user_id = 7
+        return jsonify([{'id': i, 'tasks': []} for i in range(100)])
+
+    return app, RequestProfiler(app)
+
+
+@pytest.fixture
+def env(tmp_path):
+    app, profiler = make_app(tmp_path, PROFILE_TOKEN=TOKEN, PROFILE_KEEP=3)
+    return app.test_client(), profiler, tmp_path / 'profiles'
+
+
+class TestRequestProfiler:
+    """Test selecting, saving and listing request profiles"""
+
+    def test_disabled_installs_nothing(self, tmp_path):
+        """Test the WSGI app is left untouched without a token or sample rate"""
+        app = Flask(__name__)
+        wsgi_app = app.wsgi_app
+        profiler = RequestProfiler(app)
+        assert not profiler.enabled
+        assert app.wsgi_app == wsgi_app
+        assert 'list_profiles' not in app.view_functions
+
+    def test_profiles_requests_with_token(self, env):
+        """Test only requests carrying the token are profiled, with metadata"""
+        client, profiler, directory = env
+        assert client.get('/api/lists').status_code == 200
+        assert client.get('/api/lists', headers={'X-Profile': 'wrong'}).status_code == 200
+        assert profiler.saved == 0
+
+        r = client.get('/api/lists?x=1', headers={'X-Profile': TOKEN})
+        assert r.status_code == 200 and len(r.get_json()) == 100
+        profiles = client.get('/api/debug/profiles', headers={'X-Profile': TOKEN}).get_json()
+        assert len(profiles) == 1
+        meta = profiles[0]
+        assert (meta['endpoint'], meta['user_id'], meta['status']) == ('lists', 7, 200)
+        assert meta['reason'] == 'requested' and meta['query'] == 'x=1'
+        assert any('jsonify' in row['function'] for row in meta['top'])
+
+        r = client.get(f"/api/debug/profiles/{meta['id']}", headers={'X-Profile': TOKEN})
+        assert r.status_code == 200
+        path = directory / 'download.prof'
+        path.write_bytes(r.data)
+        assert pstats.Stats(str(path)).total_calls == meta['total_calls']
+
+    def test_listing_requires_token(self, env):
+        """Test profiles are only served with the token"""
+        client, profiler, directory = env
+        assert client.get('/api/debug/profiles').status_code == 403
+        assert client.get('/api/debug/profiles/x', headers={'X-Profile': TOKEN}).status_code == 404
+
+    def test_keeps_newest_profiles(self, env):
+        """Test only the newest PROFILE_KEEP profiles are kept on disk"""
+        client, profiler, directory = env
+        for _ in range(5):
+            client.get('/api/lists', headers={'X-Profile': TOKEN})
+        assert profiler.saved == 5
+        assert len(os.listdir(directory)) == 6
+        profiles = client.get('/api/debug/profiles', headers={'X-Profile': TOKEN}).get_json()
+        assert len(profiles) == 3
+        assert profiles == sorted(profiles, key=lambda p: p['id'], reverse=True)
+
+    def test_sampling(self, tmp_path):
+        """Test a sample rate of 1 profiles every request without a token"""
+        app, profiler = make_app(tmp_path, PROFILE_SAMPLE_RATE=1.0)
+        client = app.test_client()
+        client.get('/api/lists')
+        assert profiler.saved == 1
+        assert client.get('/api/debug/profiles').status_code == 403
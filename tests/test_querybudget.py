@@ -0,0 +1,138 @@
+"""
+Query budget unit tests
+Exercises budget enforcement and N+1 detection on a throwaway Flask app
+"""
+
+import os
+import sys
+
+import pytest
+from flask import Flask, jsonify
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from querybudget import QueryBudget, query_budget, statement_shape  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    """Flask app with routes that run a query per item (an N+1), before or
+    after committing a write"""
+    app = Flask(__name__)
+    app.config['QUERY_BUDGET_ENABLED'] = True
+    app.config['QUERY_BUDGET_STRICT'] = True
+    engine = create_engine('sqlite://')
+    budgets = QueryBudget(app)
+
+    @app.route('/items/<int:n>')
+    @query_budget(3)
+    def items(n):
+        with engine.connect() as conn:
+            values = [conn.execute(text('SELECT :i'), {'i': i}).scalar() for i in range(n)]
+        return jsonify(values)
+
+    @app.route('/warm/<int:n>')
+    @query_budget(1)
+    def warm(n):
+        with engine.connect() as conn:
+            with budgets.uncounted():
+                for i in range(n):
+                    conn.execute(text('SELECT :i'), {'i': i})
+            return jsonify(conn.execute(text('SELECT 1')).scalar())
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db = SQLAlchemy(app)
+    with app.app_context():
+        db.session.execute(text('CREATE TABLE writes (n INTEGER)'))
+        db.session.commit()
+
+    @app.route('/write/<int:n>', methods=['POST'])
+    @query_budget(3)
+    def write(n):
+        """Insert a row, run `n` reads, then commit"""
+        db.session.execute(text('INSERT INTO writes VALUES (:n)'), {'n': n})
+        for i in range(n):
+            db.session.execute(text('SELECT :i'), {'i': i})
+        db.session.commit()
+        return jsonify(n)
+
+    @app.route('/write-then-read/<int:n>', methods=['POST'])
+    @query_budget(3)
+    def write_then_read(n):
+        """Insert a row and commit, then run `n` reads"""
+        db.session.execute(text('INSERT INTO writes VALUES (:n)'), {'n': n})
+        db.session.commit()
+        for i in range(n):
+            db.session.execute(text('SELECT :i'), {'i': i})
+        return jsonify(n)
+
+    def written():
+        with app.app_context():
+            return [row.n for row in db.session.execute(text('SELECT n FROM writes'))]
+
+    with app.test_client() as client:
+        client.budgets = budgets
+        client.written = written
+        yield client
+    event.remove(Engine, 'after_cursor_execute', budgets._after_cursor_execute)
+    event.remove(Session, 'before_commit', budgets._before_commit)
+    event.remove(Session, 'after_commit', budgets._after_commit)
+
+
+class TestQueryBudget:
+    """Test budget enforcement and reporting"""
+
+    def test_within_budget(self, client):
+        """Test a route under its budget responds normally"""
+        response = client.get('/items/2')
+        assert response.status_code == 200
+        assert response.get_json() == [0, 1]
+
+    def test_strict_mode_fails_over_budget(self, client):
+        """Test exceeding the budget returns 500 with the N+1 suspect"""
+        response = client.get('/items/5')
+        assert response.status_code == 500
+        body = response.get_json()
+        assert body['queries'] == 5
+        assert body['budget'] == 3
+        assert body['n_plus_one_suspects'] == ['SELECT ?']
+
+    def test_strict_mode_stops_commit_over_budget(self, client):
+        """Test a request already over budget at commit fails and writes nothing"""
+        assert client.post('/write/1').status_code == 200
+        response = client.post('/write/5')
+        assert response.status_code == 500
+        assert response.get_json()['queries'] == 6
+        assert client.written() == [1]
+
+    def test_strict_mode_keeps_committed_response(self, client):
+        """Test an overrun after a commit keeps the response and flags it"""
+        response = client.post('/write-then-read/5')
+        assert response.status_code == 200
+        assert response.headers['X-Query-Budget-Exceeded'] == '6/3'
+        assert client.written() == [5]
+
+    def test_uncounted_statements(self, client):
+        """Test statements run under uncounted() do not count against the budget"""
+        assert client.get('/warm/5').status_code == 200
+        report = client.get('/api/debug/query-report').get_json()
+        assert report[0]['max_queries'] == 1
+
+    def test_report_lists_worst_offenders(self, client):
+        """Test the report aggregates per-endpoint counts and suspects"""
+        client.get('/items/1')
+        client.get('/items/4')
+        report = client.get('/api/debug/query-report').get_json()
+        assert report[0]['endpoint'] == 'items'
+        assert report[0]['max_queries'] == 4
+        assert report[0]['violations'] == 1
+        assert report[0]['n_plus_one_suspects'][0]['max_repeats'] == 4
+
+    def test_statement_shape_collapses_in_lists(self):
+        """Test IN lists of different lengths share one shape"""
+        assert statement_shape('SELECT 1 WHERE id IN (?, ?)') == \
+            statement_shape('SELECT 1\n WHERE id IN (?, ?, ?, ?)')
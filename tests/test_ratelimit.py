@@ -0,0 +1,116 @@
+"""
+Admission control unit tests
+Exercises the token buckets and load shedder directly, without a server
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ratelimit import LoadShedder, RateLimiter, TokenBucket, retry_after_header  # noqa: E402
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket:
+    """Test token bucket accounting"""
+
+    def test_burst_then_refill(self):
+        """Test the bucket allows a burst and then refills at its rate"""
+        bucket = TokenBucket(rate=2.0, capacity=3, now=0.0)
+        assert [bucket.take(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert bucket.take(0.0) == 0.5
+        assert bucket.take(0.5) == 0.0
+
+    def test_refund_is_capped(self):
+        """Test refunds never exceed capacity"""
+        bucket = TokenBucket(rate=1.0, capacity=2, now=0.0)
+        bucket.refund()
+        assert bucket.tokens == 2
+
+
+class TestRateLimiter:
+    """Test per-user read/write and per-endpoint budgets"""
+
+    def test_disabled_limiter_admits_everything(self):
+        """Test a disabled limiter never rejects and keeps no state"""
+        limiter = RateLimiter(enabled=False, read=(1.0, 1))
+        for _ in range(10):
+            assert limiter.check(1, 'get_lists', 'GET') is None
+        assert limiter._buckets == {}
+
+    def test_reads_and_writes_have_separate_budgets(self):
+        """Test exhausting reads does not block writes"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, enabled=True, read=(1.0, 2), write=(1.0, 1))
+        assert limiter.check(1, 'get_lists', 'GET') is None
+        assert limiter.check(1, 'get_lists', 'GET') is None
+        assert limiter.check(1, 'get_lists', 'GET') == 1.0
+        assert limiter.check(1, 'create_task', 'POST') is None
+        assert limiter.check(1, 'create_task', 'POST') == 1.0
+
+    def test_users_are_isolated(self):
+        """Test one user's exhausted budget does not affect another"""
+        limiter = RateLimiter(clock=FakeClock(), enabled=True, read=(1.0, 1))
+        assert limiter.check(1, 'get_lists', 'GET') is None
+        assert limiter.check(1, 'get_lists', 'GET') is not None
+        assert limiter.check(2, 'get_lists', 'GET') is None
+
+    def test_endpoint_budget_refunds_class_budget(self):
+        """Test a per-endpoint rejection does not also drain the read budget"""
+        clock = FakeClock()
+        limiter = RateLimiter(
+            clock=clock, enabled=True, read=(1.0, 3),
+            endpoints={'get_lists': (1.0, 1)}
+        )
+        assert limiter.check(1, 'get_lists', 'GET') is None
+        assert limiter.check(1, 'get_lists', 'GET') == 1.0
+        # Two read tokens are left for other endpoints
+        assert limiter.check(1, 'health_check', 'GET') is None
+        assert limiter.check(1, 'health_check', 'GET') is None
+        assert limiter.check(1, 'health_check', 'GET') is not None
+
+    def test_idle_buckets_are_pruned(self):
+        """Test full, idle buckets are dropped once the table is full"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, enabled=True, read=(1.0, 1), max_buckets=2)
+        limiter.check(1, 'get_lists', 'GET')
+        limiter.check(2, 'get_lists', 'GET')
+        clock.now += 120
+        limiter.check(3, 'get_lists', 'GET')
+        assert set(limiter._buckets) == {(3, 'read')}
+
+
+class TestLoadShedder:
+    """Test in-flight and latency based shedding"""
+
+    def test_sheds_over_in_flight_limit(self):
+        """Test requests beyond max_in_flight are rejected until a slot frees"""
+        shedder = LoadShedder(max_in_flight=2)
+        assert shedder.admit()
+        assert shedder.admit()
+        assert not shedder.admit()
+        shedder.release(5)
+        assert shedder.admit()
+
+    def test_high_latency_halves_concurrency(self):
+        """Test slow responses shrink the admission limit"""
+        shedder = LoadShedder(max_in_flight=4, latency_ms=100)
+        shedder.latency_ms = 500
+        assert shedder.admit()
+        assert shedder.admit()
+        assert not shedder.admit()
+
+    def test_retry_after_header(self):
+        """Test Retry-After is rounded up to whole seconds"""
+        assert retry_after_header(0.2) == "1"
+        assert retry_after_header(2.5) == "3"
@@ -101,3 +101,85 @@ def test_reorder_tasks(auth_headers):
     assert tasks[0]["title"] == "Task 2"
     assert tasks[1]["title"] == "Task 3"
     assert tasks[2]["title"] == "Task 1"
+
+
+def test_set_children_order(auth_headers):
+    list_id = create_list("Order Children", auth_headers)
+    parent_id, _ = create_task("Parent", list_id, auth_headers)
+    ids = [create_task(f"Child {i}", list_id, auth_headers, parent_id=parent_id)[0]
+           for i in range(5)]
+
+    new_order = [ids[3], ids[0], ids[4], ids[2], ids[1]]
+    r = requests.put(
+        f"{BASE_URL}/tasks/{parent_id}/children/order",
+        json={"order": new_order},
+        headers=auth_headers
+    )
+    assert r.status_code == 200
+    children = r.json()["children"]
+    assert [c["id"] for c in children] == new_order
+    assert [c["position"] for c in children] == [0, 1, 2, 3, 4]
+
+    lists = get_lists(auth_headers)
+    tasks = next(lst for lst in lists if lst["id"] == list_id)["tasks"]
+    assert [c["id"] for c in tasks[0]["children"]] == new_order
+
+
+def test_set_top_level_order(auth_headers):
+    list_id = create_list("Order Top Level", auth_headers)
+    ids = [create_task(f"Task {i}", list_id, auth_headers)[0] for i in range(3)]
+
+    r = requests.put(
+        f"{BASE_URL}/lists/{list_id}/order",
+        json={"order": ids[::-1]},
+        headers=auth_headers
+    )
+    assert r.status_code == 200
+    assert [t["id"] for t in r.json()["tasks"]] == ids[::-1]
+
+
+def test_set_order_validates_ids(auth_headers):
+    list_id = create_list("Order Validation", auth_headers)
+    ids = [create_task(f"Task {i}", list_id, auth_headers)[0] for i in range(3)]
+    path = f"{BASE_URL}/lists/{list_id}/order"
+
+    # Missing a child: the client's view is stale
+    r = requests.put(path, json={"order": ids[:2]}, headers=auth_headers)
+    assert r.status_code == 409
+    assert r.json()["missing"] == [ids[2]]
+
+    # A task that is not a top-level task of this list
+    child_id, _ = create_task("Child", list_id, auth_headers, parent_id=ids[0])
+    r = requests.put(path, json={"order": ids + [child_id]}, headers=auth_headers)
+    assert r.status_code == 409
+    assert r.json()["unexpected"] == [child_id]
+
+    r = requests.put(path, json={"order": ids + [ids[0]]}, headers=auth_headers)
+    assert r.status_code == 400
+    r = requests.put(path, json={"order": "1,2,3"}, headers=auth_headers)
+    assert r.status_code == 400
+
+    # Nothing changed
+    lists = get_lists(auth_headers)
+    tasks = next(lst for lst in lists if lst["id"] == list_id)["tasks"]
+    assert [t["id"] for t in tasks] == ids
+
+
+def test_set_order_other_users_tasks():
+    owner = requests.post(f"{BASE_URL}/register", json={
+        "username": f"order_owner_{os.urandom(4).hex()}", "password": "pw"
+    }).json()["token"]
+    other = requests.post(f"{BASE_URL}/register", json={
+        "username": f"order_other_{os.urandom(4).hex()}", "password": "pw"
+    }).json()["token"]
+    owner_headers = {"Authorization": f"Bearer {owner}"}
+    other_headers = {"Authorization": f"Bearer {other}"}
+    list_id = create_list("Private Order", owner_headers)
+    task_id, _ = create_task("Task", list_id, owner_headers)
+
+    r = requests.put(f"{BASE_URL}/lists/{list_id}/order",
+                     json={"order": [task_id]}, headers=other_headers)
+    assert r.status_code == 403
+    r = requests.put(f"{BASE_URL}/tasks/{task_id}/children/order",
+                     json={"order": []}, headers=other_headers)
+    assert r.status_code == 403
@@ -0,0 +1,181 @@
+"""
+Token revocation unit tests
+Exercises the expiring Bloom filter and revocation checks on a throwaway
+Flask app
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from revocation import BloomFilter, ExpiringBloomFilter, TokenRevocations  # noqa: E402
+
+
+@pytest.fixture
+def env(tmp_path):
+    """App with a revocation table and a statement counter"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path}/tokens.db'
+    db = SQLAlchemy(app)
+
+    class Revocation(db.Model):
+        __table_args__ = {'sqlite_autoincrement': True}
+        id = db.Column(db.Integer, primary_key=True)
+        user_id = db.Column(db.Integer, nullable=False)
+        jti = db.Column(db.String(32), index=True)
+        issued_before = db.Column(db.DateTime)
+        expires_at = db.Column(db.DateTime, nullable=False)
+
+    statements = []
+    with app.app_context():
+        db.create_all()
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *args: statements.append(args[2]))
+    return app, db, Revocation, statements
+
+
+def token(user_id, jti, iat=None):
+    now = time.time()
+    return {'user_id': user_id, 'jti': jti, 'iat': now if iat is None else iat,
+            'exp': int(now + 3600)}
+
+
+class TestBloomFilter:
+    """Test the filters behind the fast path"""
+
+    def test_no_false_negatives(self):
+        """Test every added key is reported as present"""
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'key{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        assert all(key in bloom for key in keys)
+
+    def test_false_positive_rate(self):
+        """Test the false-positive rate stays near the configured one, even
+        when a bucket grows past its first filter"""
+        bloom = ExpiringBloomFilter(3600, 0.01, initial_capacity=100)
+        for i in range(1000):
+            bloom.add(f'in{i}', 10)
+        hits = sum(bloom.might_contain(f'out{i}', 10) for i in range(10000))
+        assert hits < 200
+        assert all(bloom.might_contain(f'in{i}', 10) for i in range(1000))
+
+    def test_expired_buckets_are_dropped(self):
+        """Test keys leave the filter once their bucket has expired"""
+        bloom = ExpiringBloomFilter(100, 0.01)
+        bloom.add('old', 50)
+        bloom.add('new', 250)
+        assert bloom.expire(now=150) == 1
+        assert not bloom.might_contain('old', 50)
+        assert bloom.might_contain('new', 250)
+        assert len(bloom) == 1
+
+
+class TestTokenRevocations:
+    """Test revocation checks only query on filter hits"""
+
+    def test_unrevoked_tokens_need_no_query(self, env):
+        """Test checks answer from memory once the table is loaded"""
+        app, db, model, statements = env
+        revocations = TokenRevocations(app, db, model)
+        with app.app_context():
+            revocations.load()
+            statements.clear()
+            assert not any(revocations.is_revoked(token(1, f'jti{i}')) for i in range(100))
+        assert statements == []
+
+    def test_revoked_token(self, env):
+        """Test a revoked token is rejected, by other processes too"""
+        app, db, model, statements = env
+        revocations = TokenRevocations(app, db, model)
+        other = TokenRevocations(app, db, model)
+        revoked = token(1, 'gone')
+        with app.app_context():
+            other.load()
+            revocations.revoke_token(revoked)
+            db.session.commit()
+            revocations.remember_token(revoked)
+            assert revocations.is_revoked(revoked)
+            assert not revocations.is_revoked(token(1, 'kept'))
+            other.sync()
+            statements.clear()
+            assert other.is_revoked(revoked)
+        assert statements == []
+
+    def test_revoke_user(self, env):
+        """Test revoking a user's sessions spares tokens issued afterwards"""
+        app, db, model, statements = env
+        revocations = TokenRevocations(app, db, model)
+        earlier = token(1, 'a', iat=time.time() - 1)
+        with app.app_context():
+            revocations.load()
+            cutoff = revocations.revoke_user(1)
+            db.session.commit()
+            revocations.remember_cutoff(1, cutoff)
+            assert revocations.is_revoked(earlier)
+            assert not revocations.is_revoked(token(1, 'b'))
+            assert not revocations.is_revoked(token(2, 'c', iat=time.time() - 1))
+
+    def test_rolled_back_revocation_is_not_applied(self, env):
+        """Test revoking changes nothing in memory until the caller commits"""
+        app, db, model, statements = env
+        revocations = TokenRevocations(app, db, model)
+        revoked = token(1, 'gone', iat=time.time() - 1)
+        with app.app_context():
+            revocations.load()
+            revocations.revoke_token(revoked)
+            revocations.revoke_user(1)
+            db.session.rollback()
+            assert not revocations.is_revoked(revoked)
+            assert model.query.count() == 0
+
+    def test_sync_purges_expired_rows(self, env):
+        """Test expired revocations are dropped from memory and the table"""
+        app, db, model, statements = env
+        app.config['TOKEN_LIFETIME'] = timedelta(seconds=0.2)
+        revocations = TokenRevocations(app, db, model)
+        with app.app_context():
+            db.session.add(model(user_id=1, jti='old',
+                                 expires_at=datetime.utcnow() - timedelta(days=1)))
+            revocations.revoke_token(token(1, 'live'))
+            revocations.revoke_user(2)
+            db.session.commit()
+            revocations.load()
+            time.sleep(0.3)
+            revocations.sync()
+            assert [row.jti for row in model.query.all()] == ['live']
+            assert not revocations.is_revoked(token(2, 'new', iat=0))
+
+    def test_sync_after_purge_of_newest_row(self, env):
+        """Test another process sees a revocation added after the newest row
+        it had synced was purged"""
+        app, db, model, statements = env
+        app.config['TOKEN_LIFETIME'] = timedelta(seconds=0.2)
+        revocations = TokenRevocations(app, db, model)
+        other = TokenRevocations(app, db, model)
+        with app.app_context():
+            live = token(1, 'live')
+            revocations.revoke_token(live)
+            cutoff = revocations.revoke_user(2)
+            db.session.commit()
+            revocations.remember_token(live)
+            revocations.remember_cutoff(2, cutoff)
+            other.load()
+            time.sleep(0.3)
+            revocations.sync()
+            assert [row.jti for row in model.query.all()] == ['live']
+
+            revoked = token(1, 'later')
+            revocations.revoke_token(revoked)
+            db.session.commit()
+            other.sync()
+            assert other.is_revoked(revoked)
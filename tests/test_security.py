@@ -300,6 +300,89 @@ class TestAuthorization:
             assert response.status_code == 401, f"{method} {url} should require auth"
 
 
+class TestLogout:
+    """Test revoking tokens"""
+    
+    def login(self, username):
+        response = requests.post(
+            f"{BASE_URL}/login",
+            json={"username": username, "password": "pass123"}
+        )
+        return {"Authorization": f"Bearer {response.json()['token']}"}
+    
+    def test_logout_revokes_only_that_token(self, two_users):
+        """Test a logged-out token is rejected while other sessions keep working"""
+        other_session = self.login(two_users["user1"]["username"])
+        response = requests.post(f"{BASE_URL}/logout", headers=two_users["user1"]["headers"])
+        assert response.status_code == 200
+        
+        response = requests.get(f"{BASE_URL}/lists", headers=two_users["user1"]["headers"])
+        assert response.status_code == 401
+        response = requests.get(f"{BASE_URL}/lists", headers=other_session)
+        assert response.status_code == 200
+        response = requests.get(f"{BASE_URL}/lists", headers=two_users["user2"]["headers"])
+        assert response.status_code == 200
+    
+    def test_logout_all_revokes_every_session(self, two_users):
+        """Test logging out everywhere rejects all earlier tokens but not new ones"""
+        other_session = self.login(two_users["user1"]["username"])
+        response = requests.post(f"{BASE_URL}/logout/all", headers=other_session)
+        assert response.status_code == 200
+        
+        for headers in (two_users["user1"]["headers"], other_session):
+            response = requests.get(f"{BASE_URL}/lists", headers=headers)
+            assert response.status_code == 401
+        response = requests.get(
+            f"{BASE_URL}/lists", headers=self.login(two_users["user1"]["username"])
+        )
+        assert response.status_code == 200
+        response = requests.get(f"{BASE_URL}/lists", headers=two_users["user2"]["headers"])
+        assert response.status_code == 200
+
+
+class TestOwnershipChecks:
+    """Test ownership checks served from the owned-list cache"""
+    
+    def create_list(self, headers):
+        response = requests.post(f"{BASE_URL}/lists", json={"name": "Owned"}, headers=headers)
+        return response.json()["id"]
+    
+    def create_task(self, list_id, headers):
+        return requests.post(
+            f"{BASE_URL}/tasks", json={"title": "Task", "list_id": list_id}, headers=headers
+        )
+    
+    def test_new_list_usable_after_caching(self, two_users):
+        """Test a list created after the owned lists were cached is accepted"""
+        headers = two_users["user1"]["headers"]
+        requests.get(f"{BASE_URL}/lists", headers=headers)
+        list_id = self.create_list(headers)
+        assert self.create_task(list_id, headers).status_code == 201
+        response = requests.post(f"{BASE_URL}/lists/{list_id}/export", headers=headers)
+        assert response.status_code == 202
+    
+    def test_deleted_list_rejected(self, two_users):
+        """Test a cached list is rejected once it has been deleted"""
+        headers = two_users["user1"]["headers"]
+        list_id = self.create_list(headers)
+        assert self.create_task(list_id, headers).status_code == 201
+        response = requests.delete(f"{BASE_URL}/lists/{list_id}", headers=headers)
+        assert response.status_code == 200
+        assert self.create_task(list_id, headers).status_code == 403
+        response = requests.post(f"{BASE_URL}/lists/{list_id}/export", headers=headers)
+        assert response.status_code == 404
+    
+    def test_cached_owner_does_not_leak(self, two_users):
+        """Test one user's cached lists do not authorize another user"""
+        list_id = self.create_list(two_users["user1"]["headers"])
+        requests.get(f"{BASE_URL}/lists", headers=two_users["user1"]["headers"])
+        assert self.create_task(list_id, two_users["user2"]["headers"]).status_code == 403
+        response = requests.delete(
+            f"{BASE_URL}/lists/{list_id}/completed", headers=two_users["user2"]["headers"]
+        )
+        assert response.status_code == 403
+
+
 class TestInputValidation:
     """Test input validation and sanitization"""
     
@@ -342,6 +425,26 @@ class TestInputValidation:
         )
         assert response.status_code == 400
     
+    def test_non_object_json_bodies_rejected(self, two_users):
+        """Test JSON bodies that are not objects get 400, not a server error"""
+        headers = two_users["user1"]["headers"]
+        list_id = requests.post(f"{BASE_URL}/lists", json={"name": "Bodies"},
+                                headers=headers).json()["id"]
+        task_id = requests.post(f"{BASE_URL}/tasks", json={"title": "T", "list_id": list_id},
+                                headers=headers).json()["id"]
+        routes = [
+            ("post", "/register"), ("post", "/login"), ("post", "/lists"), ("post", "/tasks"),
+            ("put", f"/lists/{list_id}"), ("put", f"/tasks/{task_id}"),
+            ("put", f"/tasks/{task_id}/move"), ("put", f"/tasks/{task_id}/reorder"),
+        ]
+        for body in ('[]', '[1, 2]', '"text"', '3', 'null'):
+            for method, path in routes:
+                response = requests.request(
+                    method, BASE_URL + path, data=body,
+                    headers={**headers, "Content-Type": "application/json"}
+                )
+                assert response.status_code == 400, (method, path, body)
+
     def test_special_characters_in_list_name(self, two_users):
         """Test list names with special characters are handled"""
         special_name = "List <script>alert('xss')</script> & symbols!"
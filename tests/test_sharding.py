@@ -0,0 +1,131 @@
+"""
+Shard routing unit tests
+Exercises the shard directory, per-shard engines and id ranges on a
+throwaway Flask app
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+from flask import Flask, jsonify, request
+from flask_sqlalchemy import SQLAlchemy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dbrouting import RoutingSession  # noqa: E402
+from sharding import SHARD_ID_STRIDE, ShardRouter, configure_sharding, shard_url  # noqa: E402
+
+
+@pytest.fixture
+def env(tmp_path):
+    """App with three shards, a directory and one sharded model"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path}/main.db'
+    app.config['SHARD_COUNT'] = 3
+    configure_sharding(app)
+    db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+    class User(db.Model):
+        __tablename__ = 'users'
+        id = db.Column(db.Integer, primary_key=True)
+
+    class UserShard(db.Model):
+        __tablename__ = 'shard_directory'
+        user_id = db.Column(db.Integer, primary_key=True)
+        shard = db.Column(db.Integer, nullable=False)
+
+    class Item(db.Model):
+        __tablename__ = 'items'
+        __table_args__ = {'sqlite_autoincrement': True}
+        id = db.Column(db.Integer, primary_key=True)
+        user_id = db.Column(db.Integer, nullable=False)
+
+    router = ShardRouter(app, db, UserShard, [Item.__table__])
+
+    @app.route('/register', methods=['POST'])
+    def register():
+        user = User()
+        db.session.add(user)
+        db.session.flush()
+        shard = router.assign(user.id)
+        db.session.commit()
+        return jsonify({'id': user.id, 'shard': shard})
+
+    @app.route('/items', methods=['POST'])
+    def create_item():
+        user_id = int(request.args['user'])
+        router.activate(user_id)
+        item = Item(user_id=user_id)
+        db.session.add(item)
+        db.session.commit()
+        return jsonify({'id': item.id})
+
+    @app.route('/items', methods=['GET'])
+    def list_items():
+        router.activate(int(request.args['user']))
+        return jsonify([item.user_id for item in Item.query.all()])
+
+    with app.app_context():
+        db.create_all()
+        router.create_all()
+    return app, db, router, tmp_path
+
+
+def rows_in(path):
+    with sqlite3.connect(path) as conn:
+        return [row[0] for row in conn.execute('SELECT user_id FROM items')]
+
+
+class TestSharding:
+    """Test routing users' rows to their shard"""
+
+    def test_shard_url(self):
+        """Test shard files sit next to the main database"""
+        assert shard_url('sqlite:////data/todo.db', 2).database == '/data/todo.shard2.db'
+        with pytest.raises(ValueError):
+            shard_url('sqlite://', 1)
+
+    def test_rows_land_on_the_users_shard(self, env):
+        """Test writes and reads go to the shard the directory assigns"""
+        app, db, router, tmp_path = env
+        client = app.test_client()
+        users = [client.post('/register').get_json() for _ in range(3)]
+        assert [u['shard'] for u in users] == [1, 2, 0]
+        for user in users:
+            client.post(f'/items?user={user["id"]}')
+
+        assert rows_in(tmp_path / 'main.db') == [3]
+        assert rows_in(tmp_path / 'main.shard1.db') == [1]
+        assert rows_in(tmp_path / 'main.shard2.db') == [2]
+        assert client.get('/items?user=2').get_json() == [2]
+
+    def test_ids_are_unique_across_shards(self, env):
+        """Test every shard draws ids from its own range"""
+        app, db, router, tmp_path = env
+        client = app.test_client()
+        for _ in range(3):
+            client.post('/register')
+        ids = {user: client.post(f'/items?user={user}').get_json()['id'] for user in (1, 2, 3)}
+        assert ids == {1: SHARD_ID_STRIDE + 1, 2: 2 * SHARD_ID_STRIDE + 1, 3: 1}
+
+    def test_directory_lookup_on_cache_miss(self, env):
+        """Test users missing from the cache are looked up once"""
+        app, db, router, tmp_path = env
+        app.test_client().post('/register')
+        router.forget()
+        with app.app_context():
+            assert router.shard_of(1) == 1
+            # Users without a directory row live on the main database
+            assert router.shard_of(99) == 0
+
+    def test_unsharded_tables_use_main_database(self, env):
+        """Test only sharded tables follow the current shard"""
+        app, db, router, tmp_path = env
+        with app.app_context(), router.use(2):
+            assert router.current() == 2
+            assert router.get_bind(clause=db.metadata.tables['users'].select()) is None
+            assert router.get_bind(clause=db.metadata.tables['items'].select()) is \
+                router.engine(2)
+        assert router.current() == 0
@@ -0,0 +1,97 @@
+"""
+Slow-query log unit tests
+Exercises threshold filtering, call sites and EXPLAIN QUERY PLAN capture on
+a throwaway Flask app
+"""
+
+import json
+import os
+import sys
+
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from slowquery import SlowQueryLog, parameter_shape  # noqa: E402
+
+
+def make_log(tmp_path, threshold_ms):
+    app = Flask(__name__)
+    app.config['SLOW_QUERY_MS'] = threshold_ms
+    app.config['SLOW_QUERY_LOG'] = str(tmp_path / 'slow.log')
+    return app, SlowQueryLog(app)
+
+
+@pytest.fixture
+def env(tmp_path):
+    """App whose route filters an unindexed table; every statement counts as slow"""
+    app, log = make_log(tmp_path, 1e-6)
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE tasks (id INTEGER PRIMARY KEY, parent_id INTEGER)'))
+        conn.execute(text('INSERT INTO tasks (parent_id) VALUES (NULL), (1), (1)'))
+
+    @app.route('/children/<int:parent_id>')
+    def children(parent_id):
+        with engine.connect() as conn:
+            for _ in range(2):
+                rows = conn.execute(text('SELECT id FROM tasks WHERE parent_id IN (:a, :b)'),
+                                    {'a': parent_id, 'b': -1}).all()
+        return jsonify([row.id for row in rows])
+
+    yield app.test_client(), log, engine, tmp_path / 'slow.log'
+    event.remove(Engine, 'before_cursor_execute', log._before_cursor_execute)
+    event.remove(Engine, 'after_cursor_execute', log._after_cursor_execute)
+
+
+def entries(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestSlowQueryLog:
+    """Test logging slow statements with their plans"""
+
+    def test_disabled_installs_nothing(self, tmp_path):
+        """Test a zero threshold adds no engine events and no log file"""
+        app, log = make_log(tmp_path, 0)
+        assert not log.enabled
+        assert not event.contains(Engine, 'after_cursor_execute', log._after_cursor_execute)
+        assert not (tmp_path / 'slow.log').exists()
+
+    def test_logs_route_call_site_and_plan(self, env):
+        """Test entries carry the route, call site, parameter types and one plan per shape"""
+        client, log, engine, path = env
+        assert client.get('/children/1').get_json() == [2, 3]
+        logged = [e for e in entries(path) if e['statement'].startswith('SELECT id FROM tasks')]
+        assert len(logged) == 2
+        first, second = logged
+        assert first['route'] == 'children'
+        assert first['call_site'].startswith('test_slowquery.py:')
+        assert first['call_site'].endswith('(children)')
+        assert first['parameters'] == ['int', 'int']
+        assert first['statement'] == 'SELECT id FROM tasks WHERE parent_id IN (?...)'
+        assert first['scans'] == ['SCAN tasks']
+        assert 'plan' not in second
+        assert log.plans == sum('plan' in e for e in entries(path))
+
+    def test_threshold_filters_fast_statements(self, tmp_path):
+        """Test statements under the threshold are not logged"""
+        app, log = make_log(tmp_path, 60000)
+        try:
+            with create_engine('sqlite://').connect() as conn:
+                conn.execute(text('SELECT 1'))
+            assert log.logged == 0
+        finally:
+            event.remove(Engine, 'before_cursor_execute', log._before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute', log._after_cursor_execute)
+
+    def test_parameter_shapes(self):
+        """Test parameter shapes keep types and drop values"""
+        assert parameter_shape((1, 'secret', None)) == ['int', 'str', 'NoneType']
+        assert parameter_shape({'id': 3}) == {'id': 'int'}
+        assert parameter_shape([(1, 'a'), (2, 'b')], executemany=True) == \
+            {'rows': 2, 'row': ['int', 'str']}
@@ -0,0 +1,110 @@
+"""
+Request tracing unit tests
+Exercises span nesting, SQL spans, trace id propagation and the offline
+report on a throwaway Flask app
+"""
+
+import json
+import os
+import sys
+
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from trace_report import aggregate, build_report  # noqa: E402
+from tracing import Tracer  # noqa: E402
+
+
+def make_tracer(tmp_path, rate):
+    app = Flask(__name__)
+    app.config['TRACE_SAMPLE_RATE'] = rate
+    app.config['TRACE_EXPORT_PATH'] = str(tmp_path / 'traces.jsonl')
+    return app, Tracer(app)
+
+
+@pytest.fixture
+def env(tmp_path):
+    """App whose route authenticates, queries and serializes a nested tree"""
+    app, tracer = make_tracer(tmp_path, 1.0)
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE tasks (id INTEGER PRIMARY KEY, title TEXT)'))
+        conn.execute(text("INSERT INTO tasks (title) VALUES ('a'), ('b')"))
+
+    @tracer.traced('to_dict')
+    def to_dict(depth):
+        return {'depth': depth, 'children': [to_dict(depth - 1)] if depth else []}
+
+    @app.route('/tasks')
+    def tasks():
+        with tracer.span('auth'):
+            pass
+        with engine.connect() as conn:
+            titles = [row.title for row in conn.execute(text('SELECT title FROM tasks'))]
+        return jsonify(titles=titles, tree=to_dict(3))
+
+    yield app.test_client(), tracer, tmp_path / 'traces.jsonl'
+    event.remove(Engine, 'before_cursor_execute', tracer._before_cursor_execute)
+    event.remove(Engine, 'after_cursor_execute', tracer._after_cursor_execute)
+
+
+def traces(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestTracer:
+    """Test recording and exporting request traces"""
+
+    def test_disabled_installs_nothing(self, tmp_path):
+        """Test a zero sample rate adds no hooks, engine events or export file"""
+        app, tracer = make_tracer(tmp_path, 0)
+        assert not tracer.enabled
+        assert not event.contains(Engine, 'before_cursor_execute', tracer._before_cursor_execute)
+        assert not app.before_request_funcs
+        with tracer.span('auth') as span:
+            assert span is None
+        assert not (tmp_path / 'traces.jsonl').exists()
+
+    def test_records_span_tree(self, env):
+        """Test the exported trace nests auth, db and folded to_dict spans under the route"""
+        client, tracer, path = env
+        assert client.get('/tasks').get_json()['titles'] == ['a', 'b']
+        [trace] = traces(path)
+        assert (trace['route'], trace['method'], trace['status']) == ('tasks', 'GET', 200)
+        spans = {span['name']: span for span in trace['spans']}
+        root = spans['tasks']
+        assert root['parent'] is None
+        assert spans['auth']['parent'] == root['id']
+        assert spans['db']['statement'] == 'SELECT title FROM tasks'
+        assert [span['name'] for span in trace['spans']].count('to_dict') == 1
+        assert all(span['duration_ms'] <= trace['duration_ms'] for span in trace['spans'])
+        assert trace['dropped_spans'] == 0
+
+    def test_propagates_incoming_trace_id(self, env):
+        """Test a valid incoming id is reused and echoed; an invalid one is replaced"""
+        client, tracer, path = env
+        r = client.get('/tasks', headers={'X-Trace-Id': 'caller-trace-0001'})
+        assert r.headers['X-Trace-Id'] == 'caller-trace-0001'
+        r = client.get('/tasks', headers={'X-Trace-Id': 'bad id!'})
+        assert r.headers['X-Trace-Id'] != 'bad id!'
+        assert [t['trace_id'] for t in traces(path)] == \
+            ['caller-trace-0001', r.headers['X-Trace-Id']]
+
+    def test_report_self_times(self, env):
+        """Test the offline report groups spans per route with self times"""
+        client, tracer, path = env
+        for _ in range(3):
+            client.get('/tasks')
+        report = build_report(*aggregate(traces(path)), top=10)
+        [route] = report['routes']
+        assert route['route'] == 'tasks' and route['requests'] == 3
+        rows = {row['span']: row for row in route['spans']}
+        assert rows['db: SELECT title FROM tasks']['count'] == 3
+        assert {'auth', 'to_dict', '(untraced)'} <= set(rows)
+        assert sum(row['self_ms_total'] for row in rows.values()) <= \
+            sum(t['duration_ms'] for t in traces(path)) + 0.01
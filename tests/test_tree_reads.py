@@ -0,0 +1,300 @@
+"""
+Tree read test suite
+Tests collapsed-subtree elision, depth-limited subtree reads, the flat
+wire formats and very deep trees
+"""
+
+import os
+import time
+import requests
+import pytest
+
+BASE_URL = os.environ.get("TODO_API_BASE", "http://localhost:5000/api")
+
+
+@pytest.fixture
+def auth_headers():
+    """Fixture to create an authenticated user"""
+    username = f"tree_user_{os.urandom(4).hex()}"
+    response = requests.post(
+        f"{BASE_URL}/register",
+        json={"username": username, "password": "treepass123"}
+    )
+    token = response.json()["token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def create_list(name, headers):
+    r = requests.post(f"{BASE_URL}/lists", json={"name": name}, headers=headers)
+    assert r.status_code == 201
+    return r.json()["id"]
+
+
+def create_task(title, list_id, headers, parent_id=None):
+    payload = {"title": title, "list_id": list_id}
+    if parent_id is not None:
+        payload["parent_id"] = parent_id
+    r = requests.post(f"{BASE_URL}/tasks", json=payload, headers=headers)
+    assert r.status_code == 201
+    return r.json()["id"]
+
+
+def set_collapsed(task_id, collapsed, headers):
+    r = requests.put(f"{BASE_URL}/tasks/{task_id}", json={"collapsed": collapsed},
+                     headers=headers)
+    assert r.status_code == 200
+
+
+def get_list(list_id, headers, **params):
+    r = requests.get(f"{BASE_URL}/lists", headers=headers, params=params)
+    assert r.status_code == 200
+    return next(l for l in r.json() if l["id"] == list_id)
+
+
+def preorder(tasks, depth=0):
+    """(id, depth) pairs of a nested task tree in pre-order"""
+    pairs = []
+    for task in tasks:
+        pairs.append((task["id"], depth))
+        pairs.extend(preorder(task["children"], depth + 1))
+    return pairs
+
+
+@pytest.fixture
+def outline(auth_headers):
+    """A list with root > (a > a1 > a2, b); root is collapsed"""
+    list_id = create_list("Outline", auth_headers)
+    root = create_task("Root", list_id, auth_headers)
+    a = create_task("A", list_id, auth_headers, parent_id=root)
+    a1 = create_task("A1", list_id, auth_headers, parent_id=a)
+    a2 = create_task("A2", list_id, auth_headers, parent_id=a1)
+    b = create_task("B", list_id, auth_headers, parent_id=root)
+    set_collapsed(root, True, auth_headers)
+    return {"list": list_id, "root": root, "a": a, "a1": a1, "a2": a2, "b": b}
+
+
+class TestCollapsedElision:
+    """Test leaving out the children of collapsed tasks"""
+
+    def test_collapsed_children_omitted(self, auth_headers, outline):
+        """Test collapsed tasks keep only their child count"""
+        root = get_list(outline["list"], auth_headers, collapsed="omit")["tasks"][0]
+        assert root["collapsed"] is True
+        assert root["children"] == []
+        assert root["child_count"] == 2
+        assert root["has_children"] is True
+
+    def test_expanded_tasks_carry_counts(self, auth_headers, outline):
+        """Test expanded tasks are nested as usual, with counts on every task"""
+        set_collapsed(outline["root"], False, auth_headers)
+        set_collapsed(outline["a1"], True, auth_headers)
+        root = get_list(outline["list"], auth_headers, collapsed="omit")["tasks"][0]
+        a, b = root["children"]
+        assert [a["child_count"], b["child_count"]] == [1, 0]
+        assert b["has_children"] is False
+        a1 = a["children"][0]
+        assert a1["children"] == [] and a1["child_count"] == 1
+
+    def test_default_response_unchanged(self, auth_headers, outline):
+        """Test lists are still sent in full without the parameter"""
+        get_list(outline["list"], auth_headers, collapsed="omit")
+        root = get_list(outline["list"], auth_headers)["tasks"][0]
+        assert "child_count" not in root
+        assert [c["id"] for c in root["children"]] == [outline["a"], outline["b"]]
+
+    def test_elided_view_follows_changes(self, auth_headers, outline):
+        """Test the elided view reflects expanding a task"""
+        get_list(outline["list"], auth_headers, collapsed="omit")
+        set_collapsed(outline["root"], False, auth_headers)
+        root = get_list(outline["list"], auth_headers, collapsed="omit")["tasks"][0]
+        assert len(root["children"]) == 2
+
+
+class TestSubtreeRead:
+    """Test GET /tasks/<id>/subtree"""
+
+    def test_full_subtree(self, auth_headers, outline):
+        """Test the whole subtree is returned without a depth"""
+        r = requests.get(f"{BASE_URL}/tasks/{outline['root']}/subtree", headers=auth_headers)
+        assert r.status_code == 200
+        assert r.headers["ETag"]
+        a = r.json()["children"][0]
+        assert a["children"][0]["children"][0]["id"] == outline["a2"]
+
+    def test_depth_limits_levels(self, auth_headers, outline):
+        """Test tasks on the last level carry counts but no children"""
+        r = requests.get(f"{BASE_URL}/tasks/{outline['root']}/subtree",
+                         params={"depth": 1}, headers=auth_headers)
+        assert r.status_code == 200
+        root = r.json()
+        assert root["child_count"] == 2
+        a, b = root["children"]
+        assert (a["id"], b["id"]) == (outline["a"], outline["b"])
+        assert a["children"] == [] and a["child_count"] == 1 and a["has_children"]
+        assert b["child_count"] == 0 and not b["has_children"]
+
+    def test_depth_zero(self, auth_headers, outline):
+        """Test depth=0 returns only the task itself"""
+        r = requests.get(f"{BASE_URL}/tasks/{outline['a']}/subtree",
+                         params={"depth": 0}, headers=auth_headers)
+        assert r.json()["children"] == []
+        assert r.json()["child_count"] == 1
+
+    def test_subtree_with_collapsed_elision(self, auth_headers, outline):
+        """Test collapsed tasks inside the subtree can be elided"""
+        set_collapsed(outline["a1"], True, auth_headers)
+        r = requests.get(f"{BASE_URL}/tasks/{outline['a']}/subtree",
+                         params={"collapsed": "omit"}, headers=auth_headers)
+        a1 = r.json()["children"][0]
+        assert a1["children"] == [] and a1["child_count"] == 1
+
+    def test_invalid_depth(self, auth_headers, outline):
+        """Test a negative or non-numeric depth is rejected"""
+        for depth in ("-1", "abc"):
+            r = requests.get(f"{BASE_URL}/tasks/{outline['root']}/subtree",
+                             params={"depth": depth}, headers=auth_headers)
+            assert r.status_code == 400
+
+    def test_other_users_subtree(self, auth_headers, outline):
+        """Test another user's subtree cannot be read"""
+        other = requests.post(f"{BASE_URL}/register", json={
+            "username": f"tree_other_{os.urandom(4).hex()}", "password": "pw"
+        }).json()["token"]
+        r = requests.get(f"{BASE_URL}/tasks/{outline['root']}/subtree",
+                         headers={"Authorization": f"Bearer {other}"})
+        assert r.status_code == 403
+        r = requests.get(f"{BASE_URL}/tasks/999999999/subtree", headers=auth_headers)
+        assert r.status_code == 404
+
+
+class TestFlatFormats:
+    """Test the flat and columnar wire formats"""
+
+    def test_flat_rows_in_preorder(self, auth_headers, outline):
+        """Test flat rows list every task in pre-order with its depth"""
+        nested = get_list(outline["list"], auth_headers)
+        flat = get_list(outline["list"], auth_headers, format="flat")
+        assert [(r["id"], r["depth"]) for r in flat["tasks"]] == preorder(nested["tasks"])
+        assert flat["name"] == nested["name"]
+        row = flat["tasks"][1]
+        assert row["parent_id"] == outline["root"]
+        assert "children" not in row
+
+    def test_columnar_matches_flat(self, auth_headers, outline):
+        """Test the columnar layout holds the flat rows field by field"""
+        flat = get_list(outline["list"], auth_headers, format="flat")["tasks"]
+        columns = get_list(outline["list"], auth_headers, format="columnar")["tasks"]
+        assert set(columns) == set(flat[0])
+        for field, values in columns.items():
+            assert values == [row[field] for row in flat]
+
+    def test_flat_with_collapsed_elision(self, auth_headers, outline):
+        """Test elided flat rows stop at collapsed tasks"""
+        rows = get_list(outline["list"], auth_headers, format="flat", collapsed="omit")["tasks"]
+        assert [r["id"] for r in rows] == [outline["root"]]
+        assert rows[0]["child_count"] == 2
+
+    def test_flat_subtree(self, auth_headers, outline):
+        """Test a depth-limited subtree can be read as flat rows"""
+        r = requests.get(f"{BASE_URL}/tasks/{outline['a']}/subtree",
+                         params={"format": "flat", "depth": 1}, headers=auth_headers)
+        assert r.status_code == 200
+        body = r.json()
+        assert body["id"] == outline["a"]
+        assert [(row["id"], row["depth"]) for row in body["tasks"]] == \
+            [(outline["a"], 0), (outline["a1"], 1)]
+        assert body["tasks"][1]["child_count"] == 1
+
+    def test_empty_list(self, auth_headers):
+        """Test a list without tasks has empty columns"""
+        list_id = create_list("Empty", auth_headers)
+        assert get_list(list_id, auth_headers, format="flat")["tasks"] == []
+        columns = get_list(list_id, auth_headers, format="columnar")["tasks"]
+        assert columns["id"] == [] and columns["depth"] == []
+
+    def test_unknown_format(self, auth_headers):
+        """Test an unknown format is rejected"""
+        r = requests.get(f"{BASE_URL}/lists", params={"format": "xml"}, headers=auth_headers)
+        assert r.status_code == 400
+
+
+def import_chains(count, length, headers):
+    """Import a list of `count` top-level chains of `length` nested tasks;
+    returns the list id"""
+    chain = '{"title":"Step","children":[' * length + ']}' * length
+    body = '{"name":"Chain","tasks":[' + ','.join([chain] * count) + ']}'
+    r = requests.post(f"{BASE_URL}/lists/import", data=body,
+                      headers={**headers, "Content-Type": "application/json"})
+    assert r.status_code == 202
+    job_url = f"{BASE_URL}/jobs/{r.json()['id']}"
+    for _ in range(200):
+        job = requests.get(job_url, headers=headers).json()
+        if job["status"] == "succeeded":
+            return job["result"]["list_id"]
+        time.sleep(0.05)
+    raise AssertionError("import did not finish")
+
+
+@pytest.fixture
+def deep_chain(auth_headers):
+    """A list with one chain of 1,200 nested tasks, deeper than the C JSON
+    encoder and decoder can handle (imported as four chains of 300, each
+    then moved under the leaf of the one before)"""
+    list_id = import_chains(4, 300, auth_headers)
+    rows = get_list(list_id, auth_headers, format="flat")["tasks"]
+    tops = [row for row in rows if row["depth"] == 0]
+    leaves = [rows[rows.index(top) + 299] for top in tops]
+    for leaf, top in zip(leaves, tops[1:]):
+        r = requests.put(f"{BASE_URL}/tasks/{top['id']}/move",
+                         json={"parent_id": leaf["id"]}, headers=auth_headers)
+        assert r.status_code == 200
+    rows = get_list(list_id, auth_headers, format="flat")["tasks"]
+    return {"list": list_id, "rows": rows}
+
+
+class TestDeepTrees:
+    """Test trees nested deeper than Python's recursion limit"""
+
+    def test_flat_rows_of_deep_chain(self, auth_headers, deep_chain):
+        """Test the chain is stored and read back level by level"""
+        assert [row["depth"] for row in deep_chain["rows"]] == list(range(1200))
+
+    def test_nested_list(self, auth_headers, deep_chain):
+        """Test the nested list tree is served at full depth"""
+        r = requests.get(f"{BASE_URL}/lists", headers=auth_headers)
+        assert r.status_code == 200
+        # Too deep for the json module to decode; check the nesting in the text
+        assert r.text.count('"children":[{') == 1199
+        assert r.text.count('"children":[]') == 1
+
+    def test_nested_subtree(self, auth_headers, deep_chain):
+        """Test full and depth-limited subtree reads of a deep chain"""
+        top = deep_chain["rows"][0]["id"]
+        r = requests.get(f"{BASE_URL}/tasks/{top}/subtree", headers=auth_headers)
+        assert r.status_code == 200
+        assert r.text.count('"children":[{') == 1199
+        r = requests.get(f"{BASE_URL}/tasks/{top}/subtree", params={"depth": 1100},
+                         headers=auth_headers)
+        assert r.status_code == 200
+        assert r.text.count('"children":[{') == 1100
+
+    def test_export_deep_chain(self, auth_headers, deep_chain):
+        """Test a deep list can be exported and its job result fetched"""
+        r = requests.post(f"{BASE_URL}/lists/{deep_chain['list']}/export", headers=auth_headers)
+        assert r.status_code == 202
+        job_url = f"{BASE_URL}/jobs/{r.json()['id']}"
+        for _ in range(100):
+            r = requests.get(job_url, headers=auth_headers)
+            assert r.status_code == 200
+            if '"status":"succeeded"' in r.text:
+                break
+            time.sleep(0.05)
+        # The result is embedded as stored, with the default separators
+        assert r.text.count('"children": [{') == 1199
+
+    def test_too_deep_request_body(self, auth_headers):
+        """Test a request body nested beyond the parser's limit is a 400"""
+        r = requests.post(f"{BASE_URL}/lists/import",
+                          data='{"name":"x","tasks":' + '[' * 5000 + ']' * 5000 + '}',
+                          headers={**auth_headers, "Content-Type": "application/json"})
+        assert r.status_code == 400
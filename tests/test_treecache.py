@@ -0,0 +1,98 @@
+"""
+Tree cache unit tests
+Exercises versioning, invalidation and LRU eviction of serialized list trees
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from treecache import TreeCache  # noqa: E402
+
+
+class TestTreeCache:
+    """Test the serialized list-tree cache"""
+
+    def test_disabled_cache_stores_nothing(self):
+        """Test a disabled cache passes data through"""
+        cache = TreeCache(enabled=False)
+        assert cache.put(1, b'{}', cache.begin()) == b'{}'
+        assert cache.get(1) is None
+
+    def test_hit_after_put(self):
+        """Test a stored fragment is served until invalidated"""
+        cache = TreeCache(enabled=True)
+        cache.put(1, b'{"id":1}', cache.begin())
+        assert cache.get(1) == b'{"id":1}'
+        assert cache.hits == 1
+
+        cache.invalidate(1)
+        assert cache.get(1) is None
+        assert cache.bytes == 0
+
+    def test_invalidation_during_read_is_not_cached(self):
+        """Test a fragment built from rows read before an invalidation is dropped"""
+        cache = TreeCache(enabled=True)
+        started = cache.begin()
+        cache.invalidate(1)
+        cache.put(1, b'stale', started)
+        assert cache.get(1) is None
+
+        # A read that starts after the invalidation may be cached
+        cache.put(1, b'fresh', cache.begin())
+        assert cache.get(1) == b'fresh'
+
+    def test_invalidation_only_affects_given_lists(self):
+        """Test invalidating one list keeps the others cached"""
+        cache = TreeCache(enabled=True)
+        started = cache.begin()
+        cache.put(1, b'one', started)
+        cache.put(2, b'two', started)
+        cache.invalidate(1)
+        assert cache.get(1) is None
+        assert cache.get(2) == b'two'
+
+    def test_lru_eviction_respects_memory_budget(self):
+        """Test least recently used fragments are evicted past max_bytes"""
+        cache = TreeCache(enabled=True, max_bytes=10)
+        started = cache.begin()
+        cache.put(1, b'aaaa', started)
+        cache.put(2, b'bbbb', started)
+        cache.get(1)
+        cache.put(3, b'cccc', started)
+        assert cache.get(2) is None
+        assert cache.get(1) == b'aaaa'
+        assert cache.get(3) == b'cccc'
+        assert cache.bytes == 8
+        assert cache.evictions == 1
+
+    def test_variants_are_invalidated_together(self):
+        """Test every cached variant of a list is dropped on invalidation"""
+        cache = TreeCache(enabled=True)
+        started = cache.begin()
+        cache.put(1, b'full', started)
+        cache.put(1, b'elided', started, variant='omit')
+        assert cache.get(1) == b'full'
+        assert cache.get(1, variant='omit') == b'elided'
+
+        cache.invalidate(1)
+        assert cache.get(1) is None
+        assert cache.get(1, variant='omit') is None
+        assert cache.bytes == 0
+
+    def test_stamps_are_bounded(self):
+        """Test old stamps are dropped, and a read older than a dropped stamp is not cached"""
+        cache = TreeCache(enabled=True, max_stamps=2)
+        cache.put(1, b'one', cache.begin())
+        started = cache.begin()
+        for list_id in (2, 3, 4, 5):
+            cache.invalidate(list_id)
+        assert len(cache._stamps) == 2
+        assert cache.get(1) == b'one'
+
+        # List 2's stamp is gone, so it counts as invalidated at the newest dropped tick
+        cache.put(2, b'stale', started)
+        assert cache.get(2) is None
+        cache.put(2, b'fresh', cache.begin())
+        assert cache.get(2) == b'fresh'
@@ -0,0 +1,190 @@
+"""
+Tree index unit tests
+Exercises the array-backed list structure, write-through updates and the
+memory-bounded index store
+"""
+
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from treeindex import ListIndex, TreeIndexes  # noqa: E402
+
+# (id, parent_id, position, completed, collapsed), in sibling order:
+# 1 ─┬─ 2 ── 4
+#    └─ 3
+# 5 (collapsed) ── 6
+ROWS = [
+    (1, None, 0, False, False),
+    (5, None, 1, False, True),
+    (2, 1, 0, False, False),
+    (3, 1, 1, True, False),
+    (4, 2, 0, False, False),
+    (6, 5, 0, False, False),
+]
+
+
+def make_indexes(rows_by_list, max_bytes=1024 * 1024):
+    """TreeIndexes over fixed rows; `loads` counts loader calls"""
+    app = Flask(__name__)
+    app.config['TREE_INDEX_ENABLED'] = True
+    app.config['TREE_INDEX_MAX_BYTES'] = max_bytes
+    loaded = []
+
+    def loader(list_id):
+        loaded.append(list_id)
+        return rows_by_list[list_id]
+
+    return TreeIndexes(app, loader), loaded
+
+
+class TestListIndex:
+    """Test structural queries and write-through updates"""
+
+    def test_structure_queries(self):
+        """Test children, siblings, parent walks and pre-order walks"""
+        index = ListIndex(ROWS)
+        assert index.children() == [1, 5]
+        assert index.children(1) == [2, 3]
+        assert index.sibling(2, 1) == 3 and index.sibling(2, -1) is None
+        assert index.is_within(4, 1) and not index.is_within(1, 4)
+        assert index.subtree(1) == [1, 2, 4, 3]
+        assert list(index.walk([1, 5], depth=1)) == [(1, 0), (2, 1), (3, 1), (5, 0), (6, 1)]
+        # Stops at collapsed tasks and one level down, loading their children
+        assert index.visible([1, 5], elide_collapsed=True) == [1, 2, 4, 3, 5, 6]
+        assert index.visible([1], depth=0) == [1, 2, 3]
+
+    def test_write_through(self):
+        """Test adds, moves, reorders and removals keep sibling order"""
+        index = ListIndex(ROWS)
+        index.add(7, 1, 2)
+        assert index.children(1) == [2, 3, 7]
+        index.set_positions({7: 0, 2: 1, 3: 2})
+        assert index.children(1) == [7, 2, 3]
+        index.move(4, None, {1: 0, 4: 1, 5: 2})
+        assert index.children() == [1, 4, 5] and index.parent(4) is None
+        index.set_flags(5, collapsed=False)
+        assert index.visible([5], elide_collapsed=True) == [5, 6]
+        assert [row[0] for row in index.remove(1)] == [1, 7, 2, 3]
+        assert len(index) == 3 and 2 not in index
+        # Freed slots are reused
+        index.add(8, 4, 0)
+        assert index.children(4) == [8]
+        assert len(index.ids) == 7
+
+    def test_graft_between_lists(self):
+        """Test a subtree removed from one index is grafted into another"""
+        source = ListIndex(ROWS)
+        target = ListIndex([(10, None, 0, False, False)])
+        target.graft(source.remove(1), 10)
+        target.set_positions({1: 0})
+        assert target.subtree(10) == [10, 1, 2, 4, 3]
+        assert target.is_within(4, 10)
+        assert source.children() == [5]
+
+    def test_deep_chain(self):
+        """Test walks and parent checks on a chain deeper than the recursion limit"""
+        depth = 20000
+        index = ListIndex([(i, i - 1 if i else None, 0, False, False) for i in range(depth)])
+        assert index.is_within(depth - 1, 0)
+        assert index.subtree(0) == list(range(depth))
+
+
+class TestTreeIndexes:
+    """Test loading, write-through sections and eviction"""
+
+    def test_disabled(self):
+        """Test a disabled store neither loads nor locks"""
+        indexes = TreeIndexes()
+        assert indexes.index(1) is None
+        with indexes.writing(1) as section:
+            assert section.index(1) is None
+
+    def test_loaded_once(self):
+        """Test an index is loaded on first access and then reused"""
+        indexes, loaded = make_indexes({1: ROWS})
+        assert indexes.index(1) is indexes.index(1)
+        with indexes.reading(1) as index:
+            assert index.children() == [1, 5]
+        assert loaded == [1]
+        assert indexes.hits == 2
+
+    def test_sections_keep_only_applied_lists(self):
+        """Test lists not updated write-through are dropped, also on errors"""
+        indexes, loaded = make_indexes({1: ROWS, 2: ROWS, 3: ROWS})
+        with indexes.writing(1, 2, 3) as section:
+            section.index(1).add(7, None, 2)
+            section.applied(1)
+            section.index(2)
+            section.unchanged(3)
+        assert indexes.get(1).children() == [1, 5, 7]
+        assert indexes.get(2) is None
+        with pytest.raises(RuntimeError):
+            with indexes.writing(1) as section:
+                section.applied(1)
+                raise RuntimeError
+        assert indexes.get(1) is None
+
+    def test_pending_changes_block_reloads(self):
+        """Test an evicted list is not reloaded while applied changes are uncommitted"""
+        deferred = []
+        app = Flask(__name__)
+        app.config['TREE_INDEX_ENABLED'] = True
+        indexes = TreeIndexes(app, lambda list_id: ROWS,
+                              defer=lambda fn: lambda *ids: deferred.append((fn, ids)))
+        with indexes.writing(1) as section:
+            section.index(1)
+            section.applied(1)
+        indexes.invalidate(1)
+        indexes.index(1)
+        assert indexes.get(1) is None
+        for fn, ids in deferred:
+            fn(*ids)
+        indexes.index(1)
+        assert indexes.get(1) is not None
+
+    def test_lru_eviction_respects_memory_budget(self):
+        """Test least recently used indexes are evicted to fit the budget"""
+        size = ListIndex(ROWS).nbytes
+        indexes, loaded = make_indexes({1: ROWS, 2: ROWS, 3: ROWS}, max_bytes=size * 2)
+        indexes.index(1)
+        indexes.index(2)
+        indexes.index(1)
+        indexes.index(3)
+        assert indexes.get(2) is None
+        assert indexes.get(1) is not None and indexes.get(3) is not None
+        assert indexes.evictions == 1
+        assert indexes.bytes <= indexes.max_bytes
+
+    def test_stamps_and_locks_are_bounded(self):
+        """Test old stamps are dropped conservatively and idle locks of
+        unindexed lists are released"""
+        def loader(list_id):
+            if list_id == 1:
+                # Changes land while list 1 loads; its own stamp is pushed out
+                indexes.invalidate(1, 2, 3)
+            return ROWS
+
+        app = Flask(__name__)
+        app.config['TREE_INDEX_ENABLED'] = True
+        app.config['TREE_INDEX_MAX_STAMPS'] = 2
+        indexes = TreeIndexes(app, loader)
+        indexes.index(1)
+        assert len(indexes._stamps) == 2 and 1 not in indexes._stamps
+        assert indexes.get(1) is None
+        indexes.index(1)
+        assert indexes.get(1) is None
+        indexes.index(4)
+        assert indexes.get(4) is not None
+
+        with indexes.reading(5):
+            assert 5 in indexes._list_locks
+        with indexes.writing(1, 2) as section:
+            section.index(2)
+        assert set(indexes._list_locks) == {5}
+        indexes.invalidate(4, 5)
+        assert indexes._list_locks == {}
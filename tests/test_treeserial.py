@@ -0,0 +1,101 @@
+"""
+Tree serialization unit tests
+Exercises the recursion-free tree builder and JSON encoder on a throwaway
+Flask app
+"""
+
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask, jsonify, request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from treeserial import RawJSON, TreeJSONProvider, dumps, nest  # noqa: E402
+
+DEPTH = 20000
+
+
+def chain(length):
+    """Root of a chain of `length` nodes, each the only child of the last"""
+    nodes = [SimpleNamespace(id=i, collapsed=False, children=[]) for i in range(length)]
+    for parent, child in zip(nodes, nodes[1:]):
+        parent.children.append(child)
+    return nodes[0]
+
+
+def build(roots, **kwargs):
+    return nest(roots, lambda node: node.children, lambda node: {'id': node.id}, **kwargs)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.json = TreeJSONProvider(app)
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return jsonify(request.get_json())
+
+    return app
+
+
+class TestNest:
+    """Test building nested dicts with an explicit stack"""
+
+    def test_deep_chain(self):
+        """Test a chain far deeper than the recursion limit is nested in order"""
+        item, = build([chain(DEPTH)])
+        for expected in range(DEPTH):
+            assert item['id'] == expected
+            children = item['children']
+            item = children[0] if children else None
+        assert item is None
+
+    def test_depth_and_collapsed(self):
+        """Test depth limits and collapsed elision on a deep chain"""
+        root = chain(DEPTH)
+        item, = build([root], depth=2)
+        leaf = item['children'][0]['children'][0]
+        assert leaf['children'] == [] and leaf['child_count'] == 1
+        root.children[0].collapsed = True
+        item, = build([root], elide_collapsed=True)
+        assert item['children'][0]['children'] == []
+        assert item['children'][0]['has_children'] is True
+
+
+class TestDumps:
+    """Test encoding JSON at any depth"""
+
+    def test_matches_json_module(self):
+        """Test shallow documents encode exactly as with the json module"""
+        doc = {'b': [1, {'x': None, 'y': []}], 'a': {'t': (1, 2), 's': 'café'}}
+        for kwargs in ({}, {'sort_keys': True, 'separators': (',', ':')}):
+            assert dumps(doc, **kwargs) == json.dumps(doc, **kwargs)
+
+    def test_deep_tree(self, app):
+        """Test jsonify encodes a tree deeper than the recursion limit"""
+        tree = build([chain(DEPTH)])
+        with app.app_context():
+            body = jsonify(tree).get_data(as_text=True)
+        assert body.count('"children":[{') == DEPTH - 1
+        assert body.startswith('[{"id":0,"children":[{"id":1,')
+        assert body.rstrip().endswith('{"id":%d,"children":[]}' % (DEPTH - 1) + ']}' * (DEPTH - 1) + ']')
+
+    def test_raw_json_embedded(self, app):
+        """Test pre-encoded JSON is embedded without decoding it"""
+        raw = '[' * DEPTH + ']' * DEPTH
+        with app.app_context():
+            body = jsonify({'status': 'done', 'result': RawJSON(raw)}).get_data(as_text=True)
+        assert body.strip() == '{"status":"done","result":%s}' % raw
+
+    def test_too_deep_request_body(self, app):
+        """Test request bodies too deep to decode are rejected with a 400"""
+        client = app.test_client()
+        r = client.post('/echo', data='[' * DEPTH + ']' * DEPTH,
+                        content_type='application/json')
+        assert r.status_code == 400
+        assert client.post('/echo', json=[[1]]).get_json() == [[1]]
@@ -0,0 +1,141 @@
+"""
+Offline report of the slowest spans per route, from exported traces.
+
+Usage:
+    python trace_report.py                       # instance/traces.jsonl
+    python trace_report.py traces.jsonl.1 traces.jsonl --route move_task
+    python trace_report.py --top 5 --json
+
+Reads the JSON lines written by the tracer (tracing.py, TRACE_SAMPLE_RATE).
+For every route it prints request latency percentiles and, per span name,
+the span's count and self time (its duration minus that of its child
+spans, so nested spans are not counted twice), slowest first. SQL spans
+are broken down by statement shape; `(untraced)` is request time outside
+any span. The slowest single spans seen across
+all traces are listed last, with their trace ids.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def read_traces(paths):
+    """Yield traces from JSON lines files, skipping lines that do not parse"""
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def span_key(span):
+    """Group SQL spans by statement shape, other spans by name; time the
+    request spent outside any span shows as `(untraced)`"""
+    if span['parent'] is None:
+        return '(untraced)'
+    if span['name'] == 'db' and span.get('statement'):
+        return 'db: ' + span['statement']
+    return span['name']
+
+
+def aggregate(traces, route=None):
+    """Per-route latency and span self times, plus every span with its route"""
+    routes = {}
+    spans = []
+    for trace in traces:
+        if route and trace.get('route') != route:
+            continue
+        stats = routes.setdefault(trace.get('route'), {'durations': [], 'spans': {}})
+        stats['durations'].append(trace['duration_ms'])
+        child_time = {}
+        for span in trace['spans']:
+            if span['parent'] is not None:
+                child_time[span['parent']] = child_time.get(span['parent'], 0) + span['duration_ms']
+        for span in trace['spans']:
+            own = max(0.0, span['duration_ms'] - child_time.get(span['id'], 0))
+            entry = stats['spans'].setdefault(span_key(span), {'count': 0, 'self': [], 'max': 0.0})
+            entry['count'] += 1
+            entry['self'].append(own)
+            entry['max'] = max(entry['max'], span['duration_ms'])
+            spans.append((span['duration_ms'], trace.get('route'), trace['trace_id'], span))
+    return routes, spans
+
+
+def build_report(routes, spans, top):
+    report = {'routes': [], 'slowest_spans': []}
+    for name, stats in sorted(routes.items(), key=lambda item: -sum(item[1]['durations'])):
+        durations = stats['durations']
+        rows = []
+        for key, entry in stats['spans'].items():
+            total = sum(entry['self'])
+            rows.append({
+                'span': key,
+                'count': entry['count'],
+                'self_ms_total': round(total, 3),
+                'self_ms_per_request': round(total / len(durations), 3),
+                'self_ms_p95': round(percentile(entry['self'], 0.95), 3),
+                'max_ms': round(entry['max'], 3),
+            })
+        rows.sort(key=lambda row: -row['self_ms_total'])
+        report['routes'].append({
+            'route': name,
+            'requests': len(durations),
+            'p50_ms': round(percentile(durations, 0.5), 3),
+            'p95_ms': round(percentile(durations, 0.95), 3),
+            'max_ms': round(max(durations), 3),
+            'spans': rows[:top],
+        })
+    spans.sort(key=lambda item: -item[0])
+    for duration, route, trace_id, span in spans[:top]:
+        report['slowest_spans'].append({
+            'duration_ms': duration, 'route': route, 'trace_id': trace_id, 'span': span_key(span),
+        })
+    return report
+
+
+def print_report(report):
+    for route in report['routes']:
+        print(f"{route['route']}: {route['requests']} requests, "
+              f"p50 {route['p50_ms']} ms, p95 {route['p95_ms']} ms, max {route['max_ms']} ms")
+        for row in route['spans']:
+            print(f"  {row['self_ms_per_request']:>9.3f} ms/req  p95 {row['self_ms_p95']:>8.3f}  "
+                  f"x{row['count']:<6} {row['span'][:100]}")
+    if report['slowest_spans']:
+        print('\nSlowest spans:')
+        for row in report['slowest_spans']:
+            print(f"  {row['duration_ms']:>9.3f} ms  {row['route']}  {row['trace_id']}  "
+                  f"{row['span'][:100]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('paths', nargs='*', help='trace files (default instance/traces.jsonl)')
+    parser.add_argument('--route', help='only report this endpoint')
+    parser.add_argument('--top', type=int, default=10, help='spans to show per route')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    paths = args.paths or [os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                        'instance', 'traces.jsonl')]
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        sys.exit(f'No such trace file: {", ".join(missing)}')
+    report = build_report(*aggregate(read_traces(paths), args.route), args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
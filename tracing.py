@@ -0,0 +1,238 @@
+"""
+Lightweight request tracing with JSON lines export.
+
+Metrics aggregate; a trace shows where one request spent its time. With
+TRACE_SAMPLE_RATE > 0, that fraction of requests is traced. A trace holds
+a tree of timed spans:
+
+- the request itself, named after its endpoint;
+- spans opened in the app with `tracer.span(name)` or `@tracer.traced(name)`
+  (authentication, serialization, JSON encoding);
+- one `db` span per SQL statement, from SQLAlchemy cursor events.
+
+Nested spans with the same name (such as `to_dict` building a whole tree)
+are folded into the outermost one. The trace id comes from the incoming
+TRACE_HEADER (default `X-Trace-Id`) when it carries a valid id, so traces
+join up with the caller's, and is echoed on every response. Finished
+traces are appended as one JSON object per line to TRACE_EXPORT_PATH;
+`trace_report.py` aggregates them offline.
+
+Spans live in a context variable, so grouped mutations running on the
+group commit writer thread (in a copy of the request's context) still land
+in the request's trace. When tracing is disabled nothing is installed, and
+spans outside a traced request cost one context variable lookup.
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from querybudget import statement_shape
+
+_TRACE_ID = re.compile(r'^[0-9A-Za-z-]{8,64}$')
+_current = ContextVar('todo_trace_span', default=None)
+
+
+class Span:
+    """One timed operation within a trace"""
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'start', 'end', 'attrs')
+
+    def __init__(self, trace, name, parent_id, attrs):
+        self.trace = trace
+        self.span_id = os.urandom(4).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.attrs = attrs
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    def to_dict(self, origin):
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            'id': self.span_id,
+            'parent': self.parent_id,
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round((end - self.start) * 1000, 3),
+            **self.attrs,
+        }
+
+
+class Trace:
+    """The spans recorded for one request"""
+
+    __slots__ = ('trace_id', 'started_at', 'spans', 'max_spans', 'dropped', 'root')
+
+    def __init__(self, trace_id, max_spans):
+        self.trace_id = trace_id
+        self.started_at = datetime.utcnow()
+        self.spans = []
+        self.max_spans = max_spans
+        self.dropped = 0
+        self.root = None
+
+    def start_span(self, name, parent, attrs):
+        """Open a span under `parent`; None once the trace is full"""
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return None
+        span = Span(self, name, parent.span_id if parent is not None else None, attrs)
+        self.spans.append(span)
+        return span
+
+    def to_dict(self):
+        root = self.root
+        return {
+            'trace_id': self.trace_id,
+            'route': root.name,
+            'start': self.started_at.isoformat(),
+            'duration_ms': round((root.end - root.start) * 1000, 3),
+            **root.attrs,
+            'spans': [span.to_dict(root.start) for span in self.spans],
+            'dropped_spans': self.dropped,
+        }
+
+
+class JsonlExporter:
+    """Appends finished traces to a file, one JSON object per line"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, trace):
+        line = json.dumps(trace.to_dict(), default=str) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class Tracer:
+    """Flask extension recording sampled request traces"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.header = 'X-Trace-Id'
+        self.max_spans = 2000
+        self.exporter = None
+        self.exported = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Install request hooks and engine events when TRACE_SAMPLE_RATE > 0"""
+        self.sample_rate = app.config.get('TRACE_SAMPLE_RATE', 0.0)
+        if self.sample_rate <= 0:
+            return
+        self.enabled = True
+        self.header = app.config.get('TRACE_HEADER', self.header)
+        self.max_spans = app.config.get('TRACE_MAX_SPANS', self.max_spans)
+        self.exporter = JsonlExporter(
+            app.config.get('TRACE_EXPORT_PATH') or os.path.join(app.instance_path, 'traces.jsonl')
+        )
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # ---------- spans ----------
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time the block as a child of the current span, if a trace is running"""
+        parent = _current.get()
+        if parent is None or parent.name == name:
+            yield parent
+            return
+        span = parent.trace.start_span(name, parent, attrs)
+        if span is None:
+            yield None
+            return
+        token = _current.set(span)
+        try:
+            yield span
+        finally:
+            _current.reset(token)
+            span.finish()
+
+    def traced(self, name):
+        """Decorator timing each call of the function as a span"""
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if _current.get() is None:
+                    return f(*args, **kwargs)
+                with self.span(name):
+                    return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # ---------- request hooks ----------
+
+    def _before_request(self):
+        incoming = request.headers.get(self.header, '')
+        trace_id = incoming if _TRACE_ID.match(incoming) else os.urandom(16).hex()
+        request.environ['todo.trace_id'] = trace_id
+        if random.random() >= self.sample_rate:
+            return
+        trace = Trace(trace_id, self.max_spans)
+        trace.root = trace.start_span(request.endpoint or 'unmatched', None, {
+            'method': request.method,
+            'path': request.path,
+        })
+        request.environ['todo.trace'] = trace
+        request.environ['todo.trace_token'] = _current.set(trace.root)
+
+    def _after_request(self, response):
+        trace_id = request.environ.get('todo.trace_id')
+        if trace_id is not None:
+            response.headers[self.header] = trace_id
+        trace = request.environ.get('todo.trace')
+        if trace is not None:
+            trace.root.attrs['status'] = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        trace = request.environ.pop('todo.trace', None)
+        if trace is None:
+            return
+        _current.reset(request.environ.pop('todo.trace_token'))
+        trace.root.finish()
+        trace.root.attrs['user_id'] = getattr(request, 'current_user_id', None)
+        if exc is not None:
+            trace.root.attrs['error'] = type(exc).__name__
+        self.exporter.export(trace)
+        self.exported += 1
+
+    # ---------- SQL statements ----------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if parent is None or context is None:
+            return
+        context._trace_span = parent.trace.start_span(
+            'db', parent, {'statement': statement_shape(statement)[:300]}
+        )
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, '_trace_span', None)
+        if span is not None:
+            span.finish()
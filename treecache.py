@@ -0,0 +1,131 @@
+"""
+In-process cache of serialized list trees.
+
+`GET /api/lists` returns, for each list, exactly the same bytes until
+something in that list changes. TreeCache keeps those per-list JSON
+fragments in a size-bounded LRU so unchanged lists are not reloaded and
+re-serialized on every request.
+
+Versioning: every invalidation stamps the list with a new value of a global
+tick. A fragment is stored together with the list's stamp, and is only
+served while the stamp is unchanged. A request records the tick before it
+reads from the database (`begin`), and `put` refuses to cache a fragment
+for a list that was invalidated after that point, since the rows it was
+built from may predate the change. Only the most recent `max_stamps` stamps
+are kept; a list whose stamp was dropped counts as invalidated at the newest
+dropped tick, which at worst makes `put` skip caching for a request that
+was already in flight.
+
+A list can be cached in several variants (e.g. with collapsed subtrees
+left out); every variant shares the list's stamp, and invalidating the list
+drops them all.
+
+Mutating routes must call `invalidate` for every list they touch, after
+committing. The cache is per process; run it only with a single worker
+process, or leave it disabled.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class TreeCache:
+    """Size-bounded LRU of serialized list trees keyed by list id, variant and
+    version"""
+
+    def __init__(self, app=None, enabled=False, max_bytes=64 * 1024 * 1024, max_stamps=65536):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stamps = OrderedDict()
+        self._floor = 0
+        self._variants = {None}
+        self._tick = 0
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_stamps = max_stamps
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Load settings from the Flask config"""
+        self.enabled = app.config.get('TREE_CACHE_ENABLED', False)
+        self.max_bytes = app.config.get('TREE_CACHE_MAX_BYTES', self.max_bytes)
+        self.max_stamps = app.config.get('TREE_CACHE_MAX_STAMPS', self.max_stamps)
+
+    def begin(self):
+        """Return the current tick; call before reading anything from the database"""
+        return self._tick
+
+    def get(self, list_id, variant=None):
+        """Return the cached fragment for a list, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get((list_id, variant))
+            if entry is not None and entry[0] == self._stamps.get(list_id, entry[0]):
+                self._entries.move_to_end((list_id, variant))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, list_id, data, started, variant=None):
+        """Cache a freshly built fragment and return it.
+
+        `started` is the value of `begin()` from before the rows were read.
+        """
+        if not self.enabled or len(data) > self.max_bytes:
+            return data
+        with self._lock:
+            stamp = self._stamps.get(list_id, self._floor)
+            if stamp > started:
+                return data
+            old = self._entries.pop((list_id, variant), None)
+            if old is not None:
+                self.bytes -= len(old[1])
+            self._entries[(list_id, variant)] = (stamp, data)
+            self._variants.add(variant)
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+        return data
+
+    def invalidate(self, *list_ids):
+        """Drop the fragments of the given lists; call after committing"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._tick += 1
+            for list_id in list_ids:
+                self._stamps[list_id] = self._tick
+                self._stamps.move_to_end(list_id)
+                for variant in self._variants:
+                    old = self._entries.pop((list_id, variant), None)
+                    if old is not None:
+                        self.bytes -= len(old[1])
+            while len(self._stamps) > self.max_stamps:
+                _, self._floor = self._stamps.popitem(last=False)
+
+    def metrics_lines(self):
+        """Exposition lines for the /metrics endpoint"""
+        with self._lock:
+            entries = len(self._entries)
+        lines = []
+        for name, kind, help_text, value in (
+            ('todo_tree_cache_hits_total', 'counter', 'List tree cache hits.', self.hits),
+            ('todo_tree_cache_misses_total', 'counter', 'List tree cache misses.', self.misses),
+            ('todo_tree_cache_evictions_total', 'counter',
+             'List trees evicted to stay within the memory budget.', self.evictions),
+            ('todo_tree_cache_bytes', 'gauge', 'Bytes of serialized trees cached.', self.bytes),
+            ('todo_tree_cache_entries', 'gauge', 'List trees currently cached.', entries),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {value}')
+        return lines
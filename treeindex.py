@@ -0,0 +1,503 @@
+"""
+In-memory structural index of hot lists.
+
+Drag-heavy editing of a large list asks the same structural questions over
+and over: is the drop target inside the dragged subtree, which task comes
+before this one, which tasks make up this branch. With TREE_INDEX_ENABLED=1
+each list's structure is loaded once, on first access, into a ListIndex of
+compact parallel arrays:
+
+- id, parent slot, position and a flag byte (completed, collapsed) per task;
+- first child / next sibling slots, chaining every task's children in
+  sibling order (position, then id).
+
+Parent-pointer walks answer cycle checks in O(depth) instead of scanning
+the subtree, and sibling order and subtree enumeration need no SQL.
+
+Consistency: reads hold the list's lock (`TreeIndexes.reading`), and
+writes to a list go through `TreeIndexes.writing(list_id)`, which holds the
+list's lock from the moment the index is consulted until the change has
+been applied (write-through) or the index dropped. Routes that apply their
+change call `section.applied(list_id)`, and `section.unchanged` for lists
+left alone; every other list in the section is dropped on exit, and again after the commit (through `defer`) so indexes
+loaded mid-transaction are not kept. If the grouped operation or its group
+commit fails, every list in the section is dropped (through `on_failure`).
+Indexes loaded before a list was last changed, or while it has applied
+changes that are not committed yet, are never cached. Changes made without
+`writing` (bulk updates, jobs) call `invalidate` after committing; until
+then the index may still list deleted tasks or miss new ones, so callers
+treat ids missing from it as a reason to fall back to SQL.
+
+Indexes are evicted least recently used first to stay within
+TREE_INDEX_MAX_BYTES. Only the TREE_INDEX_MAX_STAMPS most recent change
+stamps are kept; a list whose stamp was dropped counts as changed at the
+newest dropped tick. A list's lock is dropped once nobody holds or waits
+for it and the list has no index and no uncommitted changes. The index is per process; run it only with a single
+worker process, or leave it disabled.
+"""
+
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+COMPLETED = 1
+COLLAPSED = 2
+_NONE = -1
+
+
+class ListIndex:
+    """Array-backed structure of one list's tasks"""
+
+    def __init__(self, rows=()):
+        """`rows` are (id, parent_id, position, completed, collapsed), in
+        sibling order (by position, then id)"""
+        self.ids = array('q')
+        self.parents = array('q')
+        self.positions = array('q')
+        self.flags = bytearray()
+        self.first_child = array('q')
+        self.next_sibling = array('q')
+        self.first_root = _NONE
+        self._slots = {}
+        self._free = []
+        rows = list(rows)
+        for row in rows:
+            self._allocate(row[0], row[2], row[3], row[4])
+        tails = {}
+        for task_id, parent_id, *_ in rows:
+            slot = self._slots[task_id]
+            parent = self._slots.get(parent_id, _NONE) if parent_id is not None else _NONE
+            self.parents[slot] = parent
+            tail = tails.get(parent)
+            if tail is None:
+                self._set_first(parent, slot)
+            else:
+                self.next_sibling[tail] = slot
+            tails[parent] = slot
+
+    # ---------- storage ----------
+
+    def _allocate(self, task_id, position, completed, collapsed):
+        flags = (COMPLETED if completed else 0) | (COLLAPSED if collapsed else 0)
+        if self._free:
+            slot = self._free.pop()
+            self.ids[slot], self.parents[slot], self.positions[slot] = task_id, _NONE, position
+            self.flags[slot] = flags
+            self.first_child[slot] = self.next_sibling[slot] = _NONE
+        else:
+            slot = len(self.ids)
+            self.ids.append(task_id)
+            self.parents.append(_NONE)
+            self.positions.append(position)
+            self.flags.append(flags)
+            self.first_child.append(_NONE)
+            self.next_sibling.append(_NONE)
+        self._slots[task_id] = slot
+        return slot
+
+    def _first(self, parent):
+        return self.first_root if parent == _NONE else self.first_child[parent]
+
+    def _set_first(self, parent, slot):
+        if parent == _NONE:
+            self.first_root = slot
+        else:
+            self.first_child[parent] = slot
+
+    def _chain(self, parent):
+        slot = self._first(parent)
+        while slot != _NONE:
+            yield slot
+            slot = self.next_sibling[slot]
+
+    def _relink(self, parent, slots):
+        """Chain `slots` under `parent` in sibling order"""
+        slots = sorted(slots, key=lambda s: (self.positions[s], self.ids[s]))
+        self._set_first(parent, slots[0] if slots else _NONE)
+        for slot, following in zip(slots, slots[1:] + [_NONE]):
+            self.parents[slot] = parent
+            self.next_sibling[slot] = following
+
+    def _parent_slot(self, parent_id):
+        return _NONE if parent_id is None else self._slots[parent_id]
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, task_id):
+        return task_id in self._slots
+
+    @property
+    def nbytes(self):
+        arrays = (self.ids, self.parents, self.positions, self.first_child, self.next_sibling)
+        return (sum(a.itemsize * len(a) for a in arrays) + len(self.flags)
+                + sys.getsizeof(self._slots) + sys.getsizeof(self._free))
+
+    # ---------- queries ----------
+
+    def position(self, task_id):
+        return self.positions[self._slots[task_id]]
+
+    def parent(self, task_id):
+        parent = self.parents[self._slots[task_id]]
+        return None if parent == _NONE else self.ids[parent]
+
+    def children(self, parent_id=None):
+        """Ids of a task's children (top-level tasks for None), in sibling order"""
+        return [self.ids[slot] for slot in self._chain(self._parent_slot(parent_id))]
+
+    def sibling(self, task_id, offset):
+        """Id of the sibling `offset` places away (-1: previous), or None"""
+        slot = self._slots[task_id]
+        siblings = list(self._chain(self.parents[slot]))
+        index = siblings.index(slot) + offset
+        return self.ids[siblings[index]] if 0 <= index < len(siblings) else None
+
+    def is_within(self, task_id, ancestor_id):
+        """Whether `task_id` is `ancestor_id` or one of its descendants, by a
+        parent-pointer walk"""
+        target = self._slots[ancestor_id]
+        slot = self._slots[task_id]
+        while slot != _NONE:
+            if slot == target:
+                return True
+            slot = self.parents[slot]
+        return False
+
+    def walk(self, root_ids, depth=None, elide_collapsed=False):
+        """Yield (id, level) for the roots and their descendants in pre-order,
+        stopping below `depth` and (with elide_collapsed) collapsed tasks"""
+        stack = [(self._slots[r], 0) for r in reversed(root_ids)]
+        while stack:
+            slot, level = stack.pop()
+            yield self.ids[slot], level
+            if level == depth or (elide_collapsed and self.flags[slot] & COLLAPSED):
+                continue
+            children = list(self._chain(slot))
+            stack.extend((child, level + 1) for child in reversed(children))
+
+    def subtree(self, task_id):
+        """Ids of a task and all its descendants, in pre-order"""
+        return [task_id for task_id, _ in self.walk([task_id])]
+
+    def visible(self, root_ids, depth=None, elide_collapsed=False):
+        """Ids needed to serialize the roots with these options: the walked
+        tasks plus the children of tasks where the walk stops, which only
+        count towards child_count"""
+        ids = []
+        for task_id, level in self.walk(root_ids, depth, elide_collapsed):
+            ids.append(task_id)
+            slot = self._slots[task_id]
+            if level == depth or (elide_collapsed and self.flags[slot] & COLLAPSED):
+                ids.extend(self.ids[child] for child in self._chain(slot))
+        return ids
+
+    # ---------- write-through ----------
+
+    def add(self, task_id, parent_id, position, completed=False, collapsed=False):
+        """Add a new task (as a leaf)"""
+        parent = self._parent_slot(parent_id)
+        slot = self._allocate(task_id, position, completed, collapsed)
+        self._relink(parent, list(self._chain(parent)) + [slot])
+
+    def set_flags(self, task_id, completed=None, collapsed=None):
+        slot = self._slots[task_id]
+        for flag, value in ((COMPLETED, completed), (COLLAPSED, collapsed)):
+            if value is not None:
+                self.flags[slot] = (self.flags[slot] | flag) if value else (self.flags[slot] & ~flag)
+
+    def set_positions(self, positions):
+        """Apply {task id: position} and restore sibling order"""
+        parents = set()
+        for task_id, position in positions.items():
+            slot = self._slots[task_id]
+            self.positions[slot] = position
+            parents.add(self.parents[slot])
+        for parent in parents:
+            self._relink(parent, list(self._chain(parent)))
+
+    def move(self, task_id, parent_id, positions):
+        """Re-parent a task (same list), then apply {task id: position}"""
+        slot = self._slots[task_id]
+        old_parent = self.parents[slot]
+        self._relink(old_parent, [s for s in self._chain(old_parent) if s != slot])
+        new_parent = self._parent_slot(parent_id)
+        self._relink(new_parent, list(self._chain(new_parent)) + [slot])
+        self.set_positions(positions)
+
+    def remove(self, task_id):
+        """Remove a task and its whole subtree; returns their rows (as passed
+        to the constructor) in pre-order, ready for `graft`"""
+        rows = [(self.ids[slot], self.parent(self.ids[slot]), self.positions[slot],
+                 bool(self.flags[slot] & COMPLETED), bool(self.flags[slot] & COLLAPSED))
+                for slot in (self._slots[i] for i in self.subtree(task_id))]
+        slot = self._slots[task_id]
+        parent = self.parents[slot]
+        self._relink(parent, [s for s in self._chain(parent) if s != slot])
+        for row in rows:
+            freed = self._slots.pop(row[0])
+            self.ids[freed] = _NONE
+            self._free.append(freed)
+        return rows
+
+    def graft(self, rows, parent_id):
+        """Add a subtree removed from another list under `parent_id`; the
+        first row is its root"""
+        (root_id, _, *root), *rest = rows
+        self.add(root_id, parent_id, *root)
+        for task_id, child_parent_id, *row in rest:
+            self.add(task_id, child_parent_id, *row)
+
+
+class _Section:
+    """Lists being written by one `TreeIndexes.writing` block"""
+
+    def __init__(self, indexes, list_ids):
+        self.indexes = indexes
+        self.list_ids = list_ids
+        self.changed = set()
+        self.kept = set()
+
+    def index(self, list_id, load=True):
+        """The list's index, or None when disabled (or, with load=False,
+        when it is not in memory)"""
+        if not load:
+            return self.indexes.get(list_id) if self.indexes.enabled else None
+        return self.indexes.index(list_id)
+
+    def applied(self, list_id):
+        """Mark the list as updated write-through, so it is kept"""
+        self.changed.add(list_id)
+
+    def unchanged(self, *list_ids):
+        """Mark lists the block leaves as they were, so they are kept"""
+        self.kept.update(list_ids)
+
+
+class TreeIndexes:
+    """Size-bounded LRU of ListIndex objects keyed by list id"""
+
+    def __init__(self, app=None, loader=None, defer=None, on_failure=None, uncounted=None):
+        self._lock = threading.Lock()
+        self._list_locks = {}
+        self._entries = OrderedDict()
+        self._stamps = OrderedDict()
+        self._floor = 0
+        self._pending = {}
+        self._tick = 0
+        self.enabled = False
+        self.max_bytes = 32 * 1024 * 1024
+        self.max_stamps = 65536
+        self.bytes = 0
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app, loader, defer, on_failure, uncounted)
+
+    def init_app(self, app, loader, defer=None, on_failure=None, uncounted=None):
+        """Load settings from the Flask config.
+
+        `loader(list_id)` returns the list's rows (see ListIndex). Calls
+        wrapped by `defer` run after the current operation commits, and calls
+        wrapped by `on_failure` run if it fails. `uncounted` is a context
+        manager hiding index loads from the query budgets.
+        """
+        self.enabled = app.config.get('TREE_INDEX_ENABLED', False)
+        self.max_bytes = app.config.get('TREE_INDEX_MAX_BYTES', self.max_bytes)
+        self.max_stamps = app.config.get('TREE_INDEX_MAX_STAMPS', self.max_stamps)
+        self._loader = loader
+        defer = defer or (lambda fn: fn)
+        self._drop_after_commit = defer(self._drop)
+        self._settle_after_commit = defer(self._settle)
+        on_failure = on_failure or (lambda fn: lambda *ids: None)
+        self._drop_on_failure = on_failure(self._drop)
+        self._settle_on_failure = on_failure(self._settle)
+        self._uncounted = uncounted or nullcontext
+
+    # ---------- reading ----------
+
+    def get(self, list_id):
+        """The list's index if it is loaded, else None"""
+        with self._lock:
+            entry = self._entries.get(list_id)
+            if entry is not None:
+                self._entries.move_to_end(list_id)
+                self.hits += 1
+            return entry
+
+    def index(self, list_id):
+        """The list's index, loading it on first access; None when disabled"""
+        if not self.enabled:
+            return None
+        entry = self.get(list_id)
+        if entry is not None:
+            return entry
+        started = self._tick
+        with self._uncounted():
+            entry = ListIndex(self._loader(list_id))
+        with self._lock:
+            self.loads += 1
+            # Not if the list changed since, or has changes not yet committed
+            if self._stamps.get(list_id, self._floor) <= started \
+                    and not self._pending.get(list_id):
+                self._store(list_id, entry)
+        return entry
+
+    def _store(self, list_id, entry):
+        old = self._entries.pop(list_id, None)
+        if old is not None:
+            self.bytes -= old.nbytes
+        size = entry.nbytes
+        if size > self.max_bytes:
+            return
+        self._entries[list_id] = entry
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            evicted_id, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+            self._prune_lock(evicted_id)
+
+    def _stamp(self, list_id):
+        self._stamps[list_id] = self._tick
+        self._stamps.move_to_end(list_id)
+        while len(self._stamps) > self.max_stamps:
+            _, self._floor = self._stamps.popitem(last=False)
+
+    def _locks(self, list_ids):
+        """The lists' locks, counted as in use until `_unlock`"""
+        with self._lock:
+            locks = []
+            for list_id in list_ids:
+                slot = self._list_locks.setdefault(list_id, [threading.RLock(), 0])
+                slot[1] += 1
+                locks.append(slot[0])
+            return locks
+
+    def _unlock(self, list_ids):
+        with self._lock:
+            for list_id in list_ids:
+                self._list_locks[list_id][1] -= 1
+                self._prune_lock(list_id)
+
+    def _prune_lock(self, list_id):
+        # Only once nobody holds or waits for it, so no two locks coexist
+        slot = self._list_locks.get(list_id)
+        if slot is not None and not slot[1] and list_id not in self._entries \
+                and not self._pending.get(list_id):
+            del self._list_locks[list_id]
+
+    @contextmanager
+    def reading(self, list_id):
+        """The list's index (loaded if needed; None when disabled), with the
+        list locked against write-through changes while the block runs"""
+        if not self.enabled:
+            yield None
+            return
+        lock, = self._locks([list_id])
+        try:
+            with lock:
+                yield self.index(list_id)
+        finally:
+            self._unlock([list_id])
+
+    # ---------- writing ----------
+
+    @contextmanager
+    def writing(self, *list_ids):
+        """Hold the lists' locks while changing them.
+
+        Lists not marked with `applied` (all of them, on an exception) are
+        dropped on exit and once more after the commit. Until the commit,
+        applied lists are not reloaded from the database if evicted.
+        """
+        list_ids = sorted({i for i in list_ids if i is not None})
+        section = _Section(self, list_ids)
+        if not self.enabled:
+            yield section
+            return
+        locks = self._locks(list_ids)
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield section
+        except BaseException:
+            section.changed.clear()
+            section.kept.clear()
+            raise
+        finally:
+            stale = [i for i in list_ids if i not in section.changed | section.kept]
+            if stale:
+                self._drop(*stale)
+                self._drop_after_commit(*stale)
+            if section.changed:
+                self._applied(section.changed)
+            # Loads inside a grouped operation may see other operations'
+            # uncommitted changes, so drop every list if the group fails
+            self._drop_on_failure(*list_ids)
+            for lock in reversed(locks):
+                lock.release()
+            self._unlock(list_ids)
+
+    def _applied(self, list_ids):
+        with self._lock:
+            self._tick += 1
+            for list_id in list_ids:
+                self._stamp(list_id)
+                self._pending[list_id] = self._pending.get(list_id, 0) + 1
+                entry = self._entries.get(list_id)
+                if entry is not None:
+                    self._store(list_id, entry)
+        self._settle_after_commit(*list_ids)
+        self._settle_on_failure(*list_ids)
+
+    def _settle(self, *list_ids):
+        with self._lock:
+            for list_id in list_ids:
+                count = self._pending.pop(list_id, 0) - 1
+                if count > 0:
+                    self._pending[list_id] = count
+                self._prune_lock(list_id)
+
+    def _drop(self, *list_ids):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._tick += 1
+            for list_id in list_ids:
+                self._stamp(list_id)
+                old = self._entries.pop(list_id, None)
+                if old is not None:
+                    self.bytes -= old.nbytes
+                self._prune_lock(list_id)
+
+    def invalidate(self, *list_ids):
+        """Drop the lists' indexes; call after committing changes made
+        without `writing`"""
+        self._drop(*list_ids)
+
+    def metrics_lines(self):
+        """Exposition lines for the /metrics endpoint"""
+        with self._lock:
+            entries = len(self._entries)
+            tasks = sum(len(entry) for entry in self._entries.values())
+        lines = []
+        for name, kind, help_text, value in (
+            ('todo_tree_index_hits_total', 'counter', 'Tree index lookups served from memory.',
+             self.hits),
+            ('todo_tree_index_loads_total', 'counter', 'Tree indexes loaded from the database.',
+             self.loads),
+            ('todo_tree_index_evictions_total', 'counter',
+             'Tree indexes evicted to stay within the memory budget.', self.evictions),
+            ('todo_tree_index_bytes', 'gauge', 'Approximate memory used by tree indexes.',
+             self.bytes),
+            ('todo_tree_index_lists', 'gauge', 'Lists currently indexed.', entries),
+            ('todo_tree_index_tasks', 'gauge', 'Tasks held in tree indexes.', tasks),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {value}')
+        return lines
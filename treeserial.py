@@ -0,0 +1,145 @@
+"""
+Recursion-free building and JSON encoding of task trees.
+
+Outlines can nest tens of thousands of levels deep. Building nested dicts
+with one call per level runs into Python's recursion limit after about a
+thousand levels, and the C JSON encoder and decoder give up at around half
+that (every level is an object plus a `children` array). Here both steps
+keep their own stack instead:
+
+- `nest` builds the nested dicts of a tree in pre-order, for any node type,
+  given how to find a node's children and how to turn one node into a dict;
+- `dumps` hands documents to the C encoder as usual and, if that runs out
+  of recursion depth, encodes them iteratively instead. The walk still
+  encodes each dict's scalar fields with the C encoder in one call and only
+  visits containers itself, so deep documents cost about four times as
+  much CPU as shallow ones, linear in their size;
+- `RawJSON` wraps text that is already JSON (such as a stored job result)
+  so it is embedded as is, without decoding it first.
+
+`TreeJSONProvider` makes `jsonify` and `app.json.dumps` use `dumps`:
+
+    app.json = TreeJSONProvider(app)
+"""
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+
+class RawJSON:
+    """Text that is already encoded JSON, embedded verbatim by `dumps`"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+_CONTAINERS = (dict, list, tuple, RawJSON)
+
+
+def nest(roots, children_of, to_item, elide_collapsed=False, depth=None):
+    """Nested dicts for `roots` and their descendants, children under `children`.
+
+    `children_of(node)` returns a node's children in order and `to_item(node)`
+    its dict without children. Children of tasks `depth` levels down and,
+    with elide_collapsed, of collapsed tasks are left out; in either mode
+    every item also gets `child_count` and `has_children`.
+    """
+    summarize = elide_collapsed or depth is not None
+    result = []
+    stack = [(node, 0, result) for node in reversed(roots)]
+    while stack:
+        node, level, siblings = stack.pop()
+        item = to_item(node)
+        children = children_of(node)
+        if summarize:
+            item['child_count'] = len(children)
+            item['has_children'] = bool(children)
+        item['children'] = []
+        siblings.append(item)
+        if level == depth or (elide_collapsed and node.collapsed):
+            continue
+        stack.extend((child, level + 1, item['children']) for child in reversed(children))
+    return result
+
+
+def dumps(obj, *, default=None, sort_keys=False, ensure_ascii=True, separators=None, **kwargs):
+    """Encode `obj` as JSON at any nesting depth.
+
+    Accepts the keyword arguments of `json.dumps` that Flask passes; output
+    is always on one line (`indent` is ignored). In walked documents,
+    sort_keys sorts a dict's scalar fields and its nested fields separately,
+    nested fields last, and non-string keys are converted with str().
+    """
+    item_sep, key_sep = separators or (', ', ': ')
+    scalar = json.JSONEncoder(default=default, sort_keys=sort_keys, ensure_ascii=ensure_ascii,
+                              separators=(item_sep, key_sep)).encode
+    try:
+        return scalar(obj)
+    except (RecursionError, TypeError):
+        # Too deep, or holds RawJSON: walk it with an explicit stack
+        pass
+
+    def dict_items(nested, first):
+        for key, child in nested:
+            yield ('' if first else item_sep) + scalar(str(key)) + key_sep, child
+            first = False
+
+    def list_items(value):
+        prefix = ''
+        for child in value:
+            yield prefix, child
+            prefix = item_sep
+
+    parts = []
+    stack = [(iter([('', obj)]), '')]
+    while stack:
+        items, closer = stack[-1]
+        for prefix, value in items:
+            parts.append(prefix)
+            if isinstance(value, RawJSON):
+                parts.append(value.text)
+            elif isinstance(value, dict):
+                nested = [(k, v) for k, v in value.items() if isinstance(v, _CONTAINERS)]
+                if not nested:
+                    parts.append(scalar(value))
+                    continue
+                if sort_keys:
+                    nested.sort(key=lambda kv: str(kv[0]))
+                plain = {k: v for k, v in value.items() if not isinstance(v, _CONTAINERS)}
+                parts.append(scalar(plain)[:-1])
+                stack.append((dict_items(nested, not plain), '}'))
+                break
+            elif isinstance(value, (list, tuple)):
+                if not any(isinstance(v, _CONTAINERS) for v in value):
+                    parts.append(scalar(value))
+                    continue
+                parts.append('[')
+                stack.append((list_items(value), ']'))
+                break
+            else:
+                parts.append(scalar(value))
+        else:
+            stack.pop()
+            parts.append(closer)
+    return ''.join(parts)
+
+
+class TreeJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes arbitrarily deep trees"""
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault('default', self.default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        # The C decoder recurses per level; report documents nested too
+        # deeply as invalid JSON (a 400 for request bodies), not a crash
+        try:
+            return json.loads(s, **kwargs)
+        except RecursionError:
+            raise ValueError('JSON document is nested too deeply') from None